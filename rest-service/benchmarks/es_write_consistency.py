@@ -0,0 +1,132 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Measure node instance write throughput of the elasticsearch storage manager
+for each write visibility mode.
+
+For every mode, node instances are created one by one, then each of them is
+updated (as agents do when reporting a state change), and finally all of
+them are listed, verifying the writes are visible to searches.
+
+The benchmark uses its own index, which is deleted when it's done:
+
+    python benchmarks/es_write_consistency.py --host localhost --port 9200
+"""
+
+import argparse
+import time
+
+from manager_rest import config
+from manager_rest import es_storage_manager
+from manager_rest import manager_elasticsearch
+from manager_rest.models import DeploymentNodeInstance
+
+BENCHMARK_INDEX_NAME = 'cloudify_write_visibility_benchmark'
+DEPLOYMENT_ID = 'benchmark-deployment'
+
+
+def _node_instance(index, state='uninitialized', version=None):
+    return DeploymentNodeInstance(id='node_{0}'.format(index),
+                                  node_id='node',
+                                  host_id=None,
+                                  relationships=[],
+                                  deployment_id=DEPLOYMENT_ID,
+                                  state=state,
+                                  runtime_properties={},
+                                  version=version)
+
+
+def _timed(func, count):
+    start = time.time()
+    for i in range(count):
+        func(i)
+    duration = time.time() - start
+    return count / duration if duration else float('inf')
+
+
+def run_mode(sm, client, mode, instances, refresh_interval):
+    config.instance().db_write_visibility = mode
+    if client.indices.exists(index=BENCHMARK_INDEX_NAME):
+        client.indices.delete(index=BENCHMARK_INDEX_NAME)
+    client.indices.create(index=BENCHMARK_INDEX_NAME, body={
+        'settings': {
+            'number_of_shards': 1,
+            'number_of_replicas': 0,
+            'refresh_interval': refresh_interval
+        }
+    })
+    try:
+        creates = _timed(lambda i: sm.put_node_instance(_node_instance(i)),
+                         instances)
+        # version 0 skips the version check, isolating the write cost
+        updates = _timed(
+            lambda i: sm.update_node_instance(
+                _node_instance(i, state='started', version=0)),
+            instances)
+        start = time.time()
+        listed = sm.get_node_instances(
+            filters={'deployment_id': DEPLOYMENT_ID},
+            include=['id', 'state']).items
+        list_latency = time.time() - start
+        visible = len([instance for instance in listed
+                       if instance.state == 'started'])
+    finally:
+        client.indices.delete(index=BENCHMARK_INDEX_NAME)
+    return {
+        'mode': mode,
+        'creates_per_second': creates,
+        'updates_per_second': updates,
+        'list_latency_ms': list_latency * 1000,
+        'visible_updates': visible
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--instances', type=int, default=1000,
+                        help='number of node instances to write per mode')
+    parser.add_argument('--refresh-interval', default='1s',
+                        help='index refresh interval, used by the periodic '
+                             'mode')
+    parser.add_argument('--modes', nargs='+',
+                        default=es_storage_manager.WRITE_VISIBILITY_MODES,
+                        choices=es_storage_manager.WRITE_VISIBILITY_MODES)
+    args = parser.parse_args()
+
+    config.instance().db_address = args.host
+    config.instance().db_port = args.port
+    es_storage_manager.STORAGE_INDEX_NAME = BENCHMARK_INDEX_NAME
+    sm = es_storage_manager.create()
+    client = manager_elasticsearch.get_client()
+
+    row = '{0:<18}{1:>14}{2:>14}{3:>16}{4:>10}'
+    print row.format('mode', 'creates/s', 'updates/s', 'list [ms]',
+                     'visible')
+    for mode in args.modes:
+        result = run_mode(sm, client, mode, args.instances,
+                          args.refresh_interval)
+        print row.format(result['mode'],
+                         '{0:.1f}'.format(result['creates_per_second']),
+                         '{0:.1f}'.format(result['updates_per_second']),
+                         '{0:.1f}'.format(result['list_latency_ms']),
+                         '{0}/{1}'.format(result['visible_updates'],
+                                          args.instances))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Measure node instance list latency of the file storage manager.
+
+Node instances are spread over deployments, and typical list queries are
+timed against them: a deployment's instances, a page of a sorted list and
+an unindexed filter over all instances:
+
+    python benchmarks/file_storage_query.py --instances 100000
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+
+from manager_rest.file_storage_manager import FileStorageManager
+from manager_rest.models import DeploymentNodeInstance
+
+QUERIES = OrderedDict([
+    ('deployment filter', {'filters': {'deployment_id': ['dep_7']}}),
+    ('deployment and node filter', {'filters': {'deployment_id': ['dep_7'],
+                                                'node_id': ['node_7']}}),
+    ('sorted first page', {'sort': OrderedDict([('deployment_id', 'asc'),
+                                                ('id', 'desc')]),
+                           'pagination': {'offset': 0, 'size': 20}}),
+    ('unindexed filter', {'filters': {'state': ['deleted']}})
+])
+
+
+def _node_instance(index, deployments, nodes):
+    return DeploymentNodeInstance(
+        id='node_instance_{0}'.format(index),
+        node_id='node_{0}'.format(index % nodes),
+        host_id=None,
+        relationships=[],
+        deployment_id='dep_{0}'.format(index % deployments),
+        state='started',
+        runtime_properties={},
+        version=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--instances', type=int, default=100000)
+    parser.add_argument('--deployments', type=int, default=1000)
+    parser.add_argument('--nodes', type=int, default=10,
+                        help='number of nodes per deployment')
+    parser.add_argument('--repeat', type=int, default=100,
+                        help='number of times each query is timed')
+    args = parser.parse_args()
+
+    storage_dir = tempfile.mkdtemp()
+    try:
+        sm = FileStorageManager(os.path.join(storage_dir, 'storage.json'))
+        sm.put_node_instances_bulk(
+            _node_instance(i, args.deployments, args.nodes)
+            for i in range(args.instances))
+
+        row = '{0:<30}{1:>10}{2:>16}'
+        print row.format('query', 'results', 'latency [us]')
+        for name, query in QUERIES.iteritems():
+            start = time.time()
+            for _ in range(args.repeat):
+                result = sm.get_node_instances(**query)
+            latency = (time.time() - start) / args.repeat
+            print row.format(name,
+                             len(result.items),
+                             '{0:.1f}'.format(latency * 1000000))
+    finally:
+        shutil.rmtree(storage_dir)
+
+
+if __name__ == '__main__':
+    main()
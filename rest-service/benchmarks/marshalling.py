@@ -0,0 +1,144 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Compare the marshalling time of list responses by the generic flask-restful
+marshalling and by the compiled serializers.
+
+Every response class is marshalled with all its fields, and with a small
+"_include" set:
+
+    python benchmarks/marshalling.py --items 10000
+"""
+
+import argparse
+import time
+
+from manager_rest import marshalling
+from manager_rest import models
+from manager_rest import responses_v2
+
+WORKFLOWS = {name: {'operation': 'default_workflows.{0}'.format(name),
+                    'plugin': 'default_workflows',
+                    'parameters': {}}
+             for name in ('install', 'uninstall', 'scale', 'heal')}
+
+
+def _node_instance(index):
+    return models.DeploymentNodeInstance(
+        id='node_{0}'.format(index),
+        node_id='node',
+        host_id='host_{0}'.format(index),
+        relationships=[{'target_id': 'host_{0}'.format(index),
+                        'target_name': 'host',
+                        'type': 'cloudify.relationships.contained_in'}],
+        deployment_id='deployment',
+        state='started',
+        runtime_properties={'ip': '10.0.0.{0}'.format(index % 256)},
+        version=index)
+
+
+def _node(index):
+    return models.DeploymentNode(
+        id='node_{0}'.format(index),
+        deployment_id='deployment',
+        blueprint_id='blueprint',
+        type='cloudify.nodes.Compute',
+        type_hierarchy=['cloudify.nodes.Root', 'cloudify.nodes.Compute'],
+        number_of_instances=1,
+        planned_number_of_instances=1,
+        deploy_number_of_instances=1,
+        host_id='node_{0}'.format(index),
+        properties={'ip': '10.0.0.{0}'.format(index % 256)},
+        operations={'cloudify.interfaces.lifecycle.start': {}},
+        plugins=[],
+        plugins_to_install=None,
+        relationships=[])
+
+
+def _deployment(index):
+    return models.Deployment(
+        id='deployment_{0}'.format(index),
+        blueprint_id='blueprint',
+        created_at='2015-01-01 00:00:00',
+        updated_at='2015-01-01 00:00:00',
+        workflows=WORKFLOWS,
+        inputs={'index': index},
+        policy_types={},
+        policy_triggers={},
+        groups={},
+        outputs={})
+
+
+def _execution(index):
+    return models.Execution(
+        id='execution_{0}'.format(index),
+        status='terminated',
+        deployment_id='deployment',
+        workflow_id='install',
+        blueprint_id='blueprint',
+        created_at='2015-01-01 00:00:00',
+        error='',
+        parameters={},
+        is_system_workflow=False)
+
+
+CASES = [
+    (responses_v2.NodeInstance, _node_instance, ['id', 'state']),
+    (responses_v2.Node, _node, ['id', 'number_of_instances']),
+    (responses_v2.Deployment, _deployment, ['id', 'blueprint_id']),
+    (responses_v2.Execution, _execution, ['id', 'status'])
+]
+
+
+def _best_time(serialize, items, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.time()
+        serialize(items)
+        durations.append(time.time() - start)
+    return min(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--items', type=int, default=10000,
+                        help='number of items per list')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs per measurement, the fastest '
+                             'one is reported')
+    args = parser.parse_args()
+
+    row = '{0:<16}{1:>10}{2:>14}{3:>15}{4:>10}'
+    print row.format('response', 'fields', 'generic [ms]', 'compiled [ms]',
+                     'speedup')
+    for response_class, make_item, include in CASES:
+        items = [make_item(index) for index in range(args.items)]
+        for field_names in (list(response_class.resource_fields), include):
+            generic = _best_time(
+                marshalling.generic_serializer(response_class, field_names),
+                items, args.repeat)
+            compiled = _best_time(
+                marshalling.get_serializer(response_class, field_names),
+                items, args.repeat)
+            print row.format(response_class.__name__,
+                             len(field_names),
+                             '{0:.1f}'.format(generic * 1000),
+                             '{0:.1f}'.format(compiled * 1000),
+                             '{0:.1f}x'.format(generic / compiled))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Run the same workload against every storage manager implementation.
+
+A synthetic topology is loaded into each storage manager, then typical
+manager operations are run against random deployments of it, and finally
+some deployments are deleted. The p50/p99 latency and throughput of every
+operation are printed and saved as JSON; passing the JSON of a previous run
+as a baseline prints the change in p50 latency next to every operation:
+
+    python -m benchmarks.storage --deployments 10000 --nodes 10 \\
+        --instances-per-node 10 --output results.json
+    python -m benchmarks.storage --baseline results.json
+
+Backends which can't be used (elasticsearch which isn't running locally,
+for example) are skipped.
+"""
+
+import argparse
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.storage import backends
+from benchmarks.storage import workload
+from benchmarks.storage.topology import Topology
+
+
+def run_backend(name, topology, args):
+    storage_dir = tempfile.mkdtemp()
+    try:
+        sm, cleanup = backends.create(name, storage_dir, args)
+        try:
+            recorder = workload.Recorder()
+            workload.load(sm, topology, recorder)
+            workload.run(sm, topology, recorder, args.samples,
+                         random.Random(args.seed))
+            workload.delete(sm, topology, recorder, args.deletes)
+            return recorder.results()
+        finally:
+            cleanup()
+    finally:
+        shutil.rmtree(storage_dir)
+
+
+def print_results(name, results, baseline):
+    print '\n{0}'.format(name)
+    row = '{0:<32}{1:>10}{2:>12}{3:>12}{4:>14}{5:>10}'
+    print row.format('operation', 'calls', 'p50 [ms]', 'p99 [ms]',
+                     'items/s', 'p50 diff')
+    for operation in sorted(results):
+        result = results[operation]
+        diff = ''
+        baseline_result = baseline.get(operation)
+        if baseline_result and baseline_result['p50_ms']:
+            diff = '{0:+.0%}'.format(
+                result['p50_ms'] / baseline_result['p50_ms'] - 1)
+        print row.format(operation,
+                         result['calls'],
+                         '{0:.3f}'.format(result['p50_ms']),
+                         '{0:.3f}'.format(result['p99_ms']),
+                         '{0:.0f}'.format(result['items_per_second'] or 0),
+                         diff)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--backends', nargs='+',
+                        default=list(backends.BACKENDS),
+                        choices=list(backends.BACKENDS))
+    parser.add_argument('--blueprints', type=int, default=10)
+    parser.add_argument('--deployments', type=int, default=100)
+    parser.add_argument('--nodes', type=int, default=10,
+                        help='number of nodes per deployment')
+    parser.add_argument('--instances-per-node', type=int, default=10)
+    parser.add_argument('--executions', type=int, default=5,
+                        help='number of executions per deployment')
+    parser.add_argument('--modifications', type=int, default=1,
+                        help='number of modifications per deployment')
+    parser.add_argument('--samples', type=int, default=1000,
+                        help='number of times the operations are run')
+    parser.add_argument('--deletes', type=int, default=10,
+                        help='number of deployments deleted at the end')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--es-host', default='localhost')
+    parser.add_argument('--es-port', type=int, default=9200)
+    parser.add_argument('--output', default='storage_benchmark.json',
+                        help='file the results are saved to')
+    parser.add_argument('--baseline',
+                        help='results of a previous run to compare with')
+    args = parser.parse_args()
+
+    topology = Topology(blueprints=args.blueprints,
+                        deployments=args.deployments,
+                        nodes=args.nodes,
+                        instances_per_node=args.instances_per_node,
+                        executions_per_deployment=args.executions,
+                        modifications_per_deployment=args.modifications)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['backends']
+
+    report = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'topology': topology.to_dict(),
+        'samples': args.samples,
+        'deletes': args.deletes,
+        'seed': args.seed,
+        'backends': {}
+    }
+    for name in args.backends:
+        try:
+            results = run_backend(name, topology, args)
+        except backends.BackendUnavailableError as e:
+            print >> sys.stderr, 'Skipping {0}: {1}'.format(name, e)
+            continue
+        report['backends'][name] = results
+        print_results(name, results, baseline.get(name, {}))
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
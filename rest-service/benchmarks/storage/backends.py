@@ -0,0 +1,106 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+The storage managers the benchmark runs against.
+
+Every backend is created empty, in its own storage, and returns a cleanup
+function along with the storage manager.
+"""
+
+import imp
+import os
+from collections import OrderedDict
+
+from manager_rest import config
+from manager_rest import es_storage_manager
+from manager_rest import manager_elasticsearch
+from manager_rest.file_storage_manager import FileStorageManager
+from manager_rest.sqlite_storage_manager import SQLiteStorageManager
+
+BENCHMARK_INDEX_NAME = 'cloudify_storage_benchmark'
+
+# the storage index settings and mappings the manager's elasticsearch is
+# set up with, as used by the integration tests
+ES_SCHEMA_CREATOR_PATH = os.path.join(os.path.dirname(__file__), '..', '..',
+                                      '..', 'tests', 'testenv',
+                                      'es_schema_creator.py')
+
+
+class BackendUnavailableError(Exception):
+    pass
+
+
+def _file(storage_dir, args):
+    return (FileStorageManager(os.path.join(storage_dir, 'storage.json')),
+            lambda: None)
+
+
+def _sqlite(storage_dir, args):
+    return (SQLiteStorageManager(os.path.join(storage_dir, 'storage.db')),
+            lambda: None)
+
+
+def _storage_index_body():
+    if not os.path.isfile(ES_SCHEMA_CREATOR_PATH):
+        raise BackendUnavailableError(
+            'the elasticsearch storage schema {0} is missing'.format(
+                ES_SCHEMA_CREATOR_PATH))
+    schema = imp.load_source('es_schema_creator', ES_SCHEMA_CREATOR_PATH)
+    mappings = {}
+    for type_schema in (schema.BLUEPRINT_SCHEMA,
+                        schema.DEPLOYMENT_SCHEMA,
+                        schema.NODE_SCHEMA,
+                        schema.NODE_INSTANCE_SCHEMA,
+                        schema.SHARED_DOCUMENT_SCHEMA):
+        mappings.update(type_schema)
+    settings = dict(schema.SETTINGS['settings'],
+                    number_of_shards=1,
+                    number_of_replicas=0)
+    return {'settings': settings, 'mappings': mappings}
+
+
+def _elasticsearch(storage_dir, args):
+    config.instance().db_address = args.es_host
+    config.instance().db_port = args.es_port
+    client = manager_elasticsearch.get_client()
+    if not client.ping():
+        raise BackendUnavailableError(
+            'elasticsearch is not reachable at {0}:{1}'.format(args.es_host,
+                                                               args.es_port))
+    es_storage_manager.STORAGE_INDEX_NAME = BENCHMARK_INDEX_NAME
+    if client.indices.exists(index=BENCHMARK_INDEX_NAME):
+        client.indices.delete(index=BENCHMARK_INDEX_NAME)
+    # without the mappings, opaque fields such as plans and runtime
+    # properties would be indexed, which production doesn't pay for
+    client.indices.create(index=BENCHMARK_INDEX_NAME,
+                          body=_storage_index_body())
+    return (es_storage_manager.create(),
+            lambda: client.indices.delete(index=BENCHMARK_INDEX_NAME))
+
+
+BACKENDS = OrderedDict([
+    ('file', _file),
+    ('sqlite', _sqlite),
+    ('elasticsearch', _elasticsearch)
+])
+
+
+def create(name, storage_dir, args):
+    """
+    :return: a (storage manager, cleanup function) tuple.
+    :raises BackendUnavailableError: if the backend can't be used here.
+    """
+    return BACKENDS[name](storage_dir, args)
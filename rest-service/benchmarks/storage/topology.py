@@ -0,0 +1,193 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Synthetic topologies for the storage benchmarks.
+
+Every deployment has the same shape: a chain of nodes, each contained in
+the previous one, with a fixed number of instances per node. Models are
+generated lazily, deployment by deployment, so large topologies never have
+to be held in memory at once.
+"""
+
+from manager_rest import models
+
+CREATED_AT = '2015-11-01 00:00:00.000000'
+WORKFLOWS = ('install', 'uninstall', 'scale', 'heal')
+EXECUTION_STATUSES = (models.Execution.TERMINATED,
+                      models.Execution.TERMINATED,
+                      models.Execution.FAILED,
+                      models.Execution.STARTED)
+
+
+class Topology(object):
+
+    def __init__(self, blueprints, deployments, nodes, instances_per_node,
+                 executions_per_deployment, modifications_per_deployment):
+        self.blueprints = blueprints
+        self.deployments = deployments
+        self.nodes = nodes
+        self.instances_per_node = instances_per_node
+        self.executions_per_deployment = executions_per_deployment
+        self.modifications_per_deployment = modifications_per_deployment
+
+    def to_dict(self):
+        return {
+            'blueprints': self.blueprints,
+            'deployments': self.deployments,
+            'nodes_per_deployment': self.nodes,
+            'instances_per_node': self.instances_per_node,
+            'executions_per_deployment': self.executions_per_deployment,
+            'modifications_per_deployment':
+            self.modifications_per_deployment,
+            'node_instances': self.deployments * self.nodes *
+            self.instances_per_node
+        }
+
+    @staticmethod
+    def blueprint_id(index):
+        return 'blueprint_{0}'.format(index)
+
+    @staticmethod
+    def deployment_id(index):
+        return 'deployment_{0}'.format(index)
+
+    @staticmethod
+    def node_id(index):
+        return 'node_{0}'.format(index)
+
+    @staticmethod
+    def node_instance_id(deployment_index, node_index, instance_index):
+        return 'node_{0}_{1}_{2}'.format(deployment_index, node_index,
+                                         instance_index)
+
+    @staticmethod
+    def execution_id(deployment_index, index):
+        return 'execution_{0}_{1}'.format(deployment_index, index)
+
+    @staticmethod
+    def modification_id(deployment_index, index):
+        return 'modification_{0}_{1}'.format(deployment_index, index)
+
+    def _deployment_blueprint_id(self, deployment_index):
+        return self.blueprint_id(deployment_index % self.blueprints)
+
+    def _plan_nodes(self):
+        return [{'id': self.node_id(i),
+                 'type': 'cloudify.nodes.Compute' if i == 0 else
+                 'cloudify.nodes.SoftwareComponent',
+                 'properties': {'port': 8000 + i}}
+                for i in range(self.nodes)]
+
+    def blueprint(self, index):
+        return models.BlueprintState(
+            id=self.blueprint_id(index),
+            plan={'nodes': self._plan_nodes(),
+                  'workflows': dict.fromkeys(WORKFLOWS, {}),
+                  'inputs': {}},
+            description=None,
+            created_at=CREATED_AT,
+            updated_at=CREATED_AT,
+            main_file_name='blueprint.yaml')
+
+    def deployment(self, index):
+        return models.Deployment(
+            id=self.deployment_id(index),
+            blueprint_id=self._deployment_blueprint_id(index),
+            created_at=CREATED_AT,
+            updated_at=CREATED_AT,
+            workflows=[{'name': workflow, 'parameters': {}}
+                       for workflow in WORKFLOWS],
+            inputs={},
+            policy_types={},
+            policy_triggers={},
+            groups={},
+            outputs={})
+
+    def deployment_nodes(self, deployment_index):
+        deployment_id = self.deployment_id(deployment_index)
+        for i in range(self.nodes):
+            relationships = [] if i == 0 else [{
+                'type': 'cloudify.relationships.contained_in',
+                'target_id': self.node_id(i - 1)}]
+            yield models.DeploymentNode(
+                id=self.node_id(i),
+                deployment_id=deployment_id,
+                blueprint_id=self._deployment_blueprint_id(deployment_index),
+                type='cloudify.nodes.Root',
+                type_hierarchy=['cloudify.nodes.Root'],
+                number_of_instances=self.instances_per_node,
+                planned_number_of_instances=self.instances_per_node,
+                deploy_number_of_instances=self.instances_per_node,
+                host_id=self.node_id(0),
+                properties={'port': 8000 + i},
+                operations={},
+                plugins=[],
+                plugins_to_install=[],
+                relationships=relationships)
+
+    def node_instances(self, deployment_index):
+        deployment_id = self.deployment_id(deployment_index)
+        for i in range(self.nodes):
+            for j in range(self.instances_per_node):
+                relationships = [] if i == 0 else [{
+                    'type': 'cloudify.relationships.contained_in',
+                    'target_id': self.node_instance_id(deployment_index,
+                                                       i - 1, j)}]
+                yield self.node_instance(deployment_id, self.node_id(i),
+                                         self.node_instance_id(
+                                             deployment_index, i, j),
+                                         relationships=relationships)
+
+    @staticmethod
+    def node_instance(deployment_id, node_id, node_instance_id,
+                      state='started', relationships=None, version=None):
+        return models.DeploymentNodeInstance(
+            id=node_instance_id,
+            node_id=node_id,
+            deployment_id=deployment_id,
+            host_id=None,
+            state=state,
+            runtime_properties={'ip': '10.0.0.1'},
+            relationships=relationships or [],
+            version=version)
+
+    def executions(self, deployment_index):
+        for i in range(self.executions_per_deployment):
+            yield models.Execution(
+                id=self.execution_id(deployment_index, i),
+                status=EXECUTION_STATUSES[i % len(EXECUTION_STATUSES)],
+                deployment_id=self.deployment_id(deployment_index),
+                workflow_id=WORKFLOWS[i % len(WORKFLOWS)],
+                blueprint_id=self._deployment_blueprint_id(deployment_index),
+                created_at=CREATED_AT,
+                error='',
+                parameters={},
+                is_system_workflow=False)
+
+    def modifications(self, deployment_index):
+        for i in range(self.modifications_per_deployment):
+            yield models.DeploymentModification(
+                id=self.modification_id(deployment_index, i),
+                deployment_id=self.deployment_id(deployment_index),
+                status=models.DeploymentModification.FINISHED,
+                created_at=CREATED_AT,
+                ended_at=CREATED_AT,
+                modified_nodes={self.node_id(self.nodes - 1): {
+                    'instances': self.instances_per_node + 1}},
+                node_instances={'before_modification': [],
+                                'added_and_related': [],
+                                'removed_and_related': []},
+                context={})
@@ -0,0 +1,162 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+The storage benchmark workload, and the recording of its latencies.
+
+The workload only uses the storage manager interface, so it runs unchanged
+against every storage manager implementation.
+"""
+
+import math
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from manager_rest import models
+from manager_rest import storage_manager
+
+ACTIVE_STATES = list(models.Execution.ACTIVE_STATES)
+
+
+def percentile(sorted_values, percent):
+    """Nearest rank percentile of an already sorted list"""
+    rank = int(math.ceil(percent / 100.0 * len(sorted_values)))
+    return sorted_values[max(rank - 1, 0)]
+
+
+class Sample(object):
+
+    def __init__(self, items):
+        self.items = items
+
+
+class Recorder(object):
+
+    def __init__(self):
+        # operation -> list of (duration in seconds, number of items)
+        self._samples = defaultdict(list)
+
+    @contextmanager
+    def measure(self, operation, items=1):
+        """Time the block. The number of items it handled may be set on
+        the yielded sample, when it's only known once the block is done.
+        """
+        sample = Sample(items)
+        start = time.time()
+        yield sample
+        self._samples[operation].append((time.time() - start,
+                                         sample.items))
+
+    def results(self):
+        results = {}
+        for operation, samples in self._samples.iteritems():
+            durations = sorted(duration for duration, _ in samples)
+            total_duration = sum(durations)
+            items = sum(count for _, count in samples)
+            results[operation] = {
+                'calls': len(samples),
+                'items': items,
+                'p50_ms': percentile(durations, 50) * 1000,
+                'p99_ms': percentile(durations, 99) * 1000,
+                'items_per_second': items / total_duration
+                if total_duration else None
+            }
+        return results
+
+
+def load(sm, topology, recorder):
+    """Store the whole topology, deployment by deployment"""
+    for i in range(topology.blueprints):
+        with recorder.measure('put_blueprint'):
+            sm.put_blueprint(topology.blueprint_id(i), topology.blueprint(i))
+
+    for i in range(topology.deployments):
+        with recorder.measure('put_deployment'):
+            sm.put_deployment(topology.deployment_id(i),
+                              topology.deployment(i))
+        nodes = list(topology.deployment_nodes(i))
+        with recorder.measure('put_nodes_bulk', items=len(nodes)):
+            sm.put_nodes_bulk(nodes)
+        node_instances = list(topology.node_instances(i))
+        with recorder.measure('put_node_instances_bulk',
+                              items=len(node_instances)):
+            sm.put_node_instances_bulk(node_instances)
+        for execution in topology.executions(i):
+            with recorder.measure('put_execution'):
+                sm.put_execution(execution.id, execution)
+        for modification in topology.modifications(i):
+            with recorder.measure('put_deployment_modification'):
+                sm.put_deployment_modification(modification.id,
+                                               modification)
+
+
+def run(sm, topology, recorder, samples, random):
+    """
+    Run the typical manager operations against randomly chosen
+    deployments of a loaded topology.
+    """
+    for _ in range(samples):
+        deployment_index = random.randrange(topology.deployments)
+        deployment_id = topology.deployment_id(deployment_index)
+        deployment_filter = {'deployment_id': [deployment_id]}
+        node_index = random.randrange(topology.nodes)
+        node_instance_id = topology.node_instance_id(
+            deployment_index, node_index,
+            random.randrange(topology.instances_per_node))
+
+        with recorder.measure('get_deployment'):
+            sm.get_deployment(deployment_id)
+        with recorder.measure('get_node_instance'):
+            sm.get_node_instance(node_instance_id)
+
+        with recorder.measure('get_nodes') as sample:
+            sample.items = len(sm.get_nodes(filters=deployment_filter).items)
+        with recorder.measure('get_node_instances') as sample:
+            sample.items = len(sm.get_node_instances(
+                filters=deployment_filter).items)
+
+        with recorder.measure('update_node_instance'):
+            # version 0 skips the version check
+            sm.update_node_instance(topology.node_instance(
+                deployment_id, topology.node_id(node_index),
+                node_instance_id, state='started', version=0))
+
+        with recorder.measure('deployment_executions_list'):
+            sm.executions_list(filters=deployment_filter)
+        with recorder.measure('active_executions_page'):
+            sm.executions_list(filters={'status': ACTIVE_STATES},
+                               sort={'created_at': 'desc'},
+                               pagination={'offset': 0, 'size': 20})
+        with recorder.measure('count_active_executions'):
+            sm.count(storage_manager.EXECUTION_TYPE,
+                     {'status': ACTIVE_STATES})
+        if topology.executions_per_deployment:
+            execution_id = topology.execution_id(
+                deployment_index,
+                random.randrange(topology.executions_per_deployment))
+            with recorder.measure('update_execution_status'):
+                sm.update_execution_status(execution_id,
+                                           models.Execution.TERMINATED, '')
+        with recorder.measure('deployment_modifications_list'):
+            sm.deployment_modifications_list(filters=deployment_filter)
+
+
+def delete(sm, topology, recorder, deletes):
+    """Delete the last deployments of a loaded topology"""
+    first = max(topology.deployments - deletes, 0)
+    for i in range(first, topology.deployments):
+        with recorder.measure('delete_deployment'):
+            sm.delete_deployment(topology.deployment_id(i))
@@ -14,8 +14,10 @@
 #  * limitations under the License.
 
 import uuid
+import functools
 import traceback
 import os
+import time
 from datetime import datetime
 from StringIO import StringIO
 
@@ -27,6 +29,8 @@ from dsl_parser import utils as dsl_parser_utils
 from manager_rest import models
 from manager_rest import config
 from manager_rest import manager_exceptions
+from manager_rest import notifications
+from manager_rest import plan_cache
 from manager_rest import storage_manager
 from manager_rest import workflow_client as wf_client
 
@@ -50,11 +54,22 @@ class BlueprintsManager(object):
     def __init__(self):
         self.sm = storage_manager.get_storage_manager()
         self.workflow_client = wf_client.get_workflow_client()
+        self.plan_cache = plan_cache.PlanCache(
+            config.instance().plan_cache_max_bytes,
+            config.instance().plan_cache_generation_path)
+        self.execution_notifier = notifications.ChangeNotifier(
+            config.instance().execution_notifications_path)
 
     def blueprints_list(self, include=None, filters=None,
                         pagination=None, sort=None):
-        return self.sm.blueprints_list(include=include, filters=filters,
-                                       pagination=pagination, sort=sort)
+        blueprints = self.sm.blueprints_list(include=include, filters=filters,
+                                             pagination=pagination, sort=sort)
+        if include and 'plan' not in include:
+            # plans are only read if they're actually used
+            for blueprint in blueprints.items:
+                blueprint.plan_loader = functools.partial(self._get_plan,
+                                                          blueprint.id)
+        return blueprints
 
     def deployments_list(self, include=None, filters=None, pagination=None,
                          sort=None):
@@ -68,6 +83,20 @@ class BlueprintsManager(object):
 
     def executions_list(self, include=None, is_include_system_workflows=False,
                         filters=None, pagination=None, sort=None):
+        filters = self._create_executions_filters(
+            filters, is_include_system_workflows)
+        return self.sm.executions_list(include=include, filters=filters,
+                                       pagination=pagination, sort=sort)
+
+    def iter_executions(self, include=None, is_include_system_workflows=False,
+                        filters=None, sort=None):
+        filters = self._create_executions_filters(
+            filters, is_include_system_workflows)
+        return self.sm.iter_executions(include=include, filters=filters,
+                                       sort=sort)
+
+    @staticmethod
+    def _create_executions_filters(filters, is_include_system_workflows):
         filters = filters or {}
         is_system_workflow = filters.get('is_system_workflow')
         if is_system_workflow:
@@ -77,11 +106,28 @@ class BlueprintsManager(object):
                 filters['is_system_workflow'].append(value)
         elif not is_include_system_workflows:
             filters['is_system_workflow'] = [False]
-        return self.sm.executions_list(include=include, filters=filters,
-                                       pagination=pagination, sort=sort)
+        return filters
 
     def get_blueprint(self, blueprint_id, include=None):
-        return self.sm.get_blueprint(blueprint_id, include=include)
+        if include and 'plan' not in include:
+            return self.sm.get_blueprint(blueprint_id, include=include)
+        generation = self.plan_cache.generation()
+        plan = self.plan_cache.get(blueprint_id)
+        if plan is None:
+            blueprint = self.sm.get_blueprint(blueprint_id, include=include)
+            self.plan_cache.put(blueprint_id, blueprint.plan, generation)
+            return blueprint
+        # the other fields are still read from the storage, which also
+        # verifies the blueprint exists
+        blueprint = self.sm.get_blueprint(
+            blueprint_id,
+            include=[field for field in include or models.BlueprintState.fields
+                     if field != 'plan'] or ['id'])
+        blueprint.plan = plan
+        return blueprint
+
+    def _get_plan(self, blueprint_id):
+        return self.get_blueprint(blueprint_id, include=['plan']).plan
 
     def get_snapshot(self, snapshot_id, include=None):
         return self.sm.get_snapshot(snapshot_id, include=include)
@@ -127,7 +173,42 @@ class BlueprintsManager(object):
                     deployment=deployment,
                     execution_parameters=exec_params)
 
-        return self.sm.update_execution_status(execution_id, status, error)
+        result = self.sm.update_execution_status(execution_id, status, error)
+        self._notify_execution_change(execution_id)
+        return result
+
+    def _notify_execution_change(self, execution_id):
+        # the change is already stored, and waiters which aren't notified
+        # still return at their timeout, so a failure mustn't fail the
+        # change itself
+        try:
+            self.execution_notifier.notify(execution_id)
+        except (IOError, OSError) as e:
+            current_app.logger.warning(
+                'Failed notifying waiters of a change of execution {0}: '
+                '{1}'.format(execution_id, e))
+
+    def wait_for_execution_change(self, execution_id, status, timeout,
+                                  include=None):
+        """
+        Wait until the execution's status differs from the given status, or
+        until the timeout (in seconds) expires. The execution is only read
+        again when its status is updated.
+
+        :return: the execution, in its current status.
+        """
+        if include and 'status' not in include:
+            include = list(include) + ['status']
+        deadline = time.time() + timeout
+        cursor = self.execution_notifier.cursor()
+        execution = self.get_execution(execution_id, include=include)
+        while execution.status == status:
+            notified, cursor = self.execution_notifier.wait(
+                execution_id, cursor, deadline - time.time())
+            if not notified:
+                break
+            execution = self.get_execution(execution_id, include=include)
+        return execution
 
     def _get_conf_for_snapshots_wf(self):
         return {
@@ -220,10 +301,12 @@ class BlueprintsManager(object):
         return new_blueprint
 
     def delete_blueprint(self, blueprint_id):
-        blueprint_deployments = self.sm.get_blueprint_deployments(
-            blueprint_id).items
-
-        if len(blueprint_deployments) > 0:
+        blueprint_filter = self.create_filters_dict(blueprint_id=blueprint_id)
+        if self.sm.exists(storage_manager.DEPLOYMENT_TYPE,
+                          filters=blueprint_filter):
+            # only list the dependent deployments for the error message
+            blueprint_deployments = self.sm.get_blueprint_deployments(
+                blueprint_id, include=['id']).items
             raise manager_exceptions.DependentExistsError(
                 "Can't delete blueprint {0} - There exist "
                 "deployments for this blueprint; Deployments ids: {1}"
@@ -231,7 +314,17 @@ class BlueprintsManager(object):
                         ','.join([dep.id for dep
                                   in blueprint_deployments])))
 
-        return self.sm.delete_blueprint(blueprint_id)
+        blueprint = self.sm.delete_blueprint(blueprint_id)
+        # the blueprint is already deleted, so a failure mustn't fail the
+        # deletion. Other processes may keep its plan cached until their
+        # next invalidation.
+        try:
+            self.plan_cache.invalidate(blueprint_id)
+        except (IOError, OSError) as e:
+            current_app.logger.warning(
+                'Failed invalidating the cached plan of blueprint {0} in '
+                'other processes: {1}'.format(blueprint_id, e))
+        return blueprint
 
     def delete_snapshot(self, snapshot_id):
         return self.sm.delete_snapshot(snapshot_id)
@@ -241,30 +334,35 @@ class BlueprintsManager(object):
         self.sm.get_deployment(deployment_id)
 
         # validate there are no running executions for this deployment
-        deplyment_id_filter = self.create_filters_dict(
-            deployment_id=deployment_id)
-        executions = self.sm.executions_list(
-            filters=deplyment_id_filter).items
-        if any(execution.status not in models.Execution.END_STATES for
-           execution in executions):
+        running_executions_filter = self.create_filters_dict(
+            deployment_id=deployment_id,
+            status=list(models.Execution.ACTIVE_STATES))
+        if self.sm.exists(storage_manager.EXECUTION_TYPE,
+                          filters=running_executions_filter):
+            executions = self.sm.executions_list(
+                include=['id'], filters=running_executions_filter).items
             raise manager_exceptions.DependentExistsError(
                 "Can't delete deployment {0} - There are running "
                 "executions for this deployment. Running executions ids: {1}"
                 .format(
                     deployment_id,
-                    ','.join([execution.id for execution in
-                              executions if execution.status not
-                              in models.Execution.END_STATES])))
+                    ','.join([execution.id for execution in executions])))
 
         if not ignore_live_nodes:
             deplyment_id_filter = self.create_filters_dict(
                 deployment_id=deployment_id)
-            node_instances = self.sm.get_node_instances(
-                filters=deplyment_id_filter).items
+            inactive_nodes_filter = self.create_filters_dict(
+                deployment_id=deployment_id,
+                state=['uninitialized', 'deleted'])
             # validate either all nodes for this deployment are still
             # uninitialized or have been deleted
-            if any(node.state not in ('uninitialized', 'deleted') for node in
-                   node_instances):
+            if self.sm.count(storage_manager.NODE_INSTANCE_TYPE,
+                             filters=deplyment_id_filter) > \
+                    self.sm.count(storage_manager.NODE_INSTANCE_TYPE,
+                                  filters=inactive_nodes_filter):
+                node_instances = self.sm.get_node_instances(
+                    include=['id', 'state'],
+                    filters=deplyment_id_filter).items
                 raise manager_exceptions.DependentExistsError(
                     "Can't delete deployment {0} - There are live nodes for "
                     "this deployment. Live nodes ids: {1}"
@@ -293,7 +391,6 @@ class BlueprintsManager(object):
             self._get_transient_deployment_workers_mode_config()
         is_transient_workers_enabled = transient_workers_config['enabled']
 
-        self._check_for_active_system_wide_execution()
         self._check_for_active_executions(deployment_id, force,
                                           transient_workers_config)
 
@@ -350,15 +447,20 @@ class BlueprintsManager(object):
 
         return new_execution
 
-    def _check_for_any_active_executions(self):
+    def _get_active_executions(self):
+        """
+        List the executions which haven't ended yet, of both user and system
+        workflows, with only the fields required by the admission checks.
+        """
         filters = {
             'status': models.Execution.ACTIVE_STATES
         }
-        executions = [
-            e.id
-            for e in self.executions_list(is_include_system_workflows=True,
-                                          filters=filters).items
-        ]
+        return self.executions_list(is_include_system_workflows=True,
+                                    filters=filters,
+                                    include=['id', 'deployment_id']).items
+
+    def _check_for_any_active_executions(self):
+        executions = [e.id for e in self._get_active_executions()]
 
         if executions:
             raise manager_exceptions.ExistingRunningExecutionError(
@@ -367,12 +469,9 @@ class BlueprintsManager(object):
                 'Currently running executions: {0}'
                 .format(executions))
 
-    def _check_for_active_system_wide_execution(self):
-        filters = {
-            'status': models.Execution.ACTIVE_STATES
-        }
-        for e in self.executions_list(is_include_system_workflows=True,
-                                      filters=filters).items:
+    @staticmethod
+    def _check_for_active_system_wide_execution(active_executions):
+        for e in active_executions:
             if e.deployment_id is None:
                 raise manager_exceptions.ExistingRunningExecutionError(
                     'You cannot start an execution if there is a running '
@@ -501,6 +600,7 @@ class BlueprintsManager(object):
             else models.Execution.FORCE_CANCELLING
         self.sm.update_execution_status(
             execution_id, new_status, '')
+        self._notify_execution_change(execution_id)
         return self.get_execution(execution_id)
 
     def create_deployment(self, blueprint_id, deployment_id, inputs=None):
@@ -591,11 +691,14 @@ class BlueprintsManager(object):
                 planned_number_of_instances=modified_node['instances'])
         added_and_related = node_instances_modification['added_and_related']
         added_node_instances = []
+        related_node_instances = self._get_node_instances_by_ids(
+            node_instance['id'] for node_instance in added_and_related
+            if node_instance.get('modification') != 'added')
         for node_instance in added_and_related:
             if node_instance.get('modification') == 'added':
                 added_node_instances.append(node_instance)
             else:
-                current = self.sm.get_node_instance(node_instance['id'])
+                current = related_node_instances[node_instance['id']]
                 new_relationships = current.relationships
                 new_relationships += node_instance['relationships']
                 self.sm.update_node_instance(models.DeploymentNodeInstance(
@@ -625,6 +728,10 @@ class BlueprintsManager(object):
             self.sm.update_node(modification.deployment_id, node_id,
                                 number_of_instances=modified_node['instances'])
         node_instances = modification.node_instances
+        related_node_instances = self._get_node_instances_by_ids(
+            node_instance['id']
+            for node_instance in node_instances['removed_and_related']
+            if node_instance.get('modification') != 'removed')
         for node_instance in node_instances['removed_and_related']:
             if node_instance.get('modification') == 'removed':
                 self.sm.delete_node_instance(node_instance['id'])
@@ -632,7 +739,7 @@ class BlueprintsManager(object):
                 removed_relationship_target_ids = set(
                     [rel['target_id']
                      for rel in node_instance['relationships']])
-                current = self.sm.get_node_instance(node_instance['id'])
+                current = related_node_instances[node_instance['id']]
                 new_relationships = [rel for rel in current.relationships
                                      if rel['target_id']
                                      not in removed_relationship_target_ids]
@@ -682,11 +789,10 @@ class BlueprintsManager(object):
             filters=deplyment_id_filter).items
         modification.node_instances['before_rollback'] = [
             instance.to_dict() for instance in node_instances]
-        for instance in node_instances:
-            self.sm.delete_node_instance(instance.id)
-        for instance in modification.node_instances['before_modification']:
-            self.sm.put_node_instance(
-                models.DeploymentNodeInstance(**instance))
+        self.sm.replace_node_instances(
+            modification.deployment_id,
+            [models.DeploymentNodeInstance(**instance) for instance in
+             modification.node_instances['before_modification']])
         nodes_num_instances = {node.id: node for node in self.sm.get_nodes(
             filters=deplyment_id_filter,
             include=['id', 'number_of_instances']).items}
@@ -718,6 +824,10 @@ class BlueprintsManager(object):
             node_instances=None,
             context=None)
 
+    def _get_node_instances_by_ids(self, node_instance_ids):
+        return {instance.id: instance for instance in
+                self.sm.get_node_instances_by_ids(list(node_instance_ids))}
+
     def _get_node_instance_ids(self, deployment_id):
         deplyment_id_filter = self.create_filters_dict(
             deployment_id=deployment_id)
@@ -727,12 +837,13 @@ class BlueprintsManager(object):
     def _create_deployment_node_instances(self,
                                           deployment_id,
                                           dsl_node_instances):
+        instances = []
         for node_instance in dsl_node_instances:
             instance_id = node_instance['id']
             node_id = node_instance['name']
             relationships = node_instance.get('relationships', [])
             host_id = node_instance.get('host_id')
-            instance = models.DeploymentNodeInstance(
+            instances.append(models.DeploymentNodeInstance(
                 id=instance_id,
                 node_id=node_id,
                 host_id=host_id,
@@ -740,8 +851,8 @@ class BlueprintsManager(object):
                 deployment_id=deployment_id,
                 state='uninitialized',
                 runtime_properties={},
-                version=None)
-            self.sm.put_node_instance(instance)
+                version=None))
+        self.sm.put_node_instances_bulk(instances)
 
     def evaluate_deployment_outputs(self, deployment_id):
         deployment = self.get_deployment(
@@ -769,6 +880,10 @@ class BlueprintsManager(object):
 
     def evaluate_functions(self, deployment_id, context, payload):
         self.get_deployment(deployment_id, include=['id'])
+        # functions may only refer to node instances by the context ids,
+        # so these are fetched (with their nodes) up front
+        node_instances, nodes = self._get_context_node_instances_and_nodes(
+            deployment_id, context)
 
         def get_node_instances(node_id=None):
             filters = self.create_filters_dict(deployment_id=deployment_id,
@@ -776,9 +891,13 @@ class BlueprintsManager(object):
             return self.sm.get_node_instances(filters=filters).items
 
         def get_node_instance(node_instance_id):
+            if node_instance_id in node_instances:
+                return node_instances[node_instance_id]
             return self.sm.get_node_instance(node_instance_id)
 
         def get_node(node_id):
+            if node_id in nodes:
+                return nodes[node_id]
             return self.sm.get_node(deployment_id, node_id)
 
         try:
@@ -791,10 +910,27 @@ class BlueprintsManager(object):
         except parser_exceptions.FunctionEvaluationError, e:
             raise manager_exceptions.FunctionsEvaluationError(str(e))
 
+    def _get_context_node_instances_and_nodes(self, deployment_id, context):
+        node_instance_ids = set(context.get(key)
+                                for key in ('self', 'source', 'target')
+                                if context.get(key))
+        try:
+            node_instances = self._get_node_instances_by_ids(
+                node_instance_ids)
+            nodes = {node.id: node for node in self.sm.get_nodes_by_ids(
+                deployment_id,
+                set(instance.node_id
+                    for instance in node_instances.values()))}
+        except manager_exceptions.NotFoundError:
+            # let the evaluation fail only if it uses a missing item
+            return {}, {}
+        return node_instances, nodes
+
     def _create_deployment_nodes(self, blueprint_id, deployment_id, plan):
+        nodes = []
         for raw_node in plan['nodes']:
             num_instances = raw_node['instances']['deploy']
-            self.sm.put_node(models.DeploymentNode(
+            nodes.append(models.DeploymentNode(
                 id=raw_node['name'],
                 deployment_id=deployment_id,
                 blueprint_id=blueprint_id,
@@ -810,6 +946,7 @@ class BlueprintsManager(object):
                 plugins_to_install=raw_node.get('plugins_to_install'),
                 relationships=self._prepare_node_relationships(raw_node)
             ))
+        self.sm.put_nodes_bulk(nodes)
 
     @staticmethod
     def _merge_and_validate_execution_parameters(
@@ -974,21 +1111,14 @@ class BlueprintsManager(object):
                                      transient_workers_config):
         is_transient_workers_enabled = transient_workers_config['enabled']
 
-        def _get_running_executions(deployment_id=None, include_system=True):
-            deplyment_id_filter = self.create_filters_dict(
-                deployment_id=deployment_id)
-            executions = self.executions_list(
-                filters=deplyment_id_filter,
-                is_include_system_workflows=include_system).items
-            running = [
-                e.id for e in executions if
-                self.sm.get_execution(e.id).status
-                not in models.Execution.END_STATES]
-            return running
+        # all checks are based on a single listing of the active executions
+        active_executions = self._get_active_executions()
+        self._check_for_active_system_wide_execution(active_executions)
 
         # validate no execution is currently in progress
         if not force:
-            running = _get_running_executions(deployment_id)
+            running = [e.id for e in active_executions
+                       if e.deployment_id == deployment_id]
             if len(running) > 0:
                 raise manager_exceptions.ExistingRunningExecutionError(
                     'The following executions are currently running for this '
@@ -1006,7 +1136,7 @@ class BlueprintsManager(object):
 
             if global_parallel_executions_limit != \
                     LIMITLESS_GLOBAL_PARALLEL_EXECUTIONS_VALUE:
-                running = _get_running_executions()
+                running = [e.id for e in active_executions]
                 if len(running) >= global_parallel_executions_limit:
                     raise manager_exceptions. \
                         GlobalParallelRunningExecutionsLimitReachedError(
@@ -0,0 +1,160 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Compress the opaque fields of documents stored before storage compression
+was introduced, and report the storage size before and after.
+
+Documents are rewritten only if some of their designated fields aren't
+compressed yet, so running the migration again is harmless:
+
+    python -m manager_rest.compress_storage elasticsearch --host localhost
+    python -m manager_rest.compress_storage file /path/to/storage.json
+"""
+
+import os
+import sys
+import argparse
+
+import elasticsearch.helpers
+
+from manager_rest import es_storage_manager
+from manager_rest import manager_elasticsearch
+from manager_rest import storage_codec
+from manager_rest.file_storage_manager import FileStorageManager
+from manager_rest.manager_elasticsearch import ManagerElasticsearch
+
+BULK_CHUNK_SIZE = 500
+
+
+def _needs_compression(doc_type, doc):
+    return doc != storage_codec.encode_document(doc_type, doc)
+
+
+def _index_size(client, index):
+    stats = client.indices.stats(index=index, metric='store')
+    return stats['indices'][index]['primaries']['store']['size_in_bytes']
+
+
+def compress_elasticsearch(client, index):
+    """
+    Rewrite the documents whose designated fields aren't compressed. Each
+    document is written using the version it was read with, so documents
+    updated meanwhile are skipped rather than overwritten.
+
+    :return: a dict of the index size before and after the migration, of
+     the number of migrated and skipped documents, and of the errors of the
+     documents which failed being written otherwise.
+    """
+    client.indices.refresh(index=index)
+    size_before = _index_size(client, index)
+    migrated = 0
+    skipped = 0
+    failed = []
+    for doc_type in storage_codec.COMPRESSED_FIELDS:
+        _, hits = ManagerElasticsearch.scroll(index,
+                                              {'version': True},
+                                              doc_type=doc_type,
+                                              connection=client)
+        actions = ({'_op_type': 'index',
+                    '_index': index,
+                    '_type': doc_type,
+                    '_id': hit['_id'],
+                    '_version': hit['_version'],
+                    '_source': storage_codec.encode_document(
+                        doc_type, hit['_source'])}
+                   for hit in hits
+                   if _needs_compression(doc_type, hit['_source']))
+        for ok, item in elasticsearch.helpers.streaming_bulk(
+                client, actions, chunk_size=BULK_CHUNK_SIZE,
+                raise_on_error=False):
+            result = item['index']
+            if ok:
+                migrated += 1
+            elif result.get('status') == 409:
+                # a version conflict, the document was updated meanwhile
+                skipped += 1
+            else:
+                failed.append('{0} {1}: {2}'.format(doc_type, result['_id'],
+                                                    result.get('error')))
+    # the replaced documents only free their space once merged away
+    client.indices.optimize(index=index, only_expunge_deletes=True)
+    client.indices.refresh(index=index)
+    return {'size_before': size_before,
+            'size_after': _index_size(client, index),
+            'migrated': migrated,
+            'skipped': skipped,
+            'failed': failed}
+
+
+def _file_storage_size(storage_path):
+    return sum(os.path.getsize(path)
+               for path in (storage_path, '{0}.log'.format(storage_path))
+               if os.path.isfile(path))
+
+
+def compress_file_storage(storage_path):
+    """
+    Rewrite the items whose designated fields aren't compressed, and
+    compact the storage file.
+
+    :return: a dict of the storage files size before and after the
+     migration, and of the number of migrated items.
+    """
+    size_before = _file_storage_size(storage_path)
+    sm = FileStorageManager(storage_path, recover=True)
+    migrated = sm.rewrite_items(storage_codec.COMPRESSED_FIELDS,
+                                _needs_compression)
+    return {'size_before': size_before,
+            'size_after': _file_storage_size(storage_path),
+            'migrated': migrated,
+            'skipped': 0,
+            'failed': []}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    subparsers = parser.add_subparsers(dest='storage')
+    es_parser = subparsers.add_parser('elasticsearch')
+    es_parser.add_argument('--host', default='localhost')
+    es_parser.add_argument('--port', type=int, default=9200)
+    es_parser.add_argument('--index',
+                           default=es_storage_manager.STORAGE_INDEX_NAME)
+    file_parser = subparsers.add_parser('file')
+    file_parser.add_argument('storage_path')
+    args = parser.parse_args()
+
+    if args.storage == 'elasticsearch':
+        client = manager_elasticsearch.get_client(args.host, args.port)
+        result = compress_elasticsearch(client, args.index)
+    else:
+        result = compress_file_storage(args.storage_path)
+
+    print 'Migrated documents: {0} (skipped: {1})'.format(result['migrated'],
+                                                          result['skipped'])
+    print 'Size before: {0} bytes'.format(result['size_before'])
+    print 'Size after: {0} bytes ({1:.1%} of the original size)'.format(
+        result['size_after'],
+        float(result['size_after']) / result['size_before']
+        if result['size_before'] else 1)
+    if result['failed']:
+        print 'Failed documents: {0}'.format(len(result['failed']))
+        for failure in result['failed']:
+            print '  {0}'.format(failure)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
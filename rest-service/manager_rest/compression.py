@@ -0,0 +1,119 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Negotiated compression of JSON responses.
+
+Responses are compressed with gzip or deflate, whichever the client
+prefers according to its Accept-Encoding header, at the configured
+`response_compression_level` (0 disables compression). Responses whose
+body is shorter than `response_compression_min_size` are sent as they are.
+Streamed responses (streamed lists) are compressed chunk by chunk, each
+chunk being flushed so that the client can decode it as soon as it
+arrives. Archive downloads, which nginx serves by X-Accel-Redirect, aren't
+JSON and are never compressed.
+
+A compressed response is a different representation than the uncompressed
+one, so its strong entity tag is suffixed with its encoding.
+"""
+
+import zlib
+
+from flask import request
+
+from manager_rest import config
+
+COMPRESSED_MIMETYPES = ('application/json',)
+
+# encoding -> zlib wbits of its container format
+_ENCODINGS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS
+}
+
+
+def compress_response(response):
+    """
+    An after-request function compressing the response, if the client
+    accepts a compressed response.
+    """
+    level = config.instance().response_compression_level
+    if not level or not _is_compressible(response):
+        return response
+    # the response depends on the Accept-Encoding header whether it's
+    # compressed or not
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(
+        ['gzip', 'deflate'], default=None)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_chunks(response.response, encoding,
+                                             level)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config.instance().response_compression_min_size:
+            return response
+        compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                      _ENCODINGS[encoding])
+        response.set_data(compressor.compress(data) + compressor.flush())
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(encoded_etag(etag, encoding))
+    return response
+
+
+def encoded_etag(etag, encoding):
+    """The entity tag of a response tagged `etag`, compressed with the
+    given encoding"""
+    return '{0}-{1}'.format(etag, encoding)
+
+
+def etag_representations(etag):
+    """
+    :return: the entity tags a response tagged `etag` may be sent with,
+     uncompressed or compressed.
+    """
+    return [etag] + [encoded_etag(etag, encoding)
+                     for encoding in sorted(_ENCODINGS)]
+
+
+def _is_compressible(response):
+    return response.status_code not in (204, 304) and \
+        response.status_code >= 200 and \
+        request.method != 'HEAD' and \
+        response.mimetype in COMPRESSED_MIMETYPES and \
+        not response.direct_passthrough and \
+        'Content-Encoding' not in response.headers and \
+        'X-Accel-Redirect' not in response.headers
+
+
+def _compress_chunks(chunks, encoding, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _ENCODINGS[encoding])
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, unicode):
+                chunk = chunk.encode('utf-8')
+            compressed = compressor.compress(chunk) + \
+                compressor.flush(zlib.Z_SYNC_FLUSH)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
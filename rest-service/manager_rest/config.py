@@ -14,6 +14,7 @@
 #  * limitations under the License.
 
 import os
+import tempfile
 
 
 class Config(object):
@@ -21,6 +22,27 @@ class Config(object):
     def __init__(self):
         self._db_address = 'localhost'
         self._db_port = 9200
+        self._db_connection_pool_size = 10
+        self._db_connection_keep_alive = True
+        self._db_connection_timeout = 10
+        self._db_max_retries = 3
+        self._db_retry_on_timeout = False
+        self._db_sniff_on_start = False
+        self._db_sniff_on_connection_fail = False
+        self._db_sniffer_timeout = None
+        self._db_write_visibility = 'strict'
+        self._db_write_visibility_per_type = {}
+        self._db_sqlite_path = '/opt/manager/cloudify_storage.db'
+        self._plan_cache_max_bytes = 64 * 1024 * 1024
+        self._plan_cache_generation_path = os.path.join(
+            tempfile.gettempdir(), 'cloudify_plan_cache_generation')
+        self._shared_document_cache_size = 1000
+        self._execution_notifications_path = os.path.join(
+            tempfile.gettempdir(), 'cloudify_execution_notifications')
+        self._execution_wait_max_timeout = 60
+        self._node_instance_batch_update_max_size = 1000
+        self._response_compression_level = 6
+        self._response_compression_min_size = 1024
         self._amqp_address = 'localhost'
         self.amqp_username = 'guest'
         self.amqp_password = 'guest'
@@ -66,6 +88,158 @@ class Config(object):
     def db_port(self, value):
         self._db_port = value
 
+    @property
+    def db_connection_pool_size(self):
+        return self._db_connection_pool_size
+
+    @db_connection_pool_size.setter
+    def db_connection_pool_size(self, value):
+        self._db_connection_pool_size = value
+
+    @property
+    def db_connection_keep_alive(self):
+        return self._db_connection_keep_alive
+
+    @db_connection_keep_alive.setter
+    def db_connection_keep_alive(self, value):
+        self._db_connection_keep_alive = value
+
+    @property
+    def db_connection_timeout(self):
+        return self._db_connection_timeout
+
+    @db_connection_timeout.setter
+    def db_connection_timeout(self, value):
+        self._db_connection_timeout = value
+
+    @property
+    def db_max_retries(self):
+        return self._db_max_retries
+
+    @db_max_retries.setter
+    def db_max_retries(self, value):
+        self._db_max_retries = value
+
+    @property
+    def db_retry_on_timeout(self):
+        return self._db_retry_on_timeout
+
+    @db_retry_on_timeout.setter
+    def db_retry_on_timeout(self, value):
+        self._db_retry_on_timeout = value
+
+    @property
+    def db_sniff_on_start(self):
+        return self._db_sniff_on_start
+
+    @db_sniff_on_start.setter
+    def db_sniff_on_start(self, value):
+        self._db_sniff_on_start = value
+
+    @property
+    def db_sniff_on_connection_fail(self):
+        return self._db_sniff_on_connection_fail
+
+    @db_sniff_on_connection_fail.setter
+    def db_sniff_on_connection_fail(self, value):
+        self._db_sniff_on_connection_fail = value
+
+    @property
+    def db_sniffer_timeout(self):
+        return self._db_sniffer_timeout
+
+    @db_sniffer_timeout.setter
+    def db_sniffer_timeout(self, value):
+        self._db_sniffer_timeout = value
+
+    @property
+    def db_write_visibility(self):
+        return self._db_write_visibility
+
+    @db_write_visibility.setter
+    def db_write_visibility(self, value):
+        self._db_write_visibility = value
+
+    @property
+    def db_write_visibility_per_type(self):
+        return self._db_write_visibility_per_type
+
+    @db_write_visibility_per_type.setter
+    def db_write_visibility_per_type(self, value):
+        self._db_write_visibility_per_type = value
+
+    @property
+    def db_sqlite_path(self):
+        return self._db_sqlite_path
+
+    @db_sqlite_path.setter
+    def db_sqlite_path(self, value):
+        self._db_sqlite_path = value
+
+    @property
+    def plan_cache_max_bytes(self):
+        return self._plan_cache_max_bytes
+
+    @plan_cache_max_bytes.setter
+    def plan_cache_max_bytes(self, value):
+        self._plan_cache_max_bytes = value
+
+    @property
+    def plan_cache_generation_path(self):
+        return self._plan_cache_generation_path
+
+    @plan_cache_generation_path.setter
+    def plan_cache_generation_path(self, value):
+        self._plan_cache_generation_path = value
+
+    @property
+    def shared_document_cache_size(self):
+        return self._shared_document_cache_size
+
+    @shared_document_cache_size.setter
+    def shared_document_cache_size(self, value):
+        self._shared_document_cache_size = value
+
+    @property
+    def execution_notifications_path(self):
+        return self._execution_notifications_path
+
+    @execution_notifications_path.setter
+    def execution_notifications_path(self, value):
+        self._execution_notifications_path = value
+
+    @property
+    def execution_wait_max_timeout(self):
+        return self._execution_wait_max_timeout
+
+    @execution_wait_max_timeout.setter
+    def execution_wait_max_timeout(self, value):
+        self._execution_wait_max_timeout = value
+
+    @property
+    def node_instance_batch_update_max_size(self):
+        return self._node_instance_batch_update_max_size
+
+    @node_instance_batch_update_max_size.setter
+    def node_instance_batch_update_max_size(self, value):
+        self._node_instance_batch_update_max_size = value
+
+    @property
+    def response_compression_level(self):
+        return self._response_compression_level
+
+    @response_compression_level.setter
+    def response_compression_level(self, value):
+        self._response_compression_level = value
+
+    @property
+    def response_compression_min_size(self):
+        return self._response_compression_min_size
+
+    @response_compression_min_size.setter
+    def response_compression_min_size(self, value):
+        self._response_compression_min_size = value
+
     @property
     def amqp_address(self):
         return self._amqp_address
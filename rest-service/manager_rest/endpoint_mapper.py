@@ -45,8 +45,11 @@ def setup_resources(api):
         'NodeInstances': 'node-instances',
         'NodeInstancesId': 'node-instances/<string:node_instance_id>',
         'Events': 'events',
+        'EventsStream': 'events/stream',
         'Search': 'search',
+        'Summary': 'summary/<string:resource>',
         'Status': 'status',
+        'Metrics': 'metrics',
         'ProviderContext': 'provider/context',
         'Version': 'version',
         'EvaluateFunctions': 'evaluate/functions',
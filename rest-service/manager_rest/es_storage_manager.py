@@ -13,13 +13,31 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import threading
+from collections import defaultdict
 
 import elasticsearch.exceptions
-from elasticsearch import Elasticsearch
+import elasticsearch.helpers
 
 from manager_rest import config
+from manager_rest import manager_elasticsearch
 from manager_rest import manager_exceptions
-from manager_rest.storage_manager import ListResult
+from manager_rest import shared_documents
+from manager_rest import storage_codec
+from manager_rest import utils
+from manager_rest.storage_manager import (ListResult,
+                                          StreamResult,
+                                          reject_updates,
+                                          NODE_TYPE,
+                                          NODE_INSTANCE_TYPE,
+                                          PLUGIN_TYPE,
+                                          BLUEPRINT_TYPE,
+                                          SNAPSHOT_TYPE,
+                                          DEPLOYMENT_TYPE,
+                                          DEPLOYMENT_MODIFICATION_TYPE,
+                                          EXECUTION_TYPE,
+                                          PROVIDER_CONTEXT_TYPE,
+                                          SHARED_DOCUMENT_TYPE)
 from manager_rest.models import (BlueprintState,
                                  Snapshot,
                                  Deployment,
@@ -32,15 +50,6 @@ from manager_rest.models import (BlueprintState,
 from manager_rest.manager_elasticsearch import ManagerElasticsearch
 
 STORAGE_INDEX_NAME = 'cloudify_storage'
-NODE_TYPE = 'node'
-NODE_INSTANCE_TYPE = 'node_instance'
-PLUGIN_TYPE = 'plugin'
-BLUEPRINT_TYPE = 'blueprint'
-SNAPSHOT_TYPE = 'snapshot'
-DEPLOYMENT_TYPE = 'deployment'
-DEPLOYMENT_MODIFICATION_TYPE = 'deployment_modification'
-EXECUTION_TYPE = 'execution'
-PROVIDER_CONTEXT_TYPE = 'provider_context'
 PROVIDER_CONTEXT_ID = 'CONTEXT'
 
 
@@ -48,19 +57,101 @@ MUTATE_PARAMS = {
     'refresh': True
 }
 
+# Write visibility modes, configurable per document type:
+# strict - every mutation refreshes the index, so it is immediately visible
+#          to searches.
+# read_your_writes - mutations don't refresh the index. Gets are realtime,
+#                    and a search (or delete by query) of a document type
+#                    which was mutated by this process refreshes the index
+#                    first. Mutations are only tracked per process, so a
+#                    search served by another worker process than the
+#                    mutation isn't guaranteed to see it.
+# periodic - mutations become visible to searches after the index refresh
+#            interval. Only deletes by query refresh the index first.
+STRICT = 'strict'
+READ_YOUR_WRITES = 'read_your_writes'
+PERIODIC = 'periodic'
+WRITE_VISIBILITY_MODES = (STRICT, READ_YOUR_WRITES, PERIODIC)
+
+# document type -> number of mutations of its documents by this process
+_mutations = defaultdict(int)
+# document type -> number of its mutations which the last completed index
+# refresh covers
+_refreshed_mutations = defaultdict(int)
+_mutations_lock = threading.Lock()
+
+# number of documents sent to elasticsearch in a single bulk request
+BULK_CHUNK_SIZE = 500
+
 
 class ESStorageManager(object):
 
     def __init__(self, host, port):
         self.es_host = host
         self.es_port = port
+        self.shared_documents_cache = shared_documents.SharedDocumentCache(
+            config.instance().shared_document_cache_size,
+            config.instance().plan_cache_generation_path)
 
     @property
     def _connection(self):
-        return Elasticsearch(hosts=[{'host': self.es_host,
-                                     'port': self.es_port}])
+        return manager_elasticsearch.get_client(self.es_host, self.es_port)
+
+    @staticmethod
+    def _write_visibility(doc_type):
+        cfy_config = config.instance()
+        mode = cfy_config.db_write_visibility_per_type.get(
+            doc_type, cfy_config.db_write_visibility)
+        if mode not in WRITE_VISIBILITY_MODES:
+            raise RuntimeError(
+                'Invalid write visibility mode for {0}: {1} (expected one of '
+                '{2})'.format(doc_type, mode,
+                              ', '.join(WRITE_VISIBILITY_MODES)))
+        return mode
+
+    def _mutate(self, operation, doc_type, **kwargs):
+        """
+        Call an elasticsearch mutation API on a document of the storage
+        index, according to the write visibility mode of its type.
+        """
+        strict = self._write_visibility(doc_type) == STRICT
+        if strict:
+            kwargs.update(MUTATE_PARAMS)
+        result = operation(index=STORAGE_INDEX_NAME, doc_type=doc_type,
+                           **kwargs)
+        if not strict:
+            self._mark_unrefreshed(doc_type)
+        return result
+
+    @staticmethod
+    def _mark_unrefreshed(doc_type):
+        with _mutations_lock:
+            _mutations[doc_type] += 1
+
+    def _refresh_if_unrefreshed(self, doc_type, force=False):
+        """
+        Refresh the storage index before searching documents of the given
+        type, if they were mutated without a refresh and the type's mode
+        requires them to be visible (`force` requires it for any mode).
+        """
+        if not force and self._write_visibility(doc_type) != READ_YOUR_WRITES:
+            return
+        with _mutations_lock:
+            if _refreshed_mutations[doc_type] >= _mutations[doc_type]:
+                return
+            # a refresh covers the whole index, including every mutation
+            # which completed before it started
+            covered = dict(_mutations)
+        self._connection.indices.refresh(index=STORAGE_INDEX_NAME)
+        # the mutations only count as refreshed once the refresh returns, so
+        # concurrent searches refresh the index themselves meanwhile
+        with _mutations_lock:
+            for mutated_type, count in covered.iteritems():
+                _refreshed_mutations[mutated_type] = max(
+                    _refreshed_mutations[mutated_type], count)
 
     def _list_docs(self, doc_type, model_class, body=None, fields=None):
+        self._refresh_if_unrefreshed(doc_type)
         include = list(fields) if fields else True
         result = self._connection.search(index=STORAGE_INDEX_NAME,
                                          doc_type=doc_type,
@@ -72,12 +163,32 @@ class ESStorageManager(object):
         if doc_type == NODE_INSTANCE_TYPE:
             for doc in docs:
                 doc['version'] = None
+        # the shared documents of the whole page are fetched at once
+        self._resolve_references(docs)
         items = [self._fill_missing_fields_and_deserialize(doc, model_class)
                  for doc in docs]
         metadata = ManagerElasticsearch.build_list_result_metadata(body,
                                                                    result)
         return ListResult(items, metadata)
 
+    def _iter_docs(self, doc_type, model_class, body=None, fields=None):
+        self._refresh_if_unrefreshed(doc_type)
+        include = list(fields) if fields else True
+        total, hits = ManagerElasticsearch.scroll(STORAGE_INDEX_NAME,
+                                                  body,
+                                                  doc_type=doc_type,
+                                                  _source=include,
+                                                  connection=self._connection)
+
+        def _items():
+            for hit in hits:
+                doc = hit['_source']
+                if doc_type == NODE_INSTANCE_TYPE:
+                    doc['version'] = None
+                yield self._fill_missing_fields_and_deserialize(doc,
+                                                                model_class)
+        return StreamResult(_items(), total)
+
     def _get_doc(self, doc_type, doc_id, fields=None):
         try:
             if fields:
@@ -93,11 +204,33 @@ class ESStorageManager(object):
             raise manager_exceptions.NotFoundError(
                 '{0} {1} not found'.format(doc_type, doc_id))
 
+    def _get_docs(self, doc_type, doc_ids, fields=None):
+        """
+        Get multiple documents using a single multi-get request.
+
+        :return: the documents, in the order of `doc_ids`.
+        """
+        if not doc_ids:
+            return []
+        params = {'_source': list(fields)} if fields else {}
+        result = self._connection.mget(index=STORAGE_INDEX_NAME,
+                                       doc_type=doc_type,
+                                       body={'ids': list(doc_ids)},
+                                       **params)
+        missing = [doc['_id'] for doc in result['docs']
+                   if not doc.get('found')]
+        if missing:
+            raise manager_exceptions.NotFoundError(
+                '{0} {1} not found'.format(doc_type, ', '.join(missing)))
+        return result['docs']
+
     def _get_doc_and_deserialize(self, doc_type, doc_id, model_class,
                                  fields=None):
         doc = self._get_doc(doc_type, doc_id, fields)
         if not fields:
-            return model_class(**doc['_source'])
+            source = storage_codec.decode_document(doc['_source'])
+            self._resolve_references([source])
+            return model_class(**source)
         else:
             if len(fields) != len(doc['_source']):
                 missing_fields = [field for field in fields if field not
@@ -109,20 +242,153 @@ class ESStorageManager(object):
                                                              model_class)
 
     def _put_doc_if_not_exists(self, doc_type, doc_id, value):
+        value, shared = shared_documents.share_document(doc_type, value)
+        self._put_shared_documents(value.get('blueprint_id'), shared)
         try:
-            self._connection.create(index=STORAGE_INDEX_NAME,
-                                    doc_type=doc_type, id=doc_id,
-                                    body=value,
-                                    **MUTATE_PARAMS)
+            self._mutate(self._connection.create, doc_type,
+                         id=doc_id,
+                         body=storage_codec.encode_document(doc_type, value))
         except elasticsearch.exceptions.ConflictError:
             raise manager_exceptions.ConflictError(
                 '{0} {1} already exists'.format(doc_type, doc_id))
 
+    def _put_docs_if_not_exist(self, doc_type, docs):
+        """
+        Create documents using the bulk API, with a single refresh once all
+        of them were written. Documents which already exist are left
+        untouched; the ids of all such documents are reported by a single
+        ConflictError, raised after the other documents were created.
+
+        :param doc_type: the type of the created documents.
+        :param docs: an iterable of (document id, document body) tuples.
+        :return: the number of created documents.
+        """
+        # the values of the written shared documents, by id
+        shared_values = {}
+
+        def _actions():
+            for doc_id, value in docs:
+                value, shared = shared_documents.share_document(doc_type,
+                                                                value)
+                # the shared documents a document references are written
+                # before it, by the same bulk request, unless they are
+                # known to exist
+                for shared_id, shared_value in shared.iteritems():
+                    if shared_id in shared_values or \
+                            self.shared_documents_cache.contains(shared_id):
+                        continue
+                    shared_values[shared_id] = shared_value
+                    yield self._shared_document_action(
+                        shared_id, value.get('blueprint_id'), shared_value)
+                yield {'_op_type': 'create',
+                       '_index': STORAGE_INDEX_NAME,
+                       '_type': doc_type,
+                       '_id': doc_id,
+                       '_source': storage_codec.encode_document(doc_type,
+                                                                value)}
+        created = 0
+        conflicts = []
+        failures = []
+        for ok, item in elasticsearch.helpers.streaming_bulk(
+                self._connection, _actions(), chunk_size=BULK_CHUNK_SIZE,
+                raise_on_error=False):
+            result = item['create']
+            if result.get('_type') == SHARED_DOCUMENT_TYPE:
+                if ok or result.get('status') == 409:
+                    self.shared_documents_cache.put_many(
+                        {result['_id']: shared_values[result['_id']]})
+                else:
+                    failures.append('{0}: {1}'.format(result['_id'],
+                                                      result.get('error')))
+                continue
+            if ok:
+                created += 1
+            elif result.get('status') == 409:
+                conflicts.append(result['_id'])
+            else:
+                failures.append('{0}: {1}'.format(result['_id'],
+                                                  result.get('error')))
+        if shared_values:
+            self._mark_unrefreshed(SHARED_DOCUMENT_TYPE)
+        if created:
+            if self._write_visibility(doc_type) == STRICT:
+                self._connection.indices.refresh(index=STORAGE_INDEX_NAME)
+            else:
+                self._mark_unrefreshed(doc_type)
+        if failures:
+            raise RuntimeError('Failed creating {0} documents: {1}'.format(
+                doc_type, ', '.join(failures)))
+        if conflicts:
+            raise manager_exceptions.ConflictError(
+                'Some {0} documents already exist: {1}'.format(
+                    doc_type, ', '.join(conflicts)))
+        return created
+
+    @staticmethod
+    def _shared_document_action(shared_id, blueprint_id, value):
+        return {'_op_type': 'create',
+                '_index': STORAGE_INDEX_NAME,
+                '_type': SHARED_DOCUMENT_TYPE,
+                '_id': shared_id,
+                '_source': {'id': shared_id,
+                            'blueprint_id': blueprint_id,
+                            'value': storage_codec.encode(value)}}
+
+    def _put_shared_documents(self, blueprint_id, shared):
+        """
+        Create shared documents using the bulk API. Shared documents are
+        identified by their content, so those which already exist are left
+        untouched, and those which are cached aren't written at all. They
+        are only ever read by id, so the index isn't refreshed; only deleting
+        them by query refreshes it first.
+        """
+        shared = {shared_id: value for shared_id, value in shared.iteritems()
+                  if not self.shared_documents_cache.contains(shared_id)}
+        if not shared:
+            return
+        self._mark_unrefreshed(SHARED_DOCUMENT_TYPE)
+        actions = (self._shared_document_action(shared_id, blueprint_id,
+                                                value)
+                   for shared_id, value in shared.iteritems())
+        failures = []
+        for ok, item in elasticsearch.helpers.streaming_bulk(
+                self._connection, actions, chunk_size=BULK_CHUNK_SIZE,
+                raise_on_error=False):
+            result = item['create']
+            if ok or result.get('status') == 409:
+                self.shared_documents_cache.put_many(
+                    {result['_id']: shared[result['_id']]})
+            else:
+                failures.append('{0}: {1}'.format(result['_id'],
+                                                  result.get('error')))
+        if failures:
+            raise RuntimeError('Failed creating shared documents: {0}'
+                               .format(', '.join(failures)))
+
+    def _fetch_shared_documents(self, shared_ids):
+        docs = self._get_docs(SHARED_DOCUMENT_TYPE, shared_ids)
+        return {doc['_id']: storage_codec.decode(doc['_source']['value'])
+                for doc in docs}
+
+    def _resolve_references(self, docs):
+        return shared_documents.resolve_references(
+            docs, self._fetch_shared_documents, self.shared_documents_cache)
+
+    def decode_documents(self, docs):
+        """
+        Decode the stored form of documents read directly from the storage
+        index in place: decompress their compressed fields and resolve
+        their references to shared documents.
+        """
+        for doc in docs:
+            storage_codec.decode_document(doc)
+        self._resolve_references(docs)
+        return docs
+
     def _delete_doc(self, doc_type, doc_id, model_class, id_field='id'):
         try:
-            res = self._connection.delete(STORAGE_INDEX_NAME, doc_type,
-                                          doc_id,
-                                          **MUTATE_PARAMS)
+            res = self._mutate(self._connection.delete, doc_type,
+                               id=doc_id)
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 "{0} {1} not found".format(doc_type, doc_id))
@@ -134,12 +400,17 @@ class ESStorageManager(object):
                                                          model_class)
 
     def _delete_doc_by_query(self, doc_type, query):
+        # documents which aren't visible to searches yet would not be deleted
+        self._refresh_if_unrefreshed(doc_type, force=True)
         self._connection.delete_by_query(index=STORAGE_INDEX_NAME,
                                          doc_type=doc_type,
                                          body=query)
+        if self._write_visibility(doc_type) != STRICT:
+            self._mark_unrefreshed(doc_type)
 
-    @staticmethod
-    def _fill_missing_fields_and_deserialize(fields_data, model_class):
+    def _fill_missing_fields_and_deserialize(self, fields_data, model_class):
+        storage_codec.decode_document(fields_data)
+        self._resolve_references([fields_data])
         for field in model_class.fields:
             if field not in fields_data:
                 fields_data[field] = None
@@ -196,6 +467,23 @@ class ESStorageManager(object):
                                       **doc['_source'])
         return node
 
+    def get_node_instances_by_ids(self, node_instance_ids, include=None):
+        docs = self._get_docs(NODE_INSTANCE_TYPE,
+                              node_instance_ids,
+                              fields=include)
+        return [self._fill_missing_fields_and_deserialize(
+            dict(doc['_source'], version=doc['_version']),
+            DeploymentNodeInstance) for doc in docs]
+
+    def get_nodes_by_ids(self, deployment_id, node_ids, include=None):
+        storage_node_ids = [self._storage_node_id(deployment_id, node_id)
+                            for node_id in node_ids]
+        docs = self._get_docs(NODE_TYPE, storage_node_ids, fields=include)
+        self._resolve_references([doc['_source'] for doc in docs])
+        return [self._fill_missing_fields_and_deserialize(doc['_source'],
+                                                          DeploymentNode)
+                for doc in docs]
+
     def get_node(self, deployment_id, node_id, include=None):
         storage_node_id = self._storage_node_id(deployment_id, node_id)
         return self._get_doc_and_deserialize(doc_id=storage_node_id,
@@ -240,6 +528,84 @@ class ESStorageManager(object):
                                body=body,
                                fields=include)
 
+    def _iter_items(self, doc_type, model_class, include=None,
+                    filters=None, sort=None):
+        body = ManagerElasticsearch.build_request_body(filters=filters,
+                                                       sort=sort,
+                                                       skip_size=True)
+        return self._iter_docs(doc_type,
+                               model_class,
+                               body=body,
+                               fields=include)
+
+    def count(self, doc_type, filters=None):
+        self._refresh_if_unrefreshed(doc_type)
+        body = ManagerElasticsearch.build_request_body(filters=filters,
+                                                       skip_size=True)
+        result = self._connection.count(index=STORAGE_INDEX_NAME,
+                                        doc_type=doc_type,
+                                        body=body)
+        return result['count']
+
+    def exists(self, doc_type, filters=None):
+        self._refresh_if_unrefreshed(doc_type)
+        body = ManagerElasticsearch.build_request_body(filters=filters,
+                                                       skip_size=True)
+        body['size'] = 0
+        # every shard stops collecting after its first matching document
+        result = self._connection.search(index=STORAGE_INDEX_NAME,
+                                         doc_type=doc_type,
+                                         body=body,
+                                         params={'terminate_after': 1})
+        return result['hits']['total'] > 0
+
+    def summarize(self, doc_type, target_fields, filters=None):
+        self._refresh_if_unrefreshed(doc_type)
+        body = ManagerElasticsearch.build_request_body(filters=filters,
+                                                       skip_size=True)
+        body['size'] = 0
+        # nest a terms aggregation per target field, in order. A size of
+        # 0 returns all the terms of a field.
+        aggregations = None
+        for field in reversed(target_fields):
+            aggregation = {'terms': {'field': field, 'size': 0}}
+            if aggregations:
+                aggregation['aggs'] = aggregations
+            aggregations = {field: aggregation}
+        body['aggs'] = aggregations
+        result = self._connection.search(index=STORAGE_INDEX_NAME,
+                                         doc_type=doc_type,
+                                         body=body)
+        return self._flatten_aggregations(result['aggregations'],
+                                          target_fields)
+
+    @classmethod
+    def _flatten_aggregations(cls, aggregations, target_fields, group=None):
+        field = target_fields[0]
+        items = []
+        for bucket in aggregations[field]['buckets']:
+            bucket_group = dict(group or {})
+            bucket_group[field] = bucket['key']
+            if len(target_fields) > 1:
+                items.extend(cls._flatten_aggregations(
+                    bucket, target_fields[1:], bucket_group))
+            else:
+                bucket_group['count'] = bucket['doc_count']
+                items.append(bucket_group)
+        return items
+
+    def iter_executions(self, include=None, filters=None, sort=None):
+        return self._iter_items(EXECUTION_TYPE, Execution,
+                                include=include, filters=filters, sort=sort)
+
+    def iter_nodes(self, include=None, filters=None, sort=None):
+        return self._iter_items(NODE_TYPE, DeploymentNode,
+                                include=include, filters=filters, sort=sort)
+
+    def iter_node_instances(self, include=None, filters=None, sort=None):
+        return self._iter_items(NODE_INSTANCE_TYPE, DeploymentNodeInstance,
+                                include=include, filters=filters, sort=sort)
+
     def get_blueprint(self, blueprint_id, include=None):
         return self._get_doc_and_deserialize(BLUEPRINT_TYPE,
                                              blueprint_id,
@@ -304,9 +670,47 @@ class ESStorageManager(object):
                                     doc_data)
         return 1
 
+    def put_nodes_bulk(self, nodes):
+        docs = ((self._storage_node_id(node.deployment_id, node.id),
+                 node.to_dict()) for node in nodes)
+        return self._put_docs_if_not_exist(NODE_TYPE, docs)
+
+    def put_node_instances_bulk(self, node_instances):
+        def _doc(node_instance):
+            doc_data = node_instance.to_dict()
+            del(doc_data['version'])
+            return str(node_instance.id), doc_data
+        return self._put_docs_if_not_exist(
+            NODE_INSTANCE_TYPE,
+            (_doc(instance) for instance in node_instances))
+
+    def replace_node_instances(self, deployment_id, node_instances):
+        """
+        Replace all the node instances of a deployment.
+
+        Elasticsearch has no multi-document transactions, so the old node
+        instances are deleted by a single query before the new ones are
+        bulk indexed.
+        """
+        query = ManagerElasticsearch.build_request_body(
+            filters={'deployment_id': deployment_id},
+            skip_size=True
+        )
+        self._delete_doc_by_query(NODE_INSTANCE_TYPE, query)
+        return self.put_node_instances_bulk(node_instances)
+
     def delete_blueprint(self, blueprint_id):
-        return self._delete_doc(BLUEPRINT_TYPE, blueprint_id,
-                                BlueprintState)
+        blueprint = self._delete_doc(BLUEPRINT_TYPE, blueprint_id,
+                                     BlueprintState)
+        # the blueprint has no deployments, so nothing references its
+        # shared documents anymore
+        query = ManagerElasticsearch.build_request_body(
+            filters={'blueprint_id': blueprint_id},
+            skip_size=True
+        )
+        self._delete_doc_by_query(SHARED_DOCUMENT_TYPE, query)
+        self.shared_documents_cache.clear()
+        return blueprint
 
     def delete_plugin(self, plugin_id):
         return self._delete_doc(PLUGIN_TYPE, plugin_id, Plugin)
@@ -320,11 +724,9 @@ class ESStorageManager(object):
                            'error': error}
         update_doc = {'doc': update_doc_data}
         try:
-            self._connection.update(index=STORAGE_INDEX_NAME,
-                                    doc_type=SNAPSHOT_TYPE,
-                                    id=str(snapshot_id),
-                                    body=update_doc,
-                                    **MUTATE_PARAMS)
+            self._mutate(self._connection.update, SNAPSHOT_TYPE,
+                         id=str(snapshot_id),
+                         body=update_doc)
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 "Snapshot {0} not found".format(snapshot_id))
@@ -335,11 +737,9 @@ class ESStorageManager(object):
         update_doc = {'doc': update_doc_data}
 
         try:
-            self._connection.update(index=STORAGE_INDEX_NAME,
-                                    doc_type=EXECUTION_TYPE,
-                                    id=str(execution_id),
-                                    body=update_doc,
-                                    **MUTATE_PARAMS)
+            self._mutate(self._connection.update, EXECUTION_TYPE,
+                         id=str(execution_id),
+                         body=update_doc)
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 "Execution {0} not found".format(execution_id))
@@ -347,11 +747,9 @@ class ESStorageManager(object):
     def update_provider_context(self, provider_context):
         doc_data = {'doc': provider_context.to_dict()}
         try:
-            self._connection.update(index=STORAGE_INDEX_NAME,
-                                    doc_type=PROVIDER_CONTEXT_TYPE,
-                                    id=PROVIDER_CONTEXT_ID,
-                                    body=doc_data,
-                                    **MUTATE_PARAMS)
+            self._mutate(self._connection.update, PROVIDER_CONTEXT_TYPE,
+                         id=PROVIDER_CONTEXT_ID,
+                         body=doc_data)
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 'Provider Context not found')
@@ -390,45 +788,224 @@ class ESStorageManager(object):
                 'planned_number_of_instances'] = planned_number_of_instances
         update_doc = {'doc': update_doc_data}
         try:
-            self._connection.update(index=STORAGE_INDEX_NAME,
-                                    doc_type=NODE_TYPE,
-                                    id=storage_node_id,
-                                    body=update_doc,
-                                    **MUTATE_PARAMS)
+            self._mutate(self._connection.update, NODE_TYPE,
+                         id=storage_node_id,
+                         body=update_doc)
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 "Node {0} not found".format(node_id))
 
     def update_node_instance(self, node):
-        new_state = node.state
-        new_runtime_props = node.runtime_properties
-        new_relationships = node.relationships
-
-        current = self.get_node_instance(node.id)
-        # Validate version - this is not 100% safe since elasticsearch
-        # update doesn't accept the version field.
-        if node.version != 0 and current.version != node.version:
+        """
+        Update the state, runtime properties and/or relationships of a node
+        instance. Unless `node.version` is 0, the update is only applied if
+        the stored node instance version matches it; elasticsearch checks
+        the version as part of the write, so concurrent updates can't
+        overwrite each other.
+
+        :return: the updated node instance, including its new version.
+        """
+        version_params = {} if node.version == 0 else {'version': node.version}
+        try:
+            if node.runtime_properties is None:
+                updated, version = self._update_node_instance_doc(
+                    node, version_params)
+            else:
+                updated, version = self._replace_node_instance_doc(
+                    node, version_params)
+        except elasticsearch.exceptions.ConflictError:
             raise manager_exceptions.ConflictError(
-                'Node instance update conflict [current_version={0}, updated_'
-                'version={1}]'.format(current.version, node.version))
-
-        if new_state is not None:
-            current.state = new_state
-
-        if new_runtime_props is not None:
-            current.runtime_properties = new_runtime_props
-
-        if new_relationships is not None:
-            current.relationships = new_relationships
-
-        updated = current.to_dict()
-        del updated['version']
+                'Node instance update conflict [updated_version={0}]'
+                .format(node.version))
+        except elasticsearch.exceptions.NotFoundError:
+            raise manager_exceptions.NotFoundError(
+                "Node instance {0} not found".format(node.id))
+        return DeploymentNodeInstance(version=version, **updated)
 
-        self._connection.index(index=STORAGE_INDEX_NAME,
-                               doc_type=NODE_INSTANCE_TYPE,
-                               id=node.id,
-                               body=updated,
-                               **MUTATE_PARAMS)
+    def _update_node_instance_doc(self, node, version_params):
+        update_doc_data = {}
+        if node.state is not None:
+            update_doc_data['state'] = node.state
+        if node.relationships is not None:
+            update_doc_data['relationships'] = node.relationships
+        result = self._mutate(self._connection.update, NODE_INSTANCE_TYPE,
+                              id=node.id,
+                              body={'doc': update_doc_data},
+                              fields='_source',
+                              **version_params)
+        return result['get']['_source'], result['_version']
+
+    def _replace_node_instance_doc(self, node, version_params):
+        # a partial update merges maps, so it can't remove runtime
+        # properties. Instead, the whole document is conditionally
+        # re-indexed.
+        current = self._get_doc(NODE_INSTANCE_TYPE, node.id)
+        if version_params and current['_version'] != node.version:
+            raise manager_exceptions.ConflictError(
+                'Node instance update conflict [current_version={0}, updated_'
+                'version={1}]'.format(current['_version'], node.version))
+        updated = current['_source']
+        updated['runtime_properties'] = node.runtime_properties
+        if node.state is not None:
+            updated['state'] = node.state
+        if node.relationships is not None:
+            updated['relationships'] = node.relationships
+        result = self._mutate(self._connection.index, NODE_INSTANCE_TYPE,
+                              id=node.id,
+                              body=updated,
+                              **version_params)
+        return updated, result['_version']
+
+    def patch_node_instance(self, node_instance_id, version,
+                            runtime_properties_patch, state=None):
+        """
+        Apply a JSON merge patch (RFC 7396) to the runtime properties of a
+        node instance, and optionally set its state. Unless `version` is 0,
+        the patch is only applied if the stored node instance version
+        matches it.
+
+        :return: the new version of the node instance.
+        """
+        version_params = {} if version == 0 else {'version': version}
+        try:
+            if utils.merge_patch_removes_keys(runtime_properties_patch):
+                # a partial update can't remove keys
+                current = self._get_doc(NODE_INSTANCE_TYPE, node_instance_id)
+                if version_params and current['_version'] != version:
+                    raise manager_exceptions.ConflictError(
+                        'Node instance update conflict [current_version={0},'
+                        ' updated_version={1}]'.format(current['_version'],
+                                                       version))
+                updated = current['_source']
+                updated['runtime_properties'] = utils.merge_patch(
+                    updated.get('runtime_properties'),
+                    runtime_properties_patch)
+                if state is not None:
+                    updated['state'] = state
+                result = self._mutate(self._connection.index,
+                                      NODE_INSTANCE_TYPE,
+                                      id=node_instance_id,
+                                      body=updated,
+                                      **version_params)
+            else:
+                # partial updates merge maps recursively, just like a merge
+                # patch without null values
+                update_doc_data = {
+                    'runtime_properties': runtime_properties_patch}
+                if state is not None:
+                    update_doc_data['state'] = state
+                result = self._mutate(self._connection.update,
+                                      NODE_INSTANCE_TYPE,
+                                      id=node_instance_id,
+                                      body={'doc': update_doc_data},
+                                      **version_params)
+        except elasticsearch.exceptions.ConflictError:
+            raise manager_exceptions.ConflictError(
+                'Node instance update conflict [updated_version={0}]'
+                .format(version))
+        except elasticsearch.exceptions.NotFoundError:
+            raise manager_exceptions.NotFoundError(
+                "Node instance {0} not found".format(node_instance_id))
+        return result['_version']
+
+    def update_node_instances(self, node_updates, atomic=False):
+        """
+        Update the state and/or runtime properties of multiple node
+        instances, using a single multi-get request and a single bulk
+        request. Unless its version is 0, each update is only applied if
+        the stored node instance version matches it; elasticsearch checks
+        the version as part of the write.
+
+        When `atomic` is set, no update is applied unless the versions of
+        all of them match. Elasticsearch has no multi-document
+        transactions, so a node instance which changes between the check
+        and the bulk write still fails its own update only.
+
+        :param node_updates: node instance updates with unique ids.
+        :return: for each update, in order, either the updated node
+         instance or the ManagerException its update failed with. An update
+         which elasticsearch failed writing fails with a StorageError of
+         the status elasticsearch answered with, while the other updates
+         are still applied.
+        """
+        node_updates = list(node_updates)
+        if not node_updates:
+            return []
+        docs = self._connection.mget(
+            index=STORAGE_INDEX_NAME,
+            doc_type=NODE_INSTANCE_TYPE,
+            body={'ids': [node.id for node in node_updates]})['docs']
+        results = []
+        for node, doc in zip(node_updates, docs):
+            if not doc.get('found'):
+                results.append(manager_exceptions.NotFoundError(
+                    'Node instance {0} not found'.format(node.id)))
+            elif node.version != 0 and doc['_version'] != node.version:
+                results.append(manager_exceptions.ConflictError(
+                    'Node instance update conflict [current_version={0}, '
+                    'updated_version={1}]'.format(doc['_version'],
+                                                  node.version)))
+            else:
+                updated = doc['_source']
+                if node.state is not None:
+                    updated['state'] = node.state
+                if node.runtime_properties is not None:
+                    updated['runtime_properties'] = node.runtime_properties
+                results.append(updated)
+        if atomic and any(isinstance(result,
+                                     manager_exceptions.ManagerException)
+                          for result in results):
+            return reject_updates(results)
+
+        def _actions():
+            for node, updated in zip(node_updates, results):
+                if isinstance(updated, manager_exceptions.ManagerException):
+                    continue
+                action = {'_op_type': 'index',
+                          '_index': STORAGE_INDEX_NAME,
+                          '_type': NODE_INSTANCE_TYPE,
+                          '_id': node.id,
+                          '_source': updated}
+                if node.version != 0:
+                    action['_version'] = node.version
+                yield action
+        # node instance id -> its new version, None if it changed since it
+        # was read, or the exception its write failed with otherwise
+        versions = {}
+        for ok, item in elasticsearch.helpers.streaming_bulk(
+                self._connection, _actions(), chunk_size=BULK_CHUNK_SIZE,
+                raise_on_error=False):
+            result = item['index']
+            if ok:
+                versions[result['_id']] = result['_version']
+            elif result.get('status') == 409:
+                # the node instance changed since it was read
+                versions[result['_id']] = None
+            else:
+                versions[result['_id']] = manager_exceptions.StorageError(
+                    result.get('status', 500),
+                    'Failed updating node instance {0}: {1}'.format(
+                        result['_id'], result.get('error')))
+        if any(isinstance(version, (int, long))
+               for version in versions.itervalues()):
+            if self._write_visibility(NODE_INSTANCE_TYPE) == STRICT:
+                self._connection.indices.refresh(index=STORAGE_INDEX_NAME)
+            else:
+                self._mark_unrefreshed(NODE_INSTANCE_TYPE)
+
+        def _result(node, source):
+            if isinstance(source, manager_exceptions.ManagerException):
+                return source
+            version = versions[node.id]
+            if version is None:
+                return manager_exceptions.ConflictError(
+                    'Node instance update conflict [updated_version={0}]'
+                    .format(node.version))
+            if isinstance(version, manager_exceptions.ManagerException):
+                return version
+            return DeploymentNodeInstance(version=version, **source)
+        return [_result(node, source)
+                for node, source in zip(node_updates, results)]
 
     def put_provider_context(self, provider_context):
         doc_data = provider_context.to_dict()
@@ -466,11 +1043,10 @@ class ESStorageManager(object):
 
         update_doc = {'doc': update_doc_data}
         try:
-            self._connection.update(index=STORAGE_INDEX_NAME,
-                                    doc_type=DEPLOYMENT_MODIFICATION_TYPE,
-                                    id=modification_id,
-                                    body=update_doc,
-                                    **MUTATE_PARAMS)
+            self._mutate(self._connection.update,
+                         DEPLOYMENT_MODIFICATION_TYPE,
+                         id=modification_id,
+                         body=update_doc)
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 "Modification {0} not found".format(modification_id))
@@ -0,0 +1,99 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Strong entity tags of single resources, for conditional requests.
+
+The tag of a resource is computed off the model, so that it can be compared
+with the request's `If-None-Match` header before the model is marshalled,
+and depends on the marshalled fields. Hashing the values of all the
+marshalled fields is the fallback for models which change in place without
+a version:
+- Versioned models (node instances) are tagged by their version, which
+  changes with every update. It prefixes the tag, which lets a client pass
+  the tag it got back as the `If-Match` header of an update, instead of the
+  version.
+- Immutable models (blueprints) declare the fields which identify their
+  content in an `identity_fields` class variable, such as their id and
+  creation time, which tell apart models of a reused id.
+"""
+
+import json
+import hashlib
+
+from manager_rest import manager_exceptions
+
+_VERSION_SEPARATOR = '-'
+
+
+def make_etag(response_class, field_names, item):
+    """
+    :param response_class: the response class the item is marshalled with.
+    :param field_names: the names of the marshalled fields.
+    :param item: a model or a dict.
+    :return: the item's entity tag, unquoted.
+    """
+    if isinstance(item, dict):
+        read = item.get
+    else:
+        def read(name):
+            return getattr(item, name, None)
+    field_names = sorted(field_names)
+    version = read('version')
+    if isinstance(version, (int, long)):
+        return '{0}{1}{2}'.format(version, _VERSION_SEPARATOR,
+                                  _digest(field_names))
+    identity = [read(name) for name in getattr(item, 'identity_fields', ())]
+    if identity and None not in identity:
+        return _digest([field_names, identity])
+    values = []
+    for name in field_names:
+        field = response_class.resource_fields[name]
+        values.append((name, read(getattr(field, 'attribute', None) or name)))
+    return _digest(values)
+
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True,
+                                   default=unicode)).hexdigest()
+
+
+def version_from_etags(etags):
+    """
+    :param etags: the parsed `If-Match` header of a request
+     (`werkzeug.datastructures.ETags`).
+    :return: the version the request's update is conditioned on, 0 for
+     `If-Match: *` (which makes the update unconditional), or None if the
+     request has no `If-Match` header.
+    """
+    if etags.star_tag:
+        return 0
+    strong_tags = etags.as_set()
+    if not strong_tags:
+        if etags:
+            raise manager_exceptions.BadParametersError(
+                'If-Match header must contain a strong entity tag')
+        return None
+    if len(strong_tags) > 1:
+        raise manager_exceptions.BadParametersError(
+            'If-Match header must contain a single entity tag, got {0}'
+            .format(', '.join(sorted(strong_tags))))
+    etag, = strong_tags
+    version = etag.split(_VERSION_SEPARATOR, 1)[0]
+    if _VERSION_SEPARATOR not in etag or not version.isdigit():
+        raise manager_exceptions.BadParametersError(
+            'If-Match header entity tag {0} does not hold a version'
+            .format(etag))
+    return int(version)
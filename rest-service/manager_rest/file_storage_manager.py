@@ -15,8 +15,14 @@
 
 import os
 import json
-
-from manager_rest.storage_manager import ListResult
+import heapq
+import threading
+from collections import Counter, defaultdict
+from functools import total_ordering
+from operator import attrgetter
+
+from manager_rest import storage_manager
+from manager_rest.storage_manager import ListResult, StreamResult
 from manager_rest.models import (BlueprintState,
                                  Deployment,
                                  DeploymentModification,
@@ -25,8 +31,12 @@ from manager_rest.models import (BlueprintState,
                                  DeploymentNode,
                                  DeploymentNodeInstance,
                                  ProviderContext,
+                                 SharedDocument,
                                  Snapshot)
 from manager_rest import manager_exceptions
+from manager_rest import shared_documents
+from manager_rest import storage_codec
+from manager_rest import utils
 
 STORAGE_FILE_PATH = '/tmp/manager-rest-tests-storage.json'
 
@@ -40,250 +50,582 @@ PLUGINS = 'plugins'
 SNAPSHOTS = 'snapshots'
 PROVIDER_CONTEXT = 'provider_context'
 PROVIDER_CONTEXT_ID = '1'
+SHARED_DOCUMENTS = 'shared_documents'
+
+# number of operation log records after which the log is compacted into the
+# storage file
+LOG_COMPACTION_THRESHOLD = 1000
+
+# fields which have a hash index, for the item types which have them
+INDEXED_FIELDS = ('deployment_id',
+                  'blueprint_id',
+                  'node_id',
+                  'status',
+                  'workflow_id')
+
+MODEL_CLASSES = {
+    NODES: DeploymentNode,
+    NODE_INSTANCES: DeploymentNodeInstance,
+    BLUEPRINTS: BlueprintState,
+    DEPLOYMENTS: Deployment,
+    DEPLOYMENT_MODIFICATIONS: DeploymentModification,
+    EXECUTIONS: Execution,
+    PLUGINS: Plugin,
+    PROVIDER_CONTEXT: ProviderContext,
+    SNAPSHOTS: Snapshot,
+    SHARED_DOCUMENTS: SharedDocument
+}
+
+DOC_TYPE_KEYS = {
+    storage_manager.NODE_TYPE: NODES,
+    storage_manager.NODE_INSTANCE_TYPE: NODE_INSTANCES,
+    storage_manager.BLUEPRINT_TYPE: BLUEPRINTS,
+    storage_manager.DEPLOYMENT_TYPE: DEPLOYMENTS,
+    storage_manager.DEPLOYMENT_MODIFICATION_TYPE: DEPLOYMENT_MODIFICATIONS,
+    storage_manager.EXECUTION_TYPE: EXECUTIONS,
+    storage_manager.PLUGIN_TYPE: PLUGINS,
+    storage_manager.SNAPSHOT_TYPE: SNAPSHOTS,
+    storage_manager.PROVIDER_CONTEXT_TYPE: PROVIDER_CONTEXT,
+    storage_manager.SHARED_DOCUMENT_TYPE: SHARED_DOCUMENTS
+}
+
+KEY_DOC_TYPES = {key: doc_type for doc_type, key in DOC_TYPE_KEYS.iteritems()}
+
+
+@total_ordering
+class _Descending(object):
+    """
+    Wraps a sort key value, reversing its order
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
 
+    def __eq__(self, other):
+        return self.value == other.value
 
-def sort_list(list_of_objects, sort=None):
-    if not sort:
-        return list_of_objects
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _sort_key(sort):
+    """
+    Build a composite key function, which sorts by all the sort fields in a
+    single pass. The first sort field takes precedence.
+    :return: a (key function, reverse) tuple
+    """
+    orders = set(sort.values())
+    if len(orders) == 1:
+        # a single order doesn't need wrapped values
+        return attrgetter(*sort.keys()), orders.pop() == 'desc'
 
-    # multiple sorting has to begin from the last sort key
-    for key in reversed(sort):
-        order = sort[key]
-        is_reversed = True if order == "desc" else False
-        list_of_objects = sorted(list_of_objects,
-                                 key=lambda obj: getattr(obj, key),
-                                 reverse=is_reversed)
-    return list_of_objects
+    fields = [(field, order == 'desc') for field, order in sort.iteritems()]
 
+    def key(obj):
+        return tuple(_Descending(getattr(obj, field)) if descending
+                     else getattr(obj, field)
+                     for field, descending in fields)
+    return key, False
 
-def paginate_list(list_of_objects, pagination=None):
+
+def query_list(list_of_objects, sort=None, pagination=None):
+    """
+    Sort and paginate a list of objects. When only a small page of a sorted
+    list is requested, it is selected with a heap instead of sorting the
+    whole list.
+    """
     total = len(list_of_objects)
-    if pagination:
-        offset = pagination.get('offset')
-        size = pagination.get('size')
-        if offset is not None:
-            list_of_objects = list_of_objects[offset:]
-        if size is not None:
-            list_of_objects = list_of_objects[:size]
-    else:
-        offset = None
-        size = None
-
-    pagination = {'total': total,
-                  'size': size,
-                  'offset': offset}
-    meta = {'pagination': pagination}
+    pagination = pagination or {}
+    offset = pagination.get('offset')
+    size = pagination.get('size')
+    start = offset or 0
+    end = start + size if size is not None else None
+
+    if sort:
+        key, reverse = _sort_key(sort)
+        if end is not None and end < total:
+            select = heapq.nlargest if reverse else heapq.nsmallest
+            list_of_objects = select(end, list_of_objects, key=key)
+        else:
+            list_of_objects = sorted(list_of_objects, key=key,
+                                     reverse=reverse)
+    list_of_objects = list_of_objects[start:end]
+
+    meta = {'pagination': {'total': total,
+                           'size': size,
+                           'offset': offset}}
     return ListResult(list_of_objects, meta)
 
 
 class FileStorageManager(object):
     """
     file based storage manager for tests.
+
+    Items are kept in memory. Every write appends a single record to an
+    operation log file, which is compacted into the storage (snapshot) file
+    once it holds LOG_COMPACTION_THRESHOLD records. Both files are fsynced,
+    and the snapshot is replaced by an atomic rename, so the storage can be
+    recovered after a crash by loading the snapshot and replaying the log.
+    Writes which depend on the stored items (existence checks, updates)
+    hold the storage lock from their read to their commit.
     """
 
-    def __init__(self, storage_path):
+    def __init__(self, storage_path, recover=False):
+        """
+        :param storage_path: path of the snapshot file. The operation log is
+                             kept next to it, in '<storage_path>.log'.
+        :param recover: load existing data from the snapshot file and the
+                        operation log. If False, existing data is removed.
+        """
         self._storage_path = storage_path
-        if os.path.isfile(storage_path):
-            os.remove(storage_path)
-
-    def _init_file(self):
-        data = {
-            NODES: {},
-            NODE_INSTANCES: {},
-            BLUEPRINTS: {},
-            DEPLOYMENTS: {},
-            DEPLOYMENT_MODIFICATIONS: {},
-            EXECUTIONS: {},
-            PLUGINS: {},
-            PROVIDER_CONTEXT: {},
-            SNAPSHOTS: {}
-        }
-        self._dump_data(data)
-
-    def _load_data(self):
-        if not os.path.isfile(self._storage_path):
-            self._init_file()
-        with open(self._storage_path, 'r') as f:
-            data = json.load(f)
-            deserialized_data = dict()
-            deserialized_data[NODES] = \
-                {key: DeploymentNode(**val) for key, val in data[NODES]
-                    .iteritems()}
-            deserialized_data[NODE_INSTANCES] = \
-                {key: DeploymentNodeInstance(**val) for key, val in
-                 data[NODE_INSTANCES].iteritems()}
-            deserialized_data[BLUEPRINTS] = \
-                {key: BlueprintState(**val) for key, val in data[BLUEPRINTS]
-                    .iteritems()}
-            deserialized_data[DEPLOYMENTS] = \
-                {key: Deployment(**val) for key, val in data[DEPLOYMENTS]
-                    .iteritems()}
-            deserialized_data[EXECUTIONS] = \
-                {key: Execution(**val) for key, val in data[EXECUTIONS]
-                    .iteritems()}
-            deserialized_data[PLUGINS] = \
-                {key: Plugin(**val) for key, val in data[PLUGINS]
-                    .iteritems()}
-            deserialized_data[PROVIDER_CONTEXT] = \
-                {key: ProviderContext(**val)
-                 for key, val in data[PROVIDER_CONTEXT].iteritems()}
-            deserialized_data[DEPLOYMENT_MODIFICATIONS] = \
-                {key: DeploymentModification(**val) for key, val in
-                 data[DEPLOYMENT_MODIFICATIONS].iteritems()}
-            deserialized_data[SNAPSHOTS] = \
-                {key: Snapshot(**val) for key, val in
-                 data[SNAPSHOTS].iteritems()}
-            return deserialized_data
-
-    def _dump_data(self, data):
-        with open(self._storage_path, 'w') as f:
-            serialized_data = dict()
-            serialized_data[NODES] = {key: val.to_dict() for key, val in
-                                      data[NODES].iteritems()}
-            serialized_data[NODE_INSTANCES] = {
-                key: val.to_dict()
-                for key, val in data[NODE_INSTANCES].iteritems()}
-            serialized_data[BLUEPRINTS] =\
-                {key: val.to_dict() for key, val in data[BLUEPRINTS]
-                    .iteritems()}
-            serialized_data[DEPLOYMENTS] =\
-                {key: val.to_dict() for key, val in data[DEPLOYMENTS]
-                    .iteritems()}
-            serialized_data[EXECUTIONS] =\
-                {key: val.to_dict() for key, val in data[EXECUTIONS]
-                    .iteritems()}
-            serialized_data[PLUGINS] = \
-                {key: val.to_dict() for key, val in data[PLUGINS]
-                    .iteritems()}
-            serialized_data[PROVIDER_CONTEXT] = \
-                {key: val.to_dict() for key, val in data[PROVIDER_CONTEXT]
-                    .iteritems()}
-            serialized_data[DEPLOYMENT_MODIFICATIONS] = \
-                {key: val.to_dict() for key, val in data[
-                    DEPLOYMENT_MODIFICATIONS].iteritems()}
-            serialized_data[SNAPSHOTS] = \
-                {key: val.to_dict() for key, val in data[
-                    SNAPSHOTS].iteritems()}
-            json.dump(serialized_data, f)
+        self._log_path = '{0}.log'.format(storage_path)
+        self._lock = threading.RLock()
+        self._data = {key: {} for key in MODEL_CLASSES}
+        # {key: {field: {value: set of item ids}}}
+        self._indexes = {
+            key: {field: defaultdict(set) for field in INDEXED_FIELDS
+                  if field in model_class.fields}
+            for key, model_class in MODEL_CLASSES.iteritems()}
+        self._log_records = 0
+        if recover:
+            self._recover()
+        else:
+            for path in (self._storage_path, self._log_path):
+                if os.path.isfile(path):
+                    os.remove(path)
+
+    def _recover(self):
+        if os.path.isfile(self._storage_path):
+            with open(self._storage_path, 'r') as f:
+                snapshot = json.load(f)
+            for key, items in snapshot.iteritems():
+                for item_id, value in items.iteritems():
+                    self._store(key, item_id, MODEL_CLASSES[key](**value))
+        if os.path.isfile(self._log_path):
+            with open(self._log_path, 'r') as f:
+                for line in f:
+                    try:
+                        operations = json.loads(line)
+                    except ValueError:
+                        # a record that was partially written during a
+                        # crash, it was never acknowledged
+                        break
+                    self._apply(operations)
+        self._compact()
+
+    def _apply(self, operations):
+        for operation in operations:
+            key = operation['key']
+            if operation['op'] == 'put':
+                self._store(key, operation['id'],
+                            MODEL_CLASSES[key](**operation['value']))
+            else:
+                self._remove(key, operation['id'])
+
+    def _store(self, key, item_id, item):
+        self._remove(key, item_id)
+        self._data[key][item_id] = item
+        for field, index in self._indexes[key].iteritems():
+            index[getattr(item, field)].add(item_id)
+
+    def _remove(self, key, item_id):
+        item = self._data[key].pop(item_id, None)
+        if item is None:
+            return
+        for field, index in self._indexes[key].iteritems():
+            value = getattr(item, field)
+            index[value].discard(item_id)
+            if not index[value]:
+                del index[value]
+
+    def _commit(self, operations):
+        """Append a single log record of the given operations and apply them
+        to the in-memory items
+        """
+        if not operations:
+            return
+        record = json.dumps(self._encode_operations(operations))
+        with self._lock:
+            with open(self._log_path, 'a') as f:
+                f.write(record + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            # the items are applied from the record, so they are stored
+            # exactly as they would be recovered
+            self._apply(json.loads(record))
+            self._log_records += 1
+            if self._log_records >= LOG_COMPACTION_THRESHOLD:
+                self._compact()
+
+    def _compact(self):
+        with self._lock:
+            snapshot = {key: {item_id: item.to_dict()
+                              for item_id, item in items.iteritems()}
+                        for key, items in self._data.iteritems()}
+            tmp_path = '{0}.tmp'.format(self._storage_path)
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmp_path, self._storage_path)
+            self._fsync_dir()
+            # a crash before the log is truncated replays operations which
+            # are already part of the snapshot, which is harmless
+            with open(self._log_path, 'w') as f:
+                os.fsync(f.fileno())
+            self._log_records = 0
+
+    def rewrite_items(self, doc_types, predicate):
+        """Rewrite the stored items of the given document types for which
+        `predicate(doc_type, item)` holds, `item` being the stored form of
+        the item as a dict, the way new items are stored, by a single log
+        record, and compact the storage. Meant for storage migrations.
+
+        :return: the number of rewritten items.
+        """
+        with self._lock:
+            operations = [
+                self._put_op(DOC_TYPE_KEYS[doc_type], item_id, item)
+                for doc_type in doc_types
+                for item_id, item in
+                self._data[DOC_TYPE_KEYS[doc_type]].iteritems()
+                if predicate(doc_type, item.to_dict())]
+            self._commit(operations)
+            self._compact()
+        return len(operations)
+
+    def _fsync_dir(self):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self._storage_path)),
+                         os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def _encode_operations(self, operations):
+        """Return the operations with the items they put in their stored
+        form, in memory as well as on disk: their shared fields reference
+        shared documents, which are put by the same operations unless they
+        are already stored, and their opaque fields are compressed
+        """
+        encoded = []
+        shared_ids = set()
+        for operation in operations:
+            if operation['op'] == 'put':
+                doc_type = KEY_DOC_TYPES[operation['key']]
+                value, shared = shared_documents.share_document(
+                    doc_type, operation['value'])
+                for shared_id, shared_value in shared.iteritems():
+                    if shared_id in shared_ids or \
+                            shared_id in self._data[SHARED_DOCUMENTS]:
+                        continue
+                    shared_ids.add(shared_id)
+                    encoded.append(self._put_op(
+                        SHARED_DOCUMENTS, shared_id, SharedDocument(
+                            id=shared_id,
+                            blueprint_id=value.get('blueprint_id'),
+                            value=storage_codec.encode(shared_value))))
+                operation = dict(operation,
+                                 value=storage_codec.encode_document(doc_type,
+                                                                     value))
+            encoded.append(operation)
+        return encoded
+
+    @staticmethod
+    def _put_op(key, item_id, item):
+        return {'op': 'put', 'key': key, 'id': item_id,
+                'value': item.to_dict()}
+
+    @staticmethod
+    def _delete_op(key, item_id):
+        return {'op': 'delete', 'key': key, 'id': item_id}
+
+    def _put_item(self, key, item_id, item):
+        self._commit([self._put_op(key, item_id, item)])
+
+    def _copy_item(self, item, include=None):
+        """Copy a stored item, decompressing its compressed fields and
+        resolving its shared fields. Fields which aren't included are set to
+        None rather than copied
+        """
+        item_copy = type(item).__new__(type(item))
+        item_copy.__dict__ = dict(vars(item))
+        if include:
+            for field in item.fields:
+                if field not in include:
+                    setattr(item_copy, field, None)
+        item_copy.__dict__ = {
+            field: storage_codec.decode(value)
+            if storage_codec.is_encoded(value) else utils.copy_json(value)
+            for field, value in vars(item_copy).iteritems()}
+        shared_documents.resolve_references([item_copy.__dict__],
+                                            self._fetch_shared_documents)
+        return item_copy
+
+    def _fetch_shared_documents(self, shared_ids):
+        return {shared_id: storage_codec.decode(
+                    self._data[SHARED_DOCUMENTS][shared_id].value)
+                for shared_id in shared_ids}
+
+    def _get_item(self, key, item_id):
+        """Return a copy of a stored item, or None if it doesn't exist
+        """
+        with self._lock:
+            item = self._data[key].get(item_id)
+            return self._copy_item(item) if item is not None else None
+
+    def _find(self, key, filters=None):
+        """Return the stored items matching the filters. Items are looked up
+        by id and by the indexed fields when possible, and only the remaining
+        filters are checked item by item. The storage lock is held from the
+        index lookups to the item lookups, so that a concurrent delete can't
+        remove an item in between.
+        """
+        with self._lock:
+            items = self._data[key]
+            filters = {field: val if isinstance(val, list) else [val]
+                       for field, val in (filters or {}).iteritems()}
+            id_sets = []
+            # nodes are keyed by '<deployment_id>_<node_id>', every other
+            # item is keyed by its id
+            if 'id' in filters and key != NODES:
+                id_sets.append(set(item_id for item_id in filters.pop('id')
+                                   if item_id in items))
+            indexes = self._indexes[key]
+            for field in [field for field in filters if field in indexes]:
+                index = indexes[field]
+                values = filters.pop(field)
+                if len(values) == 1:
+                    id_sets.append(index.get(values[0], set()))
+                else:
+                    id_sets.append(set().union(*[index.get(value, ())
+                                                 for value in values]))
+            if not id_sets:
+                return self.filter_data(items.values(), filters)
+            # intersect starting from the most selective set, without
+            # modifying the index sets
+            id_sets.sort(key=len)
+            candidate_ids = id_sets[0].intersection(*id_sets[1:])
+            return self.filter_data(
+                [items[item_id] for item_id in candidate_ids], filters)
+
+    def _list_items(self, key, filters=None, pagination=None, sort=None,
+                    include=None):
+        # the items are copied under the lock as well, as copying resolves
+        # their references to shared documents, which may be deleted
+        with self._lock:
+            result = query_list(self._find(key, filters),
+                                sort=sort,
+                                pagination=pagination)
+            result.items = [self._copy_item(item, include)
+                            for item in result.items]
+        return result
 
     def get_node_instance(self, node_id, **_):
-        data = self._load_data()
-        if node_id in data[NODE_INSTANCES]:
-            return data[NODE_INSTANCES][node_id]
+        node_instance = self._get_item(NODE_INSTANCES, node_id)
+        if node_instance is not None:
+            return node_instance
         raise manager_exceptions.NotFoundError(
             "Node {0} not found".format(node_id))
 
+    def get_node_instances_by_ids(self, node_instance_ids, **_):
+        return self._get_items_by_ids(NODE_INSTANCES,
+                                      node_instance_ids,
+                                      'Node instance')
+
+    def get_nodes_by_ids(self, deployment_id, node_ids, **_):
+        return self._get_items_by_ids(
+            NODES,
+            ['{0}_{1}'.format(deployment_id, node_id) for node_id in node_ids],
+            'Node')
+
+    def _get_items_by_ids(self, key, item_ids, kind):
+        with self._lock:
+            items = self._data[key]
+            missing = [item_id for item_id in item_ids
+                       if item_id not in items]
+            if missing:
+                raise manager_exceptions.NotFoundError(
+                    "{0} {1} not found".format(kind, ', '.join(missing)))
+            return [self._copy_item(items[item_id]) for item_id in item_ids]
+
     def get_node_instances(self, filters=None, pagination=None,
                            sort=None, **_):
-        instances = self._load_data()[NODE_INSTANCES].values()
-        instances = sort_list(instances, sort)
-        result = self.filter_data(instances, filters)
-        return paginate_list(result,
-                             pagination=pagination)
+        return self._list_items(NODE_INSTANCES, filters=filters,
+                                pagination=pagination, sort=sort)
 
     def get_nodes(self, filters=None, pagination=None,
                   sort=None, **_):
-        nodes = self._load_data()[NODES].values()
-        nodes = sort_list(nodes, sort)
-        result = self.filter_data(nodes, filters)
-        return paginate_list(result,
-                             pagination=pagination)
+        return self._list_items(NODES, filters=filters,
+                                pagination=pagination, sort=sort)
 
     def get_plugins(self, include=None, filters=None, pagination=None,
                     sort=None):
-        plugins = self._load_data()[PLUGINS].values()
-        plugins = sort_list(plugins, sort)
-        result = self.filter_data(plugins, filters)
-        return paginate_list(result,
-                             pagination=pagination)
+        return self._list_items(PLUGINS, filters=filters,
+                                pagination=pagination, sort=sort)
 
     def snapshots_list(self, include=None, filters=None, pagination=None,
                        sort=None):
-        snapshots = self._load_data()[SNAPSHOTS].values()
-        snapshots = sort_list(snapshots, sort)
-        result = self.filter_data(snapshots, filters)
-        return paginate_list(result,
-                             pagination=pagination)
+        return self._list_items(SNAPSHOTS, filters=filters,
+                                pagination=pagination, sort=sort)
 
     def get_node(self, deployment_id, node_id, **_):
-        data = self._load_data()
-        node_id = '{}_{}'.format(deployment_id, node_id)
-        if node_id in data[NODES]:
-            return data[NODES][node_id]
+        node = self._get_item(NODES, '{}_{}'.format(deployment_id, node_id))
+        if node is not None:
+            return node
         raise manager_exceptions.NotFoundError(
             "Deployment {0} not found".format(deployment_id))
 
     def put_node(self, node):
-        data = self._load_data()
-        node_id = '{0}_{1}'.format(node.deployment_id, node.id)
-        if str(node_id) in data[NODES]:
-            raise manager_exceptions.ConflictError(
-                'Node {0} already exists'.format(node_id))
-        data[NODES][str(node_id)] = node
-        self._dump_data(data)
-        return 1
+        with self._lock:
+            node_id = '{0}_{1}'.format(node.deployment_id, node.id)
+            if str(node_id) in self._data[NODES]:
+                raise manager_exceptions.ConflictError(
+                    'Node {0} already exists'.format(node_id))
+            self._put_item(NODES, str(node_id), node)
+            return 1
 
     def put_node_instance(self, node):
-        data = self._load_data()
-        node_id = node.id
-        if str(node_id) in data[NODE_INSTANCES]:
-            raise manager_exceptions.ConflictError(
-                'Node {0} already exists'.format(node_id))
-        data[NODE_INSTANCES][str(node_id)] = node
-        self._dump_data(data)
-        return 1
+        with self._lock:
+            node_id = node.id
+            if str(node_id) in self._data[NODE_INSTANCES]:
+                raise manager_exceptions.ConflictError(
+                    'Node {0} already exists'.format(node_id))
+            self._put_item(NODE_INSTANCES, str(node_id), node)
+            return 1
+
+    def put_nodes_bulk(self, nodes):
+        return self._put_items_bulk(
+            NODES, (('{0}_{1}'.format(node.deployment_id, node.id), node)
+                    for node in nodes))
+
+    def put_node_instances_bulk(self, node_instances):
+        return self._put_items_bulk(
+            NODE_INSTANCES, ((str(node_instance.id), node_instance)
+                             for node_instance in node_instances))
+
+    def replace_node_instances(self, deployment_id, node_instances):
+        with self._lock:
+            replaced_ids = set(self._indexes[NODE_INSTANCES][
+                'deployment_id'].get(deployment_id, ()))
+            # the old node instances are deleted by the same log record
+            # which stores the new ones
+            return self._put_items_bulk(
+                NODE_INSTANCES,
+                ((str(node_instance.id), node_instance)
+                 for node_instance in node_instances),
+                operations=[self._delete_op(NODE_INSTANCES, item_id)
+                            for item_id in replaced_ids],
+                replaced_ids=replaced_ids)
+
+    def _put_items_bulk(self, key, items, operations=None,
+                        replaced_ids=()):
+        with self._lock:
+            operations = operations or []
+            conflicts = []
+            created_ids = set()
+            for item_id, item in items:
+                if (item_id in self._data[key] and
+                        item_id not in replaced_ids) or item_id in created_ids:
+                    conflicts.append(item_id)
+                else:
+                    operations.append(self._put_op(key, item_id, item))
+                    created_ids.add(item_id)
+            self._commit(operations)
+            if conflicts:
+                raise manager_exceptions.ConflictError(
+                    'Some {0} already exist: {1}'.format(key,
+                                                         ', '.join(conflicts)))
+            return len(created_ids)
 
     def update_execution_status(self, execution_id, status, error):
-        data = self._load_data()
-        if execution_id not in data[EXECUTIONS]:
-            raise manager_exceptions.NotFoundError(
-                "Execution {0} not found".format(execution_id))
+        with self._lock:
+            execution = self._get_item(EXECUTIONS, execution_id)
+            if execution is None:
+                raise manager_exceptions.NotFoundError(
+                    "Execution {0} not found".format(execution_id))
 
-        execution = data[EXECUTIONS][execution_id]
-        execution.status = status
-        execution.error = error
-        data[EXECUTIONS][execution_id] = execution
-        self._dump_data(data)
+            execution.status = status
+            execution.error = error
+            self._put_item(EXECUTIONS, execution_id, execution)
 
     def update_node(self, deployment_id, node_id,
                     number_of_instances=None,
                     planned_number_of_instances=None):
-        data = self._load_data()
-        storage_node_id = '{0}_{1}'.format(deployment_id, node_id)
-        if storage_node_id not in data[NODES]:
-            raise manager_exceptions.NotFoundError(
-                'Node {0} not found'.format(node_id))
-        node = data[NODES][storage_node_id]
-        if number_of_instances is not None:
-            node.number_of_instances = number_of_instances
-        if planned_number_of_instances is not None:
-            node.planned_number_of_instances = planned_number_of_instances
-        self._dump_data(data)
+        with self._lock:
+            storage_node_id = '{0}_{1}'.format(deployment_id, node_id)
+            node = self._get_item(NODES, storage_node_id)
+            if node is None:
+                raise manager_exceptions.NotFoundError(
+                    'Node {0} not found'.format(node_id))
+            if number_of_instances is not None:
+                node.number_of_instances = number_of_instances
+            if planned_number_of_instances is not None:
+                node.planned_number_of_instances = planned_number_of_instances
+            self._put_item(NODES, storage_node_id, node)
 
     def update_node_instance(self, node_update):
-        data = self._load_data()
-        if node_update.id not in data[NODE_INSTANCES]:
-            raise manager_exceptions.NotFoundError(
-                "Node {0} not found".format(node_update.id))
-        node = data[NODE_INSTANCES][node_update.id]
-
-        if node_update.state is not None:
-            node.state = node_update.state
-        if node_update.runtime_properties is not None:
-            node.runtime_properties = node_update.runtime_properties
-        if node_update.relationships is not None:
-            node.relationships = node_update.relationships
-
-        data[NODE_INSTANCES][node.id] = node
-        self._dump_data(data)
-
-    def blueprints_list(self, filters=None, pagination=None,
-                        sort=None, **_):
-        blueprints = self._load_data()[BLUEPRINTS].values()
-        blueprints = sort_list(blueprints, sort)
-        result = self.filter_data(blueprints, filters)
-        return paginate_list(result,
-                             pagination=pagination)
+        with self._lock:
+            node = self._get_item(NODE_INSTANCES, node_update.id)
+            if node is None:
+                raise manager_exceptions.NotFoundError(
+                    "Node {0} not found".format(node_update.id))
+
+            if node_update.state is not None:
+                node.state = node_update.state
+            if node_update.runtime_properties is not None:
+                node.runtime_properties = node_update.runtime_properties
+            if node_update.relationships is not None:
+                node.relationships = node_update.relationships
+
+            self._put_item(NODE_INSTANCES, node.id, node)
+            return node
+
+    def patch_node_instance(self, node_instance_id, version,
+                            runtime_properties_patch, state=None):
+        with self._lock:
+            node = self._get_item(NODE_INSTANCES, node_instance_id)
+            if node is None:
+                raise manager_exceptions.NotFoundError(
+                    "Node {0} not found".format(node_instance_id))
+            node.runtime_properties = utils.merge_patch(
+                node.runtime_properties, runtime_properties_patch)
+            if state is not None:
+                node.state = state
+            self._put_item(NODE_INSTANCES, node_instance_id, node)
+            return node.version
+
+    def update_node_instances(self, node_updates, atomic=False):
+        # like update_node_instance, versions aren't checked. All the
+        # updates are stored by a single log record.
+        with self._lock:
+            results = []
+            for node_update in node_updates:
+                node = self._get_item(NODE_INSTANCES, node_update.id)
+                if node is None:
+                    results.append(manager_exceptions.NotFoundError(
+                        "Node {0} not found".format(node_update.id)))
+                    continue
+                if node_update.state is not None:
+                    node.state = node_update.state
+                if node_update.runtime_properties is not None:
+                    node.runtime_properties = node_update.runtime_properties
+                results.append(node)
+            updated = [result for result in results
+                       if not isinstance(result,
+                                         manager_exceptions.ManagerException)]
+            if atomic and len(updated) < len(results):
+                return storage_manager.reject_updates(results)
+            self._commit([self._put_op(NODE_INSTANCES, item.id, item)
+                          for item in updated])
+        return results
+
+    def blueprints_list(self, include=None, filters=None, pagination=None,
+                        sort=None):
+        return self._list_items(BLUEPRINTS, filters=filters,
+                                pagination=pagination, sort=sort,
+                                include=include)
 
     @staticmethod
     def filter_data(items_lst, filters=None):
@@ -300,131 +642,142 @@ class FileStorageManager(object):
             result = items_lst
         return result
 
+    def _matching_items(self, doc_type, filters):
+        return self._find(DOC_TYPE_KEYS[doc_type], filters)
+
+    def count(self, doc_type, filters=None):
+        return len(self._matching_items(doc_type, filters))
+
+    def exists(self, doc_type, filters=None):
+        return len(self._matching_items(doc_type, filters)) > 0
+
+    def summarize(self, doc_type, target_fields, filters=None):
+        groups = Counter(
+            tuple(getattr(item, field) for field in target_fields)
+            for item in self._matching_items(doc_type, filters))
+        # like elasticsearch's terms aggregations, items missing a target
+        # field aren't counted
+        return [dict(zip(target_fields, group), count=count)
+                for group, count in groups.most_common()
+                if None not in group]
+
     def deployments_list(self, filters=None, pagination=None,
                          sort=None, **_):
-        deployments = self._load_data()[DEPLOYMENTS].values()
-        deployments = sort_list(deployments, sort)
-        result = self.filter_data(deployments, filters)
-        return paginate_list(result,
-                             pagination=pagination)
+        return self._list_items(DEPLOYMENTS, filters=filters,
+                                pagination=pagination, sort=sort)
 
     def executions_list(self, filters=None, pagination=None,
                         sort=None, **_):
-        executions = self._load_data()[EXECUTIONS].values()
-        executions = sort_list(executions, sort)
-        result = self.filter_data(executions, filters)
-        return paginate_list(result,
-                             pagination=pagination)
+        return self._list_items(EXECUTIONS, filters=filters,
+                                pagination=pagination, sort=sort)
+
+    @staticmethod
+    def _stream(list_result):
+        return StreamResult(iter(list_result.items),
+                            list_result.metadata['pagination']['total'])
+
+    def iter_executions(self, filters=None, sort=None, **_):
+        return self._stream(self.executions_list(filters=filters, sort=sort))
+
+    def iter_nodes(self, filters=None, sort=None, **_):
+        return self._stream(self.get_nodes(filters=filters, sort=sort))
+
+    def iter_node_instances(self, filters=None, sort=None, **_):
+        return self._stream(self.get_node_instances(filters=filters,
+                                                    sort=sort))
 
     def get_blueprint_deployments(self, blueprint_id, **_):
         return self.deployments_list(filters={'blueprint_id': blueprint_id})
 
+    def _get_item_with_include(self, key, item_id, include, kind):
+        item = self._get_item(key, item_id)
+        if item is None:
+            raise manager_exceptions.NotFoundError(
+                "{0} {1} not found".format(kind, item_id))
+        if include:
+            for field in MODEL_CLASSES[key].fields:
+                if field not in include:
+                    setattr(item, field, None)
+        return item
+
     def get_blueprint(self, blueprint_id, include=None):
-        data = self._load_data()
-        if blueprint_id in data[BLUEPRINTS]:
-            bp = data[BLUEPRINTS][blueprint_id]
-            if include:
-                for field in BlueprintState.fields:
-                    if field not in include:
-                        setattr(bp, field, None)
-            return bp
-        raise manager_exceptions.NotFoundError(
-            "Blueprint {0} not found".format(blueprint_id))
+        return self._get_item_with_include(BLUEPRINTS, blueprint_id,
+                                           include, 'Blueprint')
 
     def get_plugin(self, plugin_id, include=None):
-        data = self._load_data()
-        if plugin_id in data[PLUGINS]:
-            plugin = data[PLUGINS][plugin_id]
-            if include:
-                for field in Plugin.fields:
-                    if field not in include:
-                        setattr(plugin, field, None)
-            return plugin
-        raise manager_exceptions.NotFoundError(
-            "Plugin {0} not found".format(plugin_id))
+        return self._get_item_with_include(PLUGINS, plugin_id,
+                                           include, 'Plugin')
 
     def get_deployment(self, deployment_id, include=None):
-        data = self._load_data()
-        if deployment_id in data[DEPLOYMENTS]:
-            dep = data[DEPLOYMENTS][deployment_id]
-            if include:
-                for field in Deployment.fields:
-                    if field not in include:
-                        setattr(dep, field, None)
-            return dep
-        raise manager_exceptions.NotFoundError(
-            "Deployment {0} not found".format(deployment_id))
+        return self._get_item_with_include(DEPLOYMENTS, deployment_id,
+                                           include, 'Deployment')
 
     def get_execution(self, execution_id, **_):
-        data = self._load_data()
-        if execution_id in data[EXECUTIONS]:
-            return data[EXECUTIONS][execution_id]
+        execution = self._get_item(EXECUTIONS, execution_id)
+        if execution is not None:
+            return execution
         raise manager_exceptions.NotFoundError(
             "Execution {0} not found".format(execution_id))
 
+    def _put_new_item(self, key, item_id, item, kind):
+        with self._lock:
+            if str(item_id) in self._data[key]:
+                raise manager_exceptions.ConflictError(
+                    '{0} {1} already exists'.format(kind, item_id))
+            self._put_item(key, str(item_id), item)
+
     def put_blueprint(self, blueprint_id, blueprint):
-        data = self._load_data()
-        if str(blueprint_id) in data[BLUEPRINTS]:
-            raise manager_exceptions.ConflictError(
-                'Blueprint {0} already exists'.format(blueprint_id))
-        data[BLUEPRINTS][str(blueprint_id)] = blueprint
-        self._dump_data(data)
+        self._put_new_item(BLUEPRINTS, blueprint_id, blueprint, 'Blueprint')
 
     def put_deployment(self, deployment_id, deployment):
-        data = self._load_data()
-        if str(deployment_id) in data[DEPLOYMENTS]:
-            raise manager_exceptions.ConflictError(
-                'Deployment {0} already exists'.format(deployment_id))
-        data[DEPLOYMENTS][str(deployment_id)] = deployment
-        self._dump_data(data)
+        self._put_new_item(DEPLOYMENTS, deployment_id, deployment,
+                           'Deployment')
 
     def put_execution(self, execution_id, execution):
-        data = self._load_data()
-        if str(execution_id) in data[EXECUTIONS]:
-            raise manager_exceptions.ConflictError(
-                'Execution {0} already exists'.format(execution_id))
-        data[EXECUTIONS][str(execution_id)] = execution
-        self._dump_data(data)
+        self._put_new_item(EXECUTIONS, execution_id, execution, 'Execution')
 
     def put_plugin(self, plugin):
-        data = self._load_data()
-        if str(plugin.id) in data[PLUGINS]:
-            raise manager_exceptions.ConflictError(
-                'Plugin {0} already exists'.format(plugin.id))
-        data[PLUGINS][str(plugin.id)] = plugin
-        self._dump_data(data)
+        self._put_new_item(PLUGINS, plugin.id, plugin, 'Plugin')
 
     def put_snapshot(self, snapshot_id, snapshot):
-        data = self._load_data()
-        if str(snapshot_id) in data[SNAPSHOTS]:
-            raise manager_exceptions.ConflictError(
-                'Snapshot {0} already exists'.format(snapshot_id))
-        data[SNAPSHOTS][str(snapshot_id)] = snapshot
-        self._dump_data(data)
+        self._put_new_item(SNAPSHOTS, snapshot_id, snapshot, 'Snapshot')
 
     def delete_blueprint(self, blueprint_id):
-        return self._delete_object(blueprint_id, BLUEPRINTS, 'Blueprint')
+        with self._lock:
+            blueprint = self._get_item(BLUEPRINTS, blueprint_id)
+            if blueprint is None:
+                raise manager_exceptions.NotFoundError(
+                    "Blueprint {0} not found".format(blueprint_id))
+            # the blueprint has no deployments, so nothing references its
+            # shared documents anymore
+            operations = [
+                self._delete_op(SHARED_DOCUMENTS, shared_id)
+                for shared_id in self._indexes[SHARED_DOCUMENTS][
+                    'blueprint_id'].get(blueprint_id, ())]
+            operations.append(self._delete_op(BLUEPRINTS, blueprint_id))
+            self._commit(operations)
+            return blueprint
 
     def delete_plugin(self, plugin_id):
         return self._delete_object(plugin_id, PLUGINS, 'Plugin')
 
     def delete_deployment(self, deployment_id):
-        data = self._load_data()
-        for instance in data[NODE_INSTANCES].values():
-            if instance.deployment_id == deployment_id:
-                del data[NODE_INSTANCES][instance.id]
-        for node in data[NODES].values():
-            if node.deployment_id == deployment_id:
-                node_id = '{0}_{1}'.format(deployment_id, node.id)
-                del data[NODES][node_id]
-        for execution in data[EXECUTIONS].values():
-            if execution.deployment_id == deployment_id:
-                del data[EXECUTIONS][execution.id]
-        for modification in data[DEPLOYMENT_MODIFICATIONS].values():
-            if modification.deployment_id == deployment_id:
-                del data[DEPLOYMENT_MODIFICATIONS][modification.id]
-        self._dump_data(data)
-        return self._delete_object(deployment_id, DEPLOYMENTS, 'Deployment')
+        with self._lock:
+            deployment = self._get_item(DEPLOYMENTS, deployment_id)
+            if deployment is None:
+                raise manager_exceptions.NotFoundError(
+                    "Deployment {0} not found".format(deployment_id))
+            # the deployment and everything it contains are deleted by a
+            # single log record
+            operations = [
+                self._delete_op(key, item_id)
+                for key in (NODE_INSTANCES, NODES, EXECUTIONS,
+                            DEPLOYMENT_MODIFICATIONS)
+                for item_id in self._indexes[key]['deployment_id'].get(
+                    deployment_id, ())]
+            operations.append(self._delete_op(DEPLOYMENTS, deployment_id))
+            self._commit(operations)
+            return deployment
 
     def delete_execution(self, execution_id):
         return self._delete_object(execution_id, EXECUTIONS, 'Execution')
@@ -436,71 +789,69 @@ class FileStorageManager(object):
         return self._delete_object(node_instance_id, NODE_INSTANCES, 'Node')
 
     def _delete_object(self, object_id, object_type, object_type_name):
-        data = self._load_data()
-        if object_id in data[object_type]:
-            obj = data[object_type][object_id]
-            del(data[object_type][object_id])
-            self._dump_data(data)
-            return obj
-        raise manager_exceptions.NotFoundError(
-            "{0} {1} not found".format(object_type_name, object_id))
+        with self._lock:
+            obj = self._get_item(object_type, object_id)
+            if obj is not None:
+                self._commit([self._delete_op(object_type, object_id)])
+                return obj
+            raise manager_exceptions.NotFoundError(
+                "{0} {1} not found".format(object_type_name, object_id))
 
     def put_provider_context(self, provider_context):
-        data = self._load_data()
-        if PROVIDER_CONTEXT_ID in data[PROVIDER_CONTEXT]:
-            raise manager_exceptions.ConflictError(
-                'Provider context already set')
-        data[PROVIDER_CONTEXT][PROVIDER_CONTEXT_ID] = provider_context
-        self._dump_data(data)
+        with self._lock:
+            if PROVIDER_CONTEXT_ID in self._data[PROVIDER_CONTEXT]:
+                raise manager_exceptions.ConflictError(
+                    'Provider context already set')
+            self._put_item(PROVIDER_CONTEXT, PROVIDER_CONTEXT_ID,
+                           provider_context)
 
     def update_provider_context(self, provider_context):
-        data = self._load_data()
-        if PROVIDER_CONTEXT_ID not in data[PROVIDER_CONTEXT]:
-            raise manager_exceptions.NotFoundError('Provider Context not '
-                                                   'found')
-        data[PROVIDER_CONTEXT][PROVIDER_CONTEXT_ID] = provider_context
-        self._dump_data(data)
+        with self._lock:
+            if PROVIDER_CONTEXT_ID not in self._data[PROVIDER_CONTEXT]:
+                raise manager_exceptions.NotFoundError('Provider Context not '
+                                                       'found')
+            self._put_item(PROVIDER_CONTEXT, PROVIDER_CONTEXT_ID,
+                           provider_context)
 
     def get_provider_context(self, **_):
-        data = self._load_data()
-        if PROVIDER_CONTEXT_ID in data[PROVIDER_CONTEXT]:
-            return data[PROVIDER_CONTEXT][PROVIDER_CONTEXT_ID]
+        provider_context = self._get_item(PROVIDER_CONTEXT,
+                                          PROVIDER_CONTEXT_ID)
+        if provider_context is not None:
+            return provider_context
         raise manager_exceptions.NotFoundError(
             "Provider context not set")
 
     def put_deployment_modification(self, modification_id, modification):
-        data = self._load_data()
-        if str(modification_id) in data[DEPLOYMENT_MODIFICATIONS]:
-            raise manager_exceptions.ConflictError(
-                'Deployment modification {0} already exists'
-                .format(modification_id))
-        data[DEPLOYMENT_MODIFICATIONS][str(modification_id)] = modification
-        self._dump_data(data)
+        with self._lock:
+            if str(modification_id) in self._data[DEPLOYMENT_MODIFICATIONS]:
+                raise manager_exceptions.ConflictError(
+                    'Deployment modification {0} already exists'
+                    .format(modification_id))
+            self._put_item(DEPLOYMENT_MODIFICATIONS, str(modification_id),
+                           modification)
 
     def get_deployment_modification(self, modification_id, include=None):
-        data = self._load_data()
-        if modification_id in data[DEPLOYMENT_MODIFICATIONS]:
-            return data[DEPLOYMENT_MODIFICATIONS][modification_id]
+        modification = self._get_item(DEPLOYMENT_MODIFICATIONS,
+                                      modification_id)
+        if modification is not None:
+            return modification
         raise manager_exceptions.NotFoundError(
             "Deployment modification {0} not found".format(modification_id))
 
     def deployment_modifications_list(self, include=None, filters=None,
                                       pagination=None, sort=None):
-        modifications = self._load_data()[DEPLOYMENT_MODIFICATIONS].values()
-        modifications = sort_list(modifications, sort)
-        result = self.filter_data(modifications, filters)
-        return paginate_list(result,
-                             pagination=pagination)
+        return self._list_items(DEPLOYMENT_MODIFICATIONS, filters=filters,
+                                pagination=pagination, sort=sort)
 
     def update_deployment_modification(self, modification):
+        with self._lock:
             modification_id = modification.id
-            data = self._load_data()
-            if modification_id not in data[DEPLOYMENT_MODIFICATIONS]:
+            updated_modification = self._get_item(DEPLOYMENT_MODIFICATIONS,
+                                                  modification_id)
+            if updated_modification is None:
                 raise manager_exceptions.NotFoundError(
                     'Deployment modification {0} not found'
                     .format(modification_id))
-            updated_modification = \
-                data[DEPLOYMENT_MODIFICATIONS][modification_id]
             if modification.status is not None:
                 updated_modification.status = modification.status
             if modification.ended_at is not None:
@@ -508,7 +859,8 @@ class FileStorageManager(object):
             if modification.node_instances is not None:
                 updated_modification.node_instances = \
                     modification.node_instances
-            self._dump_data(data)
+            self._put_item(DEPLOYMENT_MODIFICATIONS, modification_id,
+                           updated_modification)
 
 
 def create():
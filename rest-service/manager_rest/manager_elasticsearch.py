@@ -11,13 +11,144 @@
 #  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
+import os
+import threading
+
 import elasticsearch
-from flask import g, current_app as app
+from elasticsearch.connection import Urllib3HttpConnection
+from flask import current_app as app
 
 from manager_rest import config
+from manager_rest import metrics
 
 DEFAULT_SEARCH_SIZE = 10000
 
+# number of hits fetched per request when scrolling through search results
+SCROLL_CHUNK_SIZE = 500
+SCROLL_KEEP_ALIVE = '1m'
+
+
+class ConnectionPoolStats(object):
+    """Usage counters of the process-wide elasticsearch connection pool
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clients_created = 0
+        self.requests = 0
+        self.failed_requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def client_created(self):
+        with self._lock:
+            self.clients_created += 1
+
+    def request_started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def request_finished(self, failed=False):
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.failed_requests += 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'clients_created': self.clients_created,
+                'requests': self.requests,
+                'failed_requests': self.failed_requests,
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight
+            }
+
+
+pool_stats = ConnectionPoolStats()
+
+
+class PooledHttpConnection(Urllib3HttpConnection):
+    """
+    urllib3 based connection which reports its usage to `pool_stats`.
+    Each connection owns a urllib3 pool of at most `maxsize` sockets, which
+    are kept alive between requests unless `keep_alive` is disabled.
+    """
+
+    def __init__(self, keep_alive=True, **kwargs):
+        super(PooledHttpConnection, self).__init__(**kwargs)
+        if not keep_alive:
+            self.headers['connection'] = 'close'
+
+    def perform_request(self, *args, **kwargs):
+        pool_stats.request_started()
+        metrics.storage_round_trip()
+        failed = True
+        try:
+            result = super(PooledHttpConnection, self).perform_request(
+                *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            pool_stats.request_finished(failed)
+
+
+_clients = {}
+_clients_pid = None
+_clients_lock = threading.Lock()
+
+
+def _create_client(host, port):
+    cfy_config = config.instance()
+    client = elasticsearch.Elasticsearch(
+        hosts=[{'host': host, 'port': port}],
+        connection_class=PooledHttpConnection,
+        maxsize=cfy_config.db_connection_pool_size,
+        keep_alive=cfy_config.db_connection_keep_alive,
+        timeout=cfy_config.db_connection_timeout,
+        max_retries=cfy_config.db_max_retries,
+        retry_on_timeout=cfy_config.db_retry_on_timeout,
+        sniff_on_start=cfy_config.db_sniff_on_start,
+        sniff_on_connection_fail=cfy_config.db_sniff_on_connection_fail,
+        sniffer_timeout=cfy_config.db_sniffer_timeout)
+    pool_stats.client_created()
+    return client
+
+
+def get_client(host=None, port=None):
+    """
+    Return the elasticsearch client shared by all threads of this process.
+
+    A single client (and therefore a single connection pool) is created per
+    elasticsearch address. The clients are recreated after a fork, since
+    sockets inherited from the parent process must not be shared with it.
+    """
+    global _clients_pid
+    host = host or config.instance().db_address
+    port = port or config.instance().db_port
+    pid = os.getpid()
+    client = _clients.get((host, port)) if _clients_pid == pid else None
+    if client is None:
+        with _clients_lock:
+            if _clients_pid != pid:
+                _clients.clear()
+                _clients_pid = pid
+            client = _clients.get((host, port))
+            if client is None:
+                client = _create_client(host, port)
+                _clients[(host, port)] = client
+    return client
+
+
+def reset_clients():
+    """Drop the shared clients, so they are recreated using the current
+    configuration on next use
+    """
+    with _clients_lock:
+        _clients.clear()
+
 
 # Singleton class
 class ManagerElasticsearch:
@@ -111,14 +242,27 @@ class ManagerElasticsearch:
 
     @staticmethod
     def get_connection():
-        """Return a connection to Cloudify manager's Elasticsearch
+        """Return a connection to Cloudify manager's Elasticsearch.
+        The connection pool is shared with the storage manager.
+        """
+        return get_client()
+
+    @staticmethod
+    def get_connection_pool_stats():
+        """Return the usage counters of the shared connection pool
         """
-        if 'es_connection' not in g:
-            es_host = config.instance().db_address
-            es_port = config.instance().db_port
-            g.es_connection = elasticsearch.Elasticsearch(
-                hosts=[{"host": es_host, "port": es_port}])
-        return g.es_connection
+        stats = pool_stats.to_dict()
+        sockets_opened = 0
+        idle_sockets = 0
+        for client in _clients.values():
+            for connection in client.transport.connection_pool.connections:
+                sockets_opened += connection.pool.num_connections
+                # the urllib3 queue is padded with None placeholders
+                idle_sockets += len([c for c in connection.pool.pool.queue
+                                     if c is not None])
+        stats['sockets_opened'] = sockets_opened
+        stats['idle_sockets'] = idle_sockets
+        return stats
 
     @staticmethod
     def check_index_exists(index_name):
@@ -138,6 +282,59 @@ class ManagerElasticsearch:
         es = ManagerElasticsearch.get_connection()
         return es.search(index=index, doc_type=doc_type, body=body)
 
+    @staticmethod
+    def scroll(index, query, doc_type=None, _source=True, connection=None):
+        """
+        Search all documents matching a query using the scroll API, so they
+        are fetched in chunks of `SCROLL_CHUNK_SIZE` hits while being
+        consumed, regardless of their number. Pagination in the query is
+        ignored.
+
+        :param index: The index to search.
+        :param query: An elasticsearch Query DSL body.
+        :param doc_type: An optional document type to search.
+        :param _source: The source fields to return, or True for all fields.
+        :param connection: The elasticsearch client to use, defaults to the
+                           shared client.
+        :return: A tuple of the total number of matching documents and a
+                 generator of their hits. The first chunk is requested
+                 immediately, so search errors are raised by this method.
+        """
+        es = connection or ManagerElasticsearch.get_connection()
+        body = dict(query or {})
+        body.pop('from', None)
+        body['size'] = SCROLL_CHUNK_SIZE
+        params = {}
+        if 'sort' not in body:
+            # scanning is cheaper when the order doesn't matter
+            params['search_type'] = 'scan'
+        result = es.search(index=index,
+                           doc_type=doc_type,
+                           body=body,
+                           _source=_source,
+                           scroll=SCROLL_KEEP_ALIVE,
+                           **params)
+
+        def _hits(result):
+            scroll_id = result.get('_scroll_id')
+            try:
+                while True:
+                    for hit in result['hits']['hits']:
+                        yield hit
+                    result = es.scroll(scroll_id=scroll_id,
+                                       scroll=SCROLL_KEEP_ALIVE)
+                    scroll_id = result.get('_scroll_id', scroll_id)
+                    if not result['hits']['hits']:
+                        break
+            finally:
+                try:
+                    es.clear_scroll(scroll_id=scroll_id)
+                except elasticsearch.TransportError:
+                    # the scroll expires anyway
+                    pass
+
+        return result['hits']['total'], _hits(result)
+
     @staticmethod
     def build_list_result_metadata(query, search_result):
 
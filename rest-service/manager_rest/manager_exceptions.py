@@ -312,3 +312,27 @@ class MethodNotAllowedError(ManagerException):
             *args,
             **kwargs
         )
+
+
+class UpdateNotAppliedError(ManagerException):
+    ERROR_CODE = 'update_not_applied_error'
+
+    def __init__(self, *args, **kwargs):
+        super(UpdateNotAppliedError, self).__init__(
+            424,
+            UpdateNotAppliedError.ERROR_CODE,
+            *args,
+            **kwargs
+        )
+
+
+class StorageError(ManagerException):
+    ERROR_CODE = 'storage_error'
+
+    def __init__(self, http_code, *args, **kwargs):
+        super(StorageError, self).__init__(
+            http_code,
+            StorageError.ERROR_CODE,
+            *args,
+            **kwargs
+        )
@@ -0,0 +1,202 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Compiled marshalling of storage models into REST responses.
+
+Marshalling an item generically means copying it into a dict, building a
+response object from the dict, and letting flask-restful look up and
+format every field of the response object. Instead, the source of a
+function which reads the marshalled fields directly off a model (or a
+dict) and formats them inline is generated once per response class and set
+of marshalled fields, and compiled.
+
+Response objects are assumed to hold their constructor's arguments as they
+are, in attributes of the same names. Response classes which compute a
+field from its argument declare it in a `field_converters` class variable,
+mapping the field to the name of a static method which computes it. Fields
+of types which aren't formatted inline are formatted by the flask-restful
+field itself.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+from flask.ext.restful import fields, marshal
+from flask.ext.restful.fields import is_indexable_but_not_string
+
+from manager_rest import models
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# the fields are chosen by the "_include" parameter of requests, so only
+# the serializers of the most recently used field sets are kept
+MAX_CACHED_SERIALIZERS = 256
+
+# (response class, field names) -> serializer, least recently used first
+_serializers = OrderedDict()
+_serializers_lock = threading.Lock()
+
+
+def get_serializer(response_class, field_names):
+    """
+    :param response_class: a response class, which has a `resource_fields`
+     class variable.
+    :param field_names: the names of the marshalled fields.
+    :return: a function marshalling a model, a dict or a list of them the
+     way flask-restful would marshal the equivalent response object(s).
+    """
+    key = (response_class, frozenset(field_names))
+    with _serializers_lock:
+        serializer = _serializers.pop(key, None)
+        if serializer is not None:
+            _serializers[key] = serializer
+            return serializer
+    serializer = _compile(response_class.resource_fields, key[1],
+                          _converters(response_class),
+                          response_class.__name__)
+    if serializer is None:
+        serializer = generic_serializer(response_class, field_names)
+    with _serializers_lock:
+        serializer = _serializers.setdefault(key, serializer)
+        while len(_serializers) > MAX_CACHED_SERIALIZERS:
+            _serializers.popitem(last=False)
+    return serializer
+
+
+def generic_serializer(response_class, field_names):
+    """
+    :return: a function marshalling a model, a dict or a list of them by
+     building response objects and marshalling them with flask-restful.
+    """
+    fields_to_marshal = {name: response_class.resource_fields[name]
+                         for name in field_names}
+    # model fields which aren't marshalled aren't read either, as they may
+    # be loaded lazily
+    excluded = set(response_class.resource_fields) - set(field_names)
+
+    def wrap(data):
+        if isinstance(data, dict):
+            return response_class(**data)
+        elif isinstance(data, list):
+            return [wrap(item) for item in data]
+        elif isinstance(data, models.SerializableObject):
+            return wrap({field: None if field in excluded
+                         else getattr(data, field)
+                         for field in data.fields})
+        raise RuntimeError('Unexpected response data type {0}'.format(
+            type(data)))
+
+    def serialize(data):
+        return marshal(wrap(data), fields_to_marshal)
+    return serialize
+
+
+def _converters(response_class):
+    converters = {}
+    for field, method_name in getattr(response_class, 'field_converters',
+                                      {}).iteritems():
+        converter = getattr(response_class, method_name)
+        # classes decorated by swagger.nested are proxied, and their static
+        # methods are returned as they are
+        if isinstance(converter, staticmethod):
+            converter = converter.__func__
+        converters[field] = converter
+    return converters
+
+
+def _make_field(field):
+    return field() if isinstance(field, type) else field
+
+
+def _compile(resource_fields, field_names, converters, name):
+    """
+    :return: a compiled serializer of the given fields, or None if they
+     can't be compiled.
+    """
+    namespace = {}
+    read_object = []
+    read_dict = []
+    output = []
+    for index, field_name in enumerate(sorted(field_names)):
+        field = _make_field(resource_fields[field_name])
+        source = field.attribute or field_name
+        if not _IDENTIFIER.match(source):
+            return None
+        value = 'v{0}'.format(index)
+        convert = '{0}'
+        if source in converters:
+            namespace['_convert_{0}'.format(index)] = converters[source]
+            convert = '_convert_{0}({{0}})'.format(index)
+        read_object.append('    {0} = {1}'.format(
+            value, convert.format('item.{0}'.format(source))))
+        read_dict.append('    {0} = {1}'.format(
+            value, convert.format('item.get({0!r})'.format(source))))
+        output.append('        {0!r}: {1},'.format(
+            field_name, _format_expression(field, source, value, index,
+                                           namespace)))
+    body = ['    return {'] + output + ['    }']
+    code = '\n'.join(['def _serialize_object(item):'] + read_object + body +
+                     ['def _serialize_dict(item):'] + read_dict + body)
+    exec compile(code, '<{0} serializer>'.format(name), 'exec') in namespace
+    serialize_object = namespace['_serialize_object']
+    serialize_dict = namespace['_serialize_dict']
+
+    def serialize(data):
+        if isinstance(data, list):
+            return [serialize_dict(item) if isinstance(item, dict)
+                    else serialize_object(item) for item in data]
+        if isinstance(data, dict):
+            return serialize_dict(data)
+        return serialize_object(data)
+    return serialize
+
+
+def _format_expression(field, source, value, index, namespace):
+    # the same formatting as the field's `output`, for the plain field types
+    if field.default is None:
+        if type(field) is fields.Raw:
+            return value
+        if type(field) is fields.String:
+            return '{0} if {0} is None else unicode({0})'.format(value)
+        if type(field) is fields.Boolean:
+            return '{0} if {0} is None else bool({0})'.format(value)
+        if type(field) is fields.List and \
+                type(field.container) is fields.Nested and \
+                field.container.attribute is None and \
+                not field.container.allow_null:
+            nested = field.container.nested
+            serialize = _compile(nested, nested.keys(), {},
+                                 'nested {0}'.format(source))
+            if serialize is not None:
+                namespace['_list_{0}'.format(index)] = _list_output(
+                    serialize)
+                return '_list_{0}({1})'.format(index, value)
+    # any other field is given the value to output as the only key of a dict
+    namespace['_field_{0}'.format(index)] = field
+    return '_field_{0}.output({1!r}, {{{1!r}: {2}}})'.format(index, source,
+                                                             value)
+
+
+def _list_output(serialize):
+    # the same as the output of a list of nested fields
+    def output(value):
+        if value is None:
+            return None
+        if is_indexable_but_not_string(value) and not isinstance(value, dict):
+            return [serialize(item) for item in value]
+        return [serialize(value)]
+    return output
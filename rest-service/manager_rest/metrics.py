@@ -0,0 +1,197 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Per-endpoint request metrics, rendered in the Prometheus text format.
+
+Every request is recorded under its URL rule (so that requests of the same
+resource share their metrics regardless of its id), method and response
+status: its latency in a histogram, and the sizes of its request and
+response bodies and the number of storage round trips it made in
+summaries. Metrics are kept per process.
+
+The latency of a request is measured up to its response being ready to be
+sent, so that of a streamed response is measured up to the start of the
+stream, and its size isn't known, so it isn't recorded. Requests which
+fail with an unhandled exception are recorded with a 500 status.
+"""
+
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+METRIC_PREFIX = 'cloudify_rest'
+
+# upper bounds of the latency histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                    10)
+
+LABEL_NAMES = ('endpoint', 'method', 'status')
+
+_request_state = threading.local()
+
+
+def request_started():
+    _request_state.start = time.time()
+    _request_state.storage_round_trips = 0
+    _request_state.response = None
+
+
+def storage_round_trip():
+    """Count a storage round trip of the current request, if any"""
+    if getattr(_request_state, 'start', None) is not None:
+        _request_state.storage_round_trips += 1
+
+
+def response_ready(status, response_size):
+    """Note the response of the current request, once it's ready to be
+    sent"""
+    start = getattr(_request_state, 'start', None)
+    if start is not None:
+        _request_state.response = (status, time.time() - start,
+                                   response_size)
+
+
+def request_finished(endpoint, method, request_size):
+    """Record the current request, which is over, and reset its state. A
+    request whose response wasn't noted failed with an unhandled exception,
+    and was answered with 500."""
+    start = getattr(_request_state, 'start', None)
+    if start is None:
+        return
+    _request_state.start = None
+    response = _request_state.response
+    _request_state.response = None
+    if response is None:
+        response = (500, time.time() - start, None)
+    status, duration, response_size = response
+    request_metrics.observe((endpoint, method, str(status)),
+                            duration,
+                            request_size,
+                            response_size,
+                            _request_state.storage_round_trips)
+
+
+class RequestMetrics(object):
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        # labels -> counts per bucket, followed by the sum and count
+        self._durations = {}
+        # labels -> [sum, count]
+        self._request_sizes = {}
+        self._response_sizes = {}
+        self._storage_round_trips = {}
+
+    def observe(self, labels, duration, request_size, response_size,
+                storage_round_trips):
+        with self._lock:
+            histogram = self._durations.get(labels)
+            if histogram is None:
+                histogram = self._durations[labels] = \
+                    [0] * (len(self._buckets) + 2)
+            for index, bound in enumerate(self._buckets):
+                if duration <= bound:
+                    histogram[index] += 1
+            histogram[-2] += duration
+            histogram[-1] += 1
+            self._add(self._request_sizes, labels, request_size)
+            if response_size is not None:
+                self._add(self._response_sizes, labels, response_size)
+            self._add(self._storage_round_trips, labels, storage_round_trips)
+
+    @staticmethod
+    def _add(summaries, labels, value):
+        summary = summaries.setdefault(labels, [0, 0])
+        summary[0] += value
+        summary[1] += 1
+
+    def render(self):
+        """
+        :return: the metrics in the Prometheus text format.
+        """
+        with self._lock:
+            durations = _copy(self._durations)
+            summaries = [
+                ('request_size_bytes', 'Request body sizes',
+                 _copy(self._request_sizes)),
+                ('response_size_bytes', 'Response body sizes',
+                 _copy(self._response_sizes)),
+                ('storage_round_trips', 'Storage round trips per request',
+                 _copy(self._storage_round_trips))
+            ]
+
+        name = '{0}_request_duration_seconds'.format(METRIC_PREFIX)
+        lines = ['# HELP {0} Request latencies'.format(name),
+                 '# TYPE {0} histogram'.format(name)]
+        bounds = [repr(float(bound)) for bound in self._buckets] + ['+Inf']
+        for labels, histogram in sorted(durations.iteritems()):
+            label_pairs = zip(LABEL_NAMES, labels)
+            # the last bucket holds all the observations
+            counts = histogram[:-2] + histogram[-1:]
+            for bound, count in zip(bounds, counts):
+                lines.append(_sample('{0}_bucket'.format(name),
+                                     label_pairs + [('le', bound)], count))
+            lines.append(_sample('{0}_sum'.format(name), label_pairs,
+                                 histogram[-2]))
+            lines.append(_sample('{0}_count'.format(name), label_pairs,
+                                 histogram[-1]))
+
+        for short_name, help_text, values in summaries:
+            name = '{0}_{1}'.format(METRIC_PREFIX, short_name)
+            lines.append('# HELP {0} {1}'.format(name, help_text))
+            lines.append('# TYPE {0} summary'.format(name))
+            for labels, (total, count) in sorted(values.iteritems()):
+                label_pairs = zip(LABEL_NAMES, labels)
+                lines.append(_sample('{0}_sum'.format(name), label_pairs,
+                                     total))
+                lines.append(_sample('{0}_count'.format(name), label_pairs,
+                                     count))
+        return '\n'.join(lines) + '\n'
+
+
+def render_gauges(name, help_text, stats):
+    """
+    :param stats: a dict of numbers, each of which is rendered as a gauge
+     of the given name, labeled by its key.
+    :return: the gauges in the Prometheus text format.
+    """
+    name = '{0}_{1}'.format(METRIC_PREFIX, name)
+    lines = ['# HELP {0} {1}'.format(name, help_text),
+             '# TYPE {0} gauge'.format(name)]
+    for key, value in sorted(stats.iteritems()):
+        lines.append(_sample(name, [('stat', key)], value))
+    return '\n'.join(lines) + '\n'
+
+
+def _copy(metrics):
+    return dict((labels, list(values))
+                for labels, values in metrics.iteritems())
+
+
+def _sample(name, label_pairs, value):
+    labels = ','.join('{0}="{1}"'.format(label, _escape(label_value))
+                      for label, label_value in label_pairs)
+    return '{0}{{{1}}} {2}'.format(name, labels, repr(float(value)))
+
+
+def _escape(label_value):
+    return unicode(label_value).replace('\\', '\\\\').replace(
+        '"', '\\"').replace('\n', '\\n')
+
+
+request_metrics = RequestMetrics()
@@ -36,6 +36,13 @@ class BlueprintState(SerializableObject):
         'main_file_name'
     }
 
+    # the fields blueprint listings return by default, leaving out the plan
+    summary_fields = ['id', 'description', 'created_at', 'updated_at',
+                      'main_file_name']
+
+    # blueprints are immutable, so these fields identify their content
+    identity_fields = ('id', 'created_at')
+
     def __init__(self, **kwargs):
         self.plan = kwargs['plan']
         self.id = kwargs['id']
@@ -43,6 +50,19 @@ class BlueprintState(SerializableObject):
         self.created_at = kwargs['created_at']
         self.updated_at = kwargs['updated_at']
         self.main_file_name = kwargs['main_file_name']
+        # when set, called to load the plan the first time it's accessed
+        self.plan_loader = kwargs.get('plan_loader')
+
+    @property
+    def plan(self):
+        if self._plan is None and self.plan_loader is not None:
+            self._plan = self.plan_loader()
+            self.plan_loader = None
+        return self._plan
+
+    @plan.setter
+    def plan(self, value):
+        self._plan = value
 
 
 class Snapshot(SerializableObject):
@@ -218,3 +238,18 @@ class Plugin(SerializableObject):
         self.excluded_wheels = kwargs['excluded_wheels']
         self.supported_py_versions = kwargs['supported_py_versions']
         self.uploaded_at = kwargs['uploaded_at']
+
+
+class SharedDocument(SerializableObject):
+    """
+    A sub-document shared by the deployments and nodes of a blueprint
+    holding identical copies of it, identified by the hash of its blueprint
+    id and content
+    """
+
+    fields = {'id', 'blueprint_id', 'value'}
+
+    def __init__(self, **kwargs):
+        self.id = kwargs['id']
+        self.blueprint_id = kwargs['blueprint_id']
+        self.value = kwargs['value']
@@ -0,0 +1,113 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import time
+import threading
+
+# the notifications file is replaced by an empty one once it's this large
+DEFAULT_MAX_FILE_SIZE = 1024 * 1024
+
+DEFAULT_POLL_INTERVAL = 0.5
+
+
+class ChangeNotifier(object):
+    """
+    Notifies the threads of all the processes sharing a notifications file
+    of changes to entities, by key (e.g. execution id).
+
+    The notifications file is an append-only log of the notified keys, one
+    per line, which waiting threads tail from the position they last read:
+    threads of the notifying process are woken right away, and threads of
+    other processes within a poll interval. Once the file grows too large
+    it is replaced by an empty one; threads which were tailing the replaced
+    file can't tell which keys they missed, so they are woken as if their
+    key was notified, and have to check for themselves whether it changed.
+    """
+
+    def __init__(self, path, max_file_size=DEFAULT_MAX_FILE_SIZE,
+                 poll_interval=DEFAULT_POLL_INTERVAL):
+        self._path = path
+        self._max_file_size = max_file_size
+        self._poll_interval = poll_interval
+        self._condition = threading.Condition()
+
+    def cursor(self):
+        """
+        :return: the position after the latest notification, to be passed
+         to `wait`. It should be taken before reading the entity whose
+         change is waited for, so that no change is missed in between.
+        """
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return None, 0
+        return stat.st_ino, stat.st_size
+
+    def notify(self, key):
+        line = '{0}\n'.format(key)
+        try:
+            if os.path.getsize(self._path) + len(line) > \
+                    self._max_file_size:
+                self._replace_file()
+        except OSError:
+            pass
+        # appends of a single short line are atomic, so notifications of
+        # concurrent processes don't interleave
+        with open(self._path, 'a') as f:
+            f.write(line)
+        with self._condition:
+            self._condition.notify_all()
+
+    def _replace_file(self):
+        replacement = '{0}.{1}'.format(self._path, os.getpid())
+        open(replacement, 'w').close()
+        os.rename(replacement, self._path)
+
+    def wait(self, key, cursor, timeout):
+        """
+        Wait until the key is notified after the cursor's position, or
+        until the timeout (in seconds) expires.
+
+        :return: a tuple of whether the key was (possibly) notified, and the
+         cursor to pass to the next call.
+        """
+        deadline = time.time() + timeout
+        while True:
+            notified, cursor = self._read(key, cursor)
+            remaining = deadline - time.time()
+            if notified or remaining <= 0:
+                return notified, cursor
+            with self._condition:
+                self._condition.wait(min(remaining, self._poll_interval))
+
+    def _read(self, key, cursor):
+        inode, position = cursor
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return False, cursor
+        if inode is not None and stat.st_ino != inode or \
+                stat.st_size < position:
+            # the file was replaced
+            return True, (stat.st_ino, stat.st_size)
+        if stat.st_size == position:
+            return False, cursor
+        with open(self._path) as f:
+            f.seek(position)
+            data = f.read(stat.st_size - position)
+        # a line which is still being written is read the next time
+        data = data[:data.rfind('\n') + 1]
+        return key in data.splitlines(), (stat.st_ino, position + len(data))
@@ -0,0 +1,133 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import json
+import threading
+from collections import OrderedDict
+
+from manager_rest import utils
+
+
+class PlanCache(object):
+    """
+    Process-local LRU cache of blueprint plans, keyed by blueprint id and
+    bounded by the serialized size of the cached plans.
+
+    Blueprints are immutable, so a cached plan only becomes stale when its
+    blueprint is deleted (and its id possibly reused). Deletions are
+    announced to the other processes through a generation counter: every
+    invalidation appends a byte to the generation file, so its size is the
+    generation, and a process seeing a new generation drops all its cached
+    plans.
+    """
+
+    def __init__(self, max_bytes, generation_path=None):
+        self._max_bytes = max_bytes
+        self._generation_path = generation_path
+        self._lock = threading.Lock()
+        # blueprint id -> (plan, size in bytes), least recently used first
+        self._plans = OrderedDict()
+        self._size = 0
+        self._generation = self._file_generation()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def generation(self):
+        """The current generation, to be passed to `put`"""
+        return self._invalidations, self._file_generation()
+
+    def _file_generation(self):
+        if not self._generation_path:
+            return 0
+        try:
+            return os.stat(self._generation_path).st_size
+        except OSError:
+            return 0
+
+    def _check_generation(self):
+        generation = self._file_generation()
+        if generation != self._generation:
+            self._plans.clear()
+            self._size = 0
+            self._generation = generation
+
+    def get(self, blueprint_id):
+        """
+        :return: a copy of the cached plan, or None if it isn't cached.
+        """
+        with self._lock:
+            self._check_generation()
+            entry = self._plans.pop(blueprint_id, None)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._plans[blueprint_id] = entry
+            self._hits += 1
+        return utils.copy_json(entry[0])
+
+    def put(self, blueprint_id, plan, generation):
+        """
+        Cache a plan which was read from the storage when the cache was at
+        the given generation. Plans read before an invalidation, and plans
+        larger than the whole cache, aren't cached.
+        """
+        size = len(json.dumps(plan))
+        if size > self._max_bytes:
+            return
+        plan = utils.copy_json(plan)
+        with self._lock:
+            self._check_generation()
+            if generation != (self._invalidations, self._generation):
+                return
+            previous = self._plans.pop(blueprint_id, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._plans[blueprint_id] = (plan, size)
+            self._size += size
+            while self._size > self._max_bytes:
+                _, (_, evicted_size) = self._plans.popitem(last=False)
+                self._size -= evicted_size
+                self._evictions += 1
+
+    def invalidate(self, blueprint_id):
+        """Drop a blueprint's plan in this process and all the others"""
+        with self._lock:
+            self._check_generation()
+            entry = self._plans.pop(blueprint_id, None)
+            if entry is not None:
+                self._size -= entry[1]
+            self._invalidations += 1
+            if self._generation_path:
+                with open(self._generation_path, 'a') as f:
+                    f.write('.')
+                # unless other processes invalidated plans meanwhile, this
+                # process' cache is already up to date
+                self._generation += 1
+                self._check_generation()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'entries': len(self._plans),
+                'size_bytes': self._size,
+                'max_bytes': self._max_bytes
+            }
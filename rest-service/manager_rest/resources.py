@@ -15,6 +15,7 @@
 #
 
 import os
+import json
 import zipfile
 import urllib
 import tempfile
@@ -29,17 +30,24 @@ from setuptools import archive_util
 from flask import (
     request,
     make_response,
+    stream_with_context,
+    Response,
     current_app as app
 )
-from flask.ext.restful import Resource, marshal, reqparse
+from flask.ext.restful import Resource, reqparse
 from flask_restful_swagger import swagger
 from flask.ext.restful.utils import unpack
+from werkzeug.http import quote_etag
 from flask_securest.rest_security import SECURED_MODE, SecuredResource
 
 from dsl_parser import utils as dsl_parser_utils
 
+from manager_rest import compression
 from manager_rest import config
+from manager_rest import etags
 from manager_rest import models
+from manager_rest import marshalling
+from manager_rest import metrics
 from manager_rest import responses
 from manager_rest import requests_schema
 from manager_rest import archiving
@@ -47,7 +55,7 @@ from manager_rest import manager_exceptions
 from manager_rest import utils
 from manager_rest import responses_v2
 from manager_rest.files import UploadedDataManager
-from manager_rest.storage_manager import get_storage_manager
+from manager_rest.storage_manager import get_storage_manager, StreamResult
 from manager_rest.blueprints_manager import (DslParseException,
                                              get_blueprints_manager,
                                              BlueprintsManager)
@@ -57,6 +65,9 @@ from manager_rest.manager_elasticsearch import ManagerElasticsearch
 
 CONVENTION_APPLICATION_BLUEPRINT_FILE = 'blueprint.yaml'
 
+# minimal size in bytes of a chunk sent by a streamed list response
+STREAMED_LIST_CHUNK_SIZE = 64 * 1024
+
 SUPPORTED_ARCHIVE_TYPES = ['zip', 'tar', 'tar.gz', 'tar.bz2']
 
 
@@ -103,16 +114,23 @@ def skip_nested_marshalling():
 
 
 class marshal_with(object):
-    def __init__(self, response_class):
+    def __init__(self, response_class, default_include=None, etag=False):
         """
         :param response_class: response class to marshal result with.
          class must have a "resource_fields" class variable
+        :param default_include: fields to include when the request has no
+         "_include" parameter. By default, all fields are included.
+        :param etag: whether to tag the response, which is a single model,
+         with an ETag header, and answer a request whose If-None-Match
+         header holds the tag with 304 without marshalling the model.
         """
         if not hasattr(response_class, 'resource_fields'):
             raise RuntimeError(
                 'Response class {0} does not contain a "resource_fields" '
                 'class variable'.format(type(response_class)))
         self.response_class = response_class
+        self.default_include = default_include
+        self.etag = etag
 
     def __call__(self, f):
         @wraps(f)
@@ -127,34 +145,41 @@ class marshal_with(object):
                 # contained this parameter, to keep things cleaner (identical
                 # behavior for passing "_include" which contains all fields)
                 kwargs['_include'] = fields_to_include.keys()
+            elif self.default_include:
+                fields_to_include = {
+                    field: fields_to_include[field]
+                    for field in self.default_include}
+                kwargs['_include'] = list(self.default_include)
+
+            # only the marshalled fields are read off the models, as the
+            # others may be loaded lazily
+            serialize = marshalling.get_serializer(self.response_class,
+                                                   fields_to_include)
 
             response = f(*args, **kwargs)
 
+            if isinstance(response, StreamResult):
+                return make_streamed_list_response(response, serialize)
             if isinstance(response, responses_v2.ListResponse):
-                wrapped_items = self.wrap_with_response_object(response.items)
-                response.items = marshal(wrapped_items, fields_to_include)
-                return marshal(response,
-                               responses_v2.ListResponse.resource_fields)
-            if isinstance(response, tuple):
-                data, code, headers = unpack(response)
-                data = self.wrap_with_response_object(data)
-                return marshal(data, fields_to_include), code, headers
-            else:
-                response = self.wrap_with_response_object(response)
-                return marshal(response, fields_to_include)
+                # the same as marshalling the ListResponse, whose fields are
+                # raw
+                return {'metadata': response.metadata,
+                        'items': serialize(response.items)}
+            data, code, headers = unpack(response)
+            if self.etag:
+                etag = etags.make_etag(self.response_class,
+                                       fields_to_include, data)
+                # the client may hold the tag of a compressed response
+                for sent_etag in compression.etag_representations(etag):
+                    if request.if_none_match.contains(sent_etag):
+                        not_modified = Response(status=304)
+                        not_modified.set_etag(sent_etag)
+                        return not_modified
+                headers = dict(headers, ETag=quote_etag(etag))
+            return serialize(data), code, headers
 
         return wrapper
 
-    def wrap_with_response_object(self, data):
-        if isinstance(data, dict):
-            return self.response_class(**data)
-        elif isinstance(data, list):
-            return map(self.wrap_with_response_object, data)
-        elif isinstance(data, models.SerializableObject):
-            return self.wrap_with_response_object(data.to_dict())
-        raise RuntimeError('Unexpected response data type {0}'.format(
-            type(data)))
-
 
 def verify_json_content_type():
     if request.content_type != 'application/json':
@@ -179,6 +204,20 @@ def verify_parameter_in_request_body(param,
                          type(request_json[param]).__name__))
 
 
+def get_update_version(request_json, if_match_version):
+    """
+    :return: the version an update is conditioned on, which is given either
+     by the request body's "version" field or by its If-Match header.
+    """
+    if if_match_version is None:
+        return request_json['version']
+    if request_json.get('version', if_match_version) != if_match_version:
+        raise manager_exceptions.BadParametersError(
+            'Request body version {0} does not match the If-Match header '
+            'version {1}'.format(request_json['version'], if_match_version))
+    return if_match_version
+
+
 def verify_and_convert_bool(attribute_name, str_bool):
     if isinstance(str_bool, bool):
         return str_bool
@@ -203,6 +242,36 @@ def make_streaming_response(res_id, res_path, content_length, archive_type):
     return response
 
 
+def make_streamed_list_response(stream_result, marshal_item):
+    """
+    Make a response which sends a streamed list as a chunked JSON object,
+    structured as a marshalled ListResponse. Items are marshalled and
+    serialized while being iterated, so the list is never held in memory.
+
+    :param stream_result: a StreamResult of the items to send.
+    :param marshal_item: a function returning the marshalled form of an item.
+    """
+    def generate():
+        chunk = ['{{"metadata": {0}, "items": ['.format(
+            json.dumps(stream_result.metadata))]
+        chunk_size = 0
+        separator = ''
+        for item in stream_result.items:
+            serialized_item = separator + json.dumps(marshal_item(item))
+            separator = ', '
+            chunk.append(serialized_item)
+            chunk_size += len(serialized_item)
+            if chunk_size >= STREAMED_LIST_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+                chunk_size = 0
+        chunk.append(']}')
+        yield ''.join(chunk)
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/json')
+
+
 class UploadedBlueprintsManager(UploadedDataManager):
 
     def _get_kind(self):
@@ -423,7 +492,7 @@ class BlueprintsId(SecuredResource):
         notes="Returns a blueprint by its id."
     )
     @exceptions_handled
-    @marshal_with(responses.BlueprintState)
+    @marshal_with(responses.BlueprintState, etag=True)
     def get(self, blueprint_id, _include=None, **kwargs):
         """
         Get blueprint by id
@@ -583,17 +652,56 @@ class ExecutionsId(SecuredResource):
     @swagger.operation(
         responseClass=responses.Execution,
         nickname="getById",
-        notes="Returns the execution state by its id.",
+        notes="Returns the execution state by its id. When "
+              "'wait_for_change' is given, the response is only returned "
+              "once the execution's status differs from it, or once the "
+              "timeout expires.",
+        parameters=[{'name': 'wait_for_change',
+                     'description': 'the status the client last saw',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'string',
+                     'paramType': 'query'},
+                    {'name': 'timeout',
+                     'description': 'seconds to wait for a status change, '
+                                    'at most (and by default) the '
+                                    'configured maximum',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'float',
+                     'paramType': 'query'}]
     )
     @exceptions_handled
-    @marshal_with(responses.Execution)
+    @marshal_with(responses.Execution, etag=True)
     def get(self, execution_id, _include=None, **kwargs):
         """
         Get execution by id
         """
+        if 'wait_for_change' in request.args:
+            return get_blueprints_manager().wait_for_execution_change(
+                execution_id,
+                request.args['wait_for_change'],
+                self._get_wait_timeout(),
+                include=_include)
         return get_blueprints_manager().get_execution(execution_id,
                                                       include=_include)
 
+    @staticmethod
+    def _get_wait_timeout():
+        max_timeout = config.instance().execution_wait_max_timeout
+        if 'timeout' not in request.args:
+            return max_timeout
+        try:
+            timeout = float(request.args['timeout'])
+        except ValueError:
+            timeout = None
+        # not-a-number timeouts fail the comparison too
+        if not timeout >= 0:
+            raise manager_exceptions.BadParametersError(
+                'timeout must be a non-negative number of seconds, got '
+                '{0}'.format(request.args['timeout']))
+        return min(timeout, max_timeout)
+
     @swagger.operation(
         responseClass=responses.Execution,
         nickname="modify_state",
@@ -704,7 +812,7 @@ class DeploymentsId(SecuredResource):
         notes="Returns a deployment by its id."
     )
     @exceptions_handled
-    @marshal_with(responses.Deployment)
+    @marshal_with(responses.Deployment, etag=True)
     def get(self, deployment_id, _include=None, **kwargs):
         """
         Get deployment by id
@@ -851,7 +959,7 @@ class DeploymentModificationsId(SecuredResource):
         notes="Get deployment modification."
     )
     @exceptions_handled
-    @marshal_with(responses.DeploymentModification)
+    @marshal_with(responses.DeploymentModification, etag=True)
     def get(self, modification_id, _include=None, **kwargs):
         return get_storage_manager().get_deployment_modification(
             modification_id, include=_include)
@@ -1002,7 +1110,7 @@ class NodeInstancesId(SecuredResource):
                      'paramType': 'query'}]
     )
     @exceptions_handled
-    @marshal_with(responses.NodeInstance)
+    @marshal_with(responses.NodeInstance, etag=True)
     def get(self, node_instance_id, _include=None, **kwargs):
         """
         Get node instance by id
@@ -1017,7 +1125,8 @@ class NodeInstancesId(SecuredResource):
               "be a dictionary containing 'version' which is used for "
               "optimistic locking during the update, and optionally "
               "'runtime_properties' (dictionary) and/or 'state' (string) "
-              "properties",
+              "properties. Instead of 'version', the request may have an "
+              "If-Match header holding the node instance's ETag",
         parameters=[{'name': 'node_instance_id',
                      'description': 'Node instance identifier',
                      'required': True,
@@ -1026,11 +1135,19 @@ class NodeInstancesId(SecuredResource):
                      'paramType': 'path'},
                     {'name': 'version',
                      'description': 'used for optimistic locking during '
-                                    'update',
-                     'required': True,
+                                    'update. Required unless the If-Match '
+                                    'header is given',
+                     'required': False,
                      'allowMultiple': False,
                      'dataType': 'int',
                      'paramType': 'body'},
+                    {'name': 'If-Match',
+                     'description': 'the ETag of the node instance, as an '
+                                    'alternative to the version',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'string',
+                     'paramType': 'header'},
                     {'name': 'runtime_properties',
                      'description': 'a dictionary of runtime properties. If '
                                     'omitted, the runtime properties wont be '
@@ -1055,9 +1172,12 @@ class NodeInstancesId(SecuredResource):
         Update node instance by id
         """
         verify_json_content_type()
+        if_match_version = etags.version_from_etags(request.if_match)
         if request.json.__class__ is not dict or \
-            'version' not in request.json or \
-                request.json['version'].__class__ is not int:
+            ('version' not in request.json and
+             if_match_version is None) or \
+            ('version' in request.json and
+             request.json['version'].__class__ is not int):
 
             if request.json.__class__ is not dict:
                 message = 'Request body is expected to be a map containing ' \
@@ -1065,7 +1185,8 @@ class NodeInstancesId(SecuredResource):
                           '"runtimeProperties" and/or "state" fields'
             elif 'version' not in request.json:
                 message = 'Request body must be a map containing a ' \
-                          '"version" field'
+                          '"version" field, unless the request has an ' \
+                          'If-Match header'
             else:
                 message = \
                     "request body's 'version' field must be an int but" \
@@ -1081,9 +1202,8 @@ class NodeInstancesId(SecuredResource):
             deployment_id=None,
             runtime_properties=request.json.get('runtime_properties'),
             state=request.json.get('state'),
-            version=request.json['version'])
-        get_storage_manager().update_node_instance(node)
-        return get_storage_manager().get_node_instance(node_instance_id)
+            version=get_update_version(request.json, if_match_version))
+        return get_storage_manager().update_node_instance(node)
 
 
 class DeploymentsIdOutputs(SecuredResource):
@@ -1094,7 +1214,7 @@ class DeploymentsIdOutputs(SecuredResource):
         notes="Gets a specific deployment outputs."
     )
     @exceptions_handled
-    @marshal_with(responses.DeploymentOutputs)
+    @marshal_with(responses.DeploymentOutputs, etag=True)
     def get(self, deployment_id, **kwargs):
         """Get deployment outputs"""
         outputs = get_blueprints_manager().evaluate_deployment_outputs(
@@ -1166,7 +1286,8 @@ class Search(SecuredResource):
         nickname='search',
         notes='Returns results from the storage for the provided '
               'ElasticSearch query. The response format is as ElasticSearch '
-              'response format.',
+              'response format, with the documents of the hits decompressed '
+              'and their shared fields resolved.',
         parameters=[{'name': 'body',
                      'description': 'ElasticSearch query.',
                      'required': True,
@@ -1181,9 +1302,18 @@ class Search(SecuredResource):
         Search using an Elasticsearch query
         """
         verify_json_content_type()
-        return ManagerElasticsearch.search(
+        result = ManagerElasticsearch.search(
             index='cloudify_storage',
             body=request.json)
+        # hits hold the stored form of the documents, which may have
+        # compressed fields and references to shared documents
+        decode_documents = getattr(get_storage_manager(),
+                                   'decode_documents', None)
+        if decode_documents is not None:
+            decode_documents([hit['_source']
+                              for hit in result['hits']['hits']
+                              if '_source' in hit])
+        return result
 
 
 class Status(SecuredResource):
@@ -1238,6 +1368,39 @@ class Status(SecuredResource):
         return os.getenv('DOCKER_ENV') is not None
 
 
+class Metrics(SecuredResource):
+
+    @swagger.operation(
+        nickname="metrics",
+        notes="Returns the request metrics of the serving process, and the "
+              "usage of its caches and storage connection pool, in the "
+              "Prometheus text format"
+    )
+    @exceptions_handled
+    def get(self, **kwargs):
+        """
+        Get the metrics of the REST service
+        """
+        text = [
+            metrics.request_metrics.render(),
+            metrics.render_gauges(
+                'plan_cache', 'Blueprint plan cache usage',
+                get_blueprints_manager().plan_cache.stats()),
+            metrics.render_gauges(
+                'elasticsearch_connection_pool',
+                'Elasticsearch connection pool usage',
+                ManagerElasticsearch.get_connection_pool_stats())
+        ]
+        # only the elasticsearch storage manager caches shared documents
+        shared_documents_cache = getattr(get_storage_manager(),
+                                         'shared_documents_cache', None)
+        if shared_documents_cache is not None:
+            text.append(metrics.render_gauges(
+                'shared_documents_cache', 'Shared documents cache usage',
+                shared_documents_cache.stats()))
+        return Response(''.join(text), content_type=metrics.CONTENT_TYPE)
+
+
 class ProviderContext(SecuredResource):
 
     @swagger.operation(
@@ -1246,7 +1409,7 @@ class ProviderContext(SecuredResource):
         notes="Get the provider context"
     )
     @exceptions_handled
-    @marshal_with(responses.ProviderContext)
+    @marshal_with(responses.ProviderContext, etag=True)
     def get(self, _include=None, **kwargs):
         """
         Get provider context
@@ -17,14 +17,15 @@ import shutil
 import os
 import json
 import tarfile
+import time
 from uuid import uuid4
 from datetime import datetime
-from collections import OrderedDict
+from collections import Counter, OrderedDict
 
 from flask_securest.rest_security import SecuredResource
 
 from flask_restful_swagger import swagger
-from flask import request
+from flask import request, stream_with_context, Response
 from flask.ext.restful import marshal
 
 from manager_rest import resources
@@ -33,14 +34,18 @@ from manager_rest.resources import (marshal_with,
                                     verify_and_convert_bool,
                                     verify_parameter_in_request_body,
                                     verify_json_content_type,
-                                    make_streaming_response)
+                                    get_update_version,
+                                    make_streaming_response,
+                                    make_streamed_list_response)
+from manager_rest import etags
 from manager_rest import models
 from manager_rest import responses_v2
 from manager_rest import manager_exceptions
 from manager_rest import config
 from manager_rest import files
+from manager_rest import storage_manager
 from manager_rest.storage_manager import get_storage_manager
-from manager_rest.storage_manager import ListResult
+from manager_rest.storage_manager import ListResult, StreamResult
 from manager_rest.blueprints_manager import get_blueprints_manager
 from manager_rest.blueprints_manager import \
     TRANSIENT_WORKERS_MODE_ENABLED_DEFAULT
@@ -105,8 +110,10 @@ def marshal_events(func):
     Decorator for marshalling raw event responses
     """
     def marshal_response(*args, **kwargs):
-        return marshal(func(*args, **kwargs),
-                       responses_v2.ListResponse.resource_fields)
+        result = func(*args, **kwargs)
+        if isinstance(result, StreamResult):
+            return make_streamed_list_response(result, lambda event: event)
+        return marshal(result, responses_v2.ListResponse.resource_fields)
     return marshal_response
 
 
@@ -123,6 +130,8 @@ def paginate(func):
         if size:
             pagination_params['size'] = int(size)
         result = func(pagination=pagination_params, *args, **kw)
+        if isinstance(result, StreamResult):
+            return result
 
         return responses_v2.ListResponse(
             items=result.items,
@@ -156,6 +165,31 @@ def create_filters(fields=None):
     return create_filters_dec
 
 
+def is_stream_requested(pagination=None):
+    """
+    Check whether a list should be streamed instead of returned at once,
+    according to the `_stream` request argument. Streamed lists contain all
+    matching items, so they can't be paginated.
+    """
+    stream = verify_and_convert_bool('_stream',
+                                     request.args.get('_stream', 'false'))
+    if stream and pagination:
+        raise manager_exceptions.BadParametersError(
+            'Pagination parameters are not supported when streaming a list')
+    return stream
+
+
+STREAM_PARAM_DESCRIPTION = {
+    'name': '_stream',
+    'description': 'Stream all matching items as a chunked response '
+                   'instead of returning a single page',
+    'required': False,
+    'allowMultiple': False,
+    'dataType': 'bool',
+    'defaultValue': False,
+    'paramType': 'query'}
+
+
 def _create_filter_params_list_description(parameters, list_type):
     return [{'name': filter_val,
              'description': 'List {type} matching the \'{filter}\' '
@@ -225,7 +259,7 @@ class SnapshotsId(SecuredResource):
         notes='Returns a snapshot by its id.'
     )
     @exceptions_handled
-    @marshal_with(responses_v2.Snapshot)
+    @marshal_with(responses_v2.Snapshot, etag=True)
     def get(self, snapshot_id, _include=None, **kwargs):
         return get_blueprints_manager().get_snapshot(snapshot_id,
                                                      include=_include)
@@ -377,7 +411,8 @@ class Blueprints(resources.Blueprints):
         responseClass='List[{0}]'.format(responses_v2.BlueprintState.__name__),
         nickname="list",
         notes='Returns a list of submitted blueprints for the optionally '
-              'provided filter parameters {0}'
+              'provided filter parameters {0}. Blueprint plans are only '
+              'returned when included explicitly'
         .format(models.BlueprintState.fields),
         parameters=_create_filter_params_list_description(
             models.BlueprintState.fields,
@@ -385,14 +420,16 @@ class Blueprints(resources.Blueprints):
         )
     )
     @exceptions_handled
-    @marshal_with(responses_v2.BlueprintState)
+    @marshal_with(responses_v2.BlueprintState,
+                  default_include=models.BlueprintState.summary_fields)
     @create_filters(models.BlueprintState.fields)
     @paginate
     @sortable
     def get(self, _include=None, filters=None, pagination=None, sort=None,
             **kwargs):
         """
-        List uploaded blueprints
+        List uploaded blueprints. Plans are left out, unless explicitly
+        included using the "_include" parameter
         """
         return get_blueprints_manager().blueprints_list(
             include=_include, filters=filters,
@@ -407,7 +444,7 @@ class BlueprintsId(resources.BlueprintsId):
         notes="Returns a blueprint by its id."
     )
     @exceptions_handled
-    @marshal_with(responses_v2.BlueprintState)
+    @marshal_with(responses_v2.BlueprintState, etag=True)
     def get(self, blueprint_id, _include=None, **kwargs):
         """
         Get blueprint by id
@@ -492,7 +529,8 @@ class Executions(resources.Executions):
              'allowMultiple': True,
              'dataType': 'bool',
              'defaultValue': False,
-             'paramType': 'query'}
+             'paramType': 'query'},
+            STREAM_PARAM_DESCRIPTION
         ]
     )
     @exceptions_handled
@@ -513,6 +551,11 @@ class Executions(resources.Executions):
             '_include_system_workflows',
             request.args.get('_include_system_workflows', 'false'))
 
+        if is_stream_requested(pagination):
+            return get_blueprints_manager().iter_executions(
+                filters=filters, sort=sort,
+                is_include_system_workflows=is_include_system_workflows,
+                include=_include)
         executions = get_blueprints_manager().executions_list(
             filters=filters, pagination=pagination, sort=sort,
             is_include_system_workflows=is_include_system_workflows,
@@ -585,7 +628,7 @@ class Nodes(resources.Nodes):
         parameters=_create_filter_params_list_description(
             models.DeploymentNode.fields,
             'nodes'
-        )
+        ) + [STREAM_PARAM_DESCRIPTION]
     )
     @exceptions_handled
     @marshal_with(responses_v2.Node)
@@ -597,6 +640,10 @@ class Nodes(resources.Nodes):
         """
         List nodes
         """
+        if is_stream_requested(pagination):
+            return get_storage_manager().iter_nodes(include=_include,
+                                                    filters=filters,
+                                                    sort=sort)
         nodes = get_storage_manager().get_nodes(include=_include,
                                                 pagination=pagination,
                                                 filters=filters,
@@ -614,7 +661,7 @@ class NodeInstances(resources.NodeInstances):
         parameters=_create_filter_params_list_description(
             models.DeploymentNodeInstance.fields,
             'node instances'
-        )
+        ) + [STREAM_PARAM_DESCRIPTION]
     )
     @exceptions_handled
     @marshal_with(responses_v2.NodeInstance)
@@ -626,11 +673,204 @@ class NodeInstances(resources.NodeInstances):
         """
         List node instances
         """
+        if is_stream_requested(pagination):
+            return get_storage_manager().iter_node_instances(
+                include=_include, filters=filters, sort=sort)
         node_instances = get_storage_manager().get_node_instances(
             include=_include, filters=filters,
             pagination=pagination, sort=sort)
         return node_instances
 
+    @swagger.operation(
+        responseClass='List[{0}]'.format(
+            responses_v2.NodeInstanceUpdateResult.__name__),
+        nickname="updateNodeInstances",
+        notes="Update multiple node instances at once. Expecting the "
+              "request body to be a list of updates, each a dictionary "
+              "containing the node instance 'id', its 'version' which is "
+              "used for optimistic locking during the update, and "
+              "optionally 'runtime_properties' (dictionary) and/or 'state' "
+              "(string) properties. The response holds a result per "
+              "update, in order: its HTTP status code, and either the new "
+              "version of the node instance or the error the update failed "
+              "with.",
+        parameters=[{'name': 'atomic',
+                     'description': 'If true, no update is applied unless '
+                                    'all of them can be; updates which '
+                                    'could be applied then fail with status '
+                                    '424. Otherwise, every update which can '
+                                    'be applied is',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'boolean',
+                     'defaultValue': False,
+                     'paramType': 'query'}],
+        consumes=["application/json"]
+    )
+    @exceptions_handled
+    @marshal_with(responses_v2.NodeInstanceUpdateResult)
+    def patch(self, **kwargs):
+        """
+        Update multiple node instances
+        """
+        verify_json_content_type()
+        request_json = request.json
+        if not isinstance(request_json, list):
+            raise manager_exceptions.BadParametersError(
+                'Request body is expected to be a list of node instance '
+                'updates')
+        max_size = config.instance().node_instance_batch_update_max_size
+        if len(request_json) > max_size:
+            raise manager_exceptions.BadParametersError(
+                'At most {0} node instances may be updated at once, got {1}'
+                .format(max_size, len(request_json)))
+        atomic = verify_and_convert_bool(
+            'atomic', request.args.get('atomic', False))
+        node_updates = [self._node_instance_update(update)
+                        for update in request_json]
+        ids = [node.id for node in node_updates]
+        duplicates = [node_id for node_id, count in Counter(ids).iteritems()
+                      if count > 1]
+        if duplicates:
+            raise manager_exceptions.BadParametersError(
+                'Node instances may only be updated once per request: {0}'
+                .format(', '.join(sorted(duplicates))))
+        results = get_storage_manager().update_node_instances(node_updates,
+                                                              atomic=atomic)
+        return [self._update_result(node_id, result)
+                for node_id, result in zip(ids, results)]
+
+    @staticmethod
+    def _node_instance_update(update):
+        if not isinstance(update, dict):
+            raise manager_exceptions.BadParametersError(
+                'Node instance updates are expected to be maps containing '
+                '"id" and "version" fields and optionally '
+                '"runtime_properties" and/or "state" fields')
+        verify_parameter_in_request_body('id', update,
+                                         param_type=basestring)
+        verify_parameter_in_request_body('version', update, param_type=int)
+        verify_parameter_in_request_body('runtime_properties', update,
+                                         param_type=dict, optional=True)
+        verify_parameter_in_request_body('state', update,
+                                         param_type=basestring,
+                                         optional=True)
+        return models.DeploymentNodeInstance(
+            id=update['id'],
+            node_id=None,
+            relationships=None,
+            host_id=None,
+            deployment_id=None,
+            runtime_properties=update.get('runtime_properties'),
+            state=update.get('state'),
+            version=update['version'])
+
+    @staticmethod
+    def _update_result(node_instance_id, result):
+        if isinstance(result, manager_exceptions.ManagerException):
+            return dict(id=node_instance_id,
+                        status=result.http_code,
+                        version=None,
+                        error_code=result.error_code,
+                        message=str(result))
+        return dict(id=node_instance_id,
+                    status=200,
+                    version=result.version,
+                    error_code=None,
+                    message=None)
+
+
+class NodeInstancesId(resources.NodeInstancesId):
+
+    MERGE_PATCH_CONTENT_TYPE = 'application/merge-patch+json'
+
+    @swagger.operation(
+        responseClass=responses_v2.NodeInstance,
+        nickname="patchNodeState",
+        notes="Update node instance. Expecting the request body to be a "
+              "dictionary containing 'version' which is used for optimistic "
+              "locking during the update, and optionally "
+              "'runtime_properties' (dictionary) and/or 'state' (string) "
+              "properties. Instead of 'version', the request may have an "
+              "If-Match header holding the node instance's ETag. When the "
+              "content type is {0}, "
+              "'runtime_properties' is applied as a JSON merge patch (RFC "
+              "7396): keys set to null are removed and other keys are "
+              "set, leaving the rest of the runtime properties unchanged. "
+              "The response then only contains the node instance id and "
+              "its new version.".format(MERGE_PATCH_CONTENT_TYPE),
+        parameters=[{'name': 'node_instance_id',
+                     'description': 'Node instance identifier',
+                     'required': True,
+                     'allowMultiple': False,
+                     'dataType': 'string',
+                     'paramType': 'path'},
+                    {'name': 'version',
+                     'description': 'used for optimistic locking during '
+                                    'update. Required unless the If-Match '
+                                    'header is given',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'int',
+                     'paramType': 'body'},
+                    {'name': 'If-Match',
+                     'description': 'the ETag of the node instance, as an '
+                                    'alternative to the version',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'string',
+                     'paramType': 'header'},
+                    {'name': 'runtime_properties',
+                     'description': 'a dictionary of runtime properties. If '
+                                    'omitted, the runtime properties wont be '
+                                    'updated',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'dict',
+                     'paramType': 'body'},
+                    {'name': 'state',
+                     'description': "the new node's state. If omitted, "
+                                    "the state wont be updated",
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'string',
+                     'paramType': 'body'}],
+        consumes=["application/json", MERGE_PATCH_CONTENT_TYPE]
+    )
+    @exceptions_handled
+    def patch(self, node_instance_id, **kwargs):
+        """
+        Update node instance by id
+        """
+        if request.mimetype == self.MERGE_PATCH_CONTENT_TYPE:
+            return self._merge_patch(node_instance_id)
+        return super(NodeInstancesId, self).patch(node_instance_id, **kwargs)
+
+    @marshal_with(responses_v2.NodeInstanceVersion)
+    def _merge_patch(self, node_instance_id, **kwargs):
+        request_json = request.get_json(force=True)
+        if not isinstance(request_json, dict):
+            raise manager_exceptions.BadParametersError(
+                'Request body is expected to be a map containing a "version" '
+                'field and optionally "runtime_properties" and/or "state" '
+                'fields')
+        if_match_version = etags.version_from_etags(request.if_match)
+        verify_parameter_in_request_body('version', request_json,
+                                         param_type=int,
+                                         optional=if_match_version is not None)
+        verify_parameter_in_request_body('runtime_properties', request_json,
+                                         param_type=dict, optional=True)
+        verify_parameter_in_request_body('state', request_json,
+                                         param_type=basestring,
+                                         optional=True)
+        version = get_storage_manager().patch_node_instance(
+            node_instance_id,
+            version=get_update_version(request_json, if_match_version),
+            runtime_properties_patch=request_json.get(
+                'runtime_properties', {}),
+            state=request_json.get('state'))
+        return dict(id=node_instance_id, version=version)
+
 
 class ProviderContext(resources.ProviderContext):
     @swagger.operation(
@@ -885,7 +1125,7 @@ class PluginsId(SecuredResource):
         notes="Returns a plugin according to its ID."
     )
     @exceptions_handled
-    @marshal_with(responses_v2.Plugin)
+    @marshal_with(responses_v2.Plugin, etag=True)
     def get(self, plugin_id, _include=None, **kwargs):
         """
         Returns plugin by ID
@@ -964,10 +1204,20 @@ class Events(resources.Events):
                          body=query,
                          _source=include or True)
 
+    def iter_events(self, query, include=None):
+        total, hits = self._scroll(query, include=include)
+        return StreamResult((hit['_source'] for hit in hits), total)
+
+    def _scroll(self, query, include=None):
+        return ManagerElasticsearch.scroll(self._set_index_name(),
+                                           query,
+                                           _source=include or True)
+
     @swagger.operation(
         responseclass='List[Event]',
         nickname="list events",
-        notes='Returns a list of events for optionally provided filters'
+        notes='Returns a list of events for optionally provided filters',
+        parameters=[STREAM_PARAM_DESCRIPTION]
     )
     @exceptions_handled
     @marshal_events
@@ -985,6 +1235,8 @@ class Events(resources.Events):
                                   pagination=pagination,
                                   sort=sort,
                                   range_filters=range_filters)
+        if is_stream_requested(pagination):
+            return self.iter_events(query, include=_include)
         return self.list_events(query, include=_include)
 
     @exceptions_handled
@@ -992,6 +1244,231 @@ class Events(resources.Events):
         raise manager_exceptions.MethodNotAllowedError()
 
 
+class EventsStream(SecuredResource):
+
+    # events are tailed in the order of this sort, and the sort values of
+    # the last sent event are the stream's cursor
+    SORT = OrderedDict([('@timestamp', 'asc'), ('_uid', 'asc')])
+    BATCH_SIZE = 500
+    POLL_INTERVAL = 1
+    HEARTBEAT_INTERVAL = 15
+    # events are indexed asynchronously, so they're tailed for a while
+    # after their execution has ended
+    END_GRACE_PERIOD = 5
+
+    @swagger.operation(
+        nickname="stream events",
+        notes="Streams the events and logs of an execution as server-sent "
+              "events (text/event-stream), starting from the first one, or "
+              "from the one following the one whose id is given by the "
+              "Last-Event-ID header. New events are sent as they are "
+              "indexed, and comments are sent as heartbeats when there are "
+              "none. Shortly after the execution has ended, an 'end' event "
+              "is sent and the stream is closed.",
+        parameters=[{'name': 'execution_id',
+                     'description': 'the id of the execution whose events '
+                                    'are streamed',
+                     'required': True,
+                     'allowMultiple': False,
+                     'dataType': 'string',
+                     'paramType': 'query'},
+                    {'name': 'Last-Event-ID',
+                     'description': 'the id of the last event received',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'string',
+                     'paramType': 'header'}]
+    )
+    @exceptions_handled
+    def get(self, **kwargs):
+        """
+        Stream the events of an execution
+        """
+        execution_id = request.args.get('execution_id')
+        if not execution_id:
+            raise manager_exceptions.BadParametersError(
+                'Missing execution_id query parameter')
+        cursor = self._parse_event_id(request.headers.get('Last-Event-ID'))
+        blueprints_manager = get_blueprints_manager()
+        # a nonexistent execution fails the request before streaming starts
+        execution = blueprints_manager.get_execution(execution_id,
+                                                     include=['status'])
+        response = Response(stream_with_context(self._stream(
+            blueprints_manager, execution_id, execution.status, cursor)),
+            mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    def _stream(self, blueprints_manager, execution_id, status, cursor):
+        notifier = blueprints_manager.execution_notifier
+        notifier_cursor = notifier.cursor()
+        # the number of sent events which have the cursor's timestamp
+        ties = self._count_sent(execution_id, cursor) if cursor else 0
+        last_sent = time.time()
+        ended = None
+        while True:
+            hits = self._search_after(execution_id, cursor, ties)
+            for hit in hits:
+                ties = ties + 1 if cursor and hit['sort'][0] == cursor[0] \
+                    else 1
+                cursor = hit['sort']
+                yield self._format_event(hit)
+            now = time.time()
+            if hits:
+                last_sent = now
+                if len(hits) == self.BATCH_SIZE:
+                    continue
+            if ended is None and status in models.Execution.END_STATES:
+                ended = now
+            if ended is not None and now - ended >= self.END_GRACE_PERIOD:
+                yield 'event: end\ndata: {0}\n\n'.format(json.dumps(
+                    {'execution_id': execution_id, 'status': status}))
+                return
+            if now - last_sent >= self.HEARTBEAT_INTERVAL:
+                yield ': heartbeat\n\n'
+                last_sent = now
+            # waiting for a status update, which is only read when there is
+            # one, for as long as the poll interval
+            notified, notifier_cursor = notifier.wait(
+                execution_id, notifier_cursor, self.POLL_INTERVAL)
+            if notified:
+                status = blueprints_manager.get_execution(
+                    execution_id, include=['status']).status
+
+    def _search_after(self, execution_id, cursor, ties):
+        """
+        :return: the next events after the cursor, up to a batch of them.
+        """
+        range_filters = None
+        if cursor:
+            # the events which have the cursor's timestamp, and were already
+            # sent, are fetched again, and skipped
+            range_filters = {'@timestamp': {'gte': cursor[0]}}
+        query = Events._build_query(
+            filters={'execution_id': execution_id},
+            pagination={'size': self.BATCH_SIZE + ties},
+            sort=OrderedDict(self.SORT),
+            range_filters=range_filters)
+        hits = self._search(query)['hits']['hits']
+        if cursor:
+            hits = [hit for hit in hits if hit['sort'] > cursor]
+        return hits[:self.BATCH_SIZE]
+
+    def _count_sent(self, execution_id, cursor):
+        """
+        :return: the number of events which have the cursor's timestamp,
+                 and were sent before the stream was resumed from it.
+        """
+        timestamp, uid = cursor
+        query = ManagerElasticsearch.build_request_body(
+            filters={'context.execution_id': execution_id},
+            skip_size=True,
+            range_filters={'@timestamp': {'gte': timestamp,
+                                          'lte': timestamp},
+                           '_uid': {'lte': uid}})
+        return self._count(query)['count']
+
+    @staticmethod
+    def _search(query):
+        es = ManagerElasticsearch.get_connection()
+        return es.search(index=Events._set_index_name(), body=query)
+
+    @staticmethod
+    def _count(query):
+        es = ManagerElasticsearch.get_connection()
+        return es.count(index=Events._set_index_name(), body=query)
+
+    @staticmethod
+    def _format_event(hit):
+        timestamp, uid = hit['sort']
+        return 'id: {0}:{1}\ndata: {2}\n\n'.format(
+            timestamp, uid, json.dumps(hit['_source']))
+
+    @staticmethod
+    def _parse_event_id(event_id):
+        if not event_id:
+            return None
+        timestamp, _, uid = event_id.partition(':')
+        try:
+            return [long(timestamp), uid]
+        except ValueError:
+            raise manager_exceptions.BadParametersError(
+                'Invalid Last-Event-ID header: {0}'.format(event_id))
+
+
+class Summary(SecuredResource):
+
+    SUMMARIZED_RESOURCES = {
+        'blueprints': (storage_manager.BLUEPRINT_TYPE,
+                       models.BlueprintState),
+        'deployments': (storage_manager.DEPLOYMENT_TYPE,
+                        models.Deployment),
+        'executions': (storage_manager.EXECUTION_TYPE,
+                       models.Execution),
+        'nodes': (storage_manager.NODE_TYPE,
+                  models.DeploymentNode),
+        'node_instances': (storage_manager.NODE_INSTANCE_TYPE,
+                           models.DeploymentNodeInstance)
+    }
+
+    @swagger.operation(
+        responseClass='List[dict]',
+        nickname="summary",
+        notes='Returns the number of {0} grouped by the values of the '
+              '_target_field parameters, for the optionally provided filter '
+              'parameters. Each item contains a value for every target '
+              'field and the "count" of matching resources.'
+        .format(sorted(SUMMARIZED_RESOURCES.keys())),
+        parameters=[{'name': 'resource',
+                     'description': 'Summarized resource',
+                     'required': True,
+                     'allowMultiple': False,
+                     'dataType': 'string',
+                     'paramType': 'path'},
+                    {'name': '_target_field',
+                     'description': 'Field to group the resources by. The '
+                                    'resources are grouped by the target '
+                                    'fields in the order they are given',
+                     'required': True,
+                     'allowMultiple': True,
+                     'dataType': 'string',
+                     'paramType': 'query'}]
+    )
+    @exceptions_handled
+    @create_filters()
+    def get(self, resource, filters=None, **kwargs):
+        """
+        Summarize resources
+        """
+        if resource not in self.SUMMARIZED_RESOURCES:
+            raise manager_exceptions.NotFoundError(
+                'Resource {0} can not be summarized. Summarized resources '
+                'are: {1}'.format(resource,
+                                  sorted(self.SUMMARIZED_RESOURCES.keys())))
+        doc_type, model_class = self.SUMMARIZED_RESOURCES[resource]
+        target_fields = request.args.getlist('_target_field')
+        if not target_fields:
+            raise manager_exceptions.BadParametersError(
+                'At least one _target_field parameter is required')
+        unknowns = [field for field in target_fields + filters.keys()
+                    if field not in model_class.fields]
+        if unknowns:
+            raise manager_exceptions.BadParametersError(
+                'Fields \'{0}\' do not exist. Allowed fields are: {1}'
+                .format(unknowns, list(model_class.fields)))
+
+        items = get_storage_manager().summarize(doc_type,
+                                                target_fields,
+                                                filters=filters)
+        metadata = {'pagination': {'total': len(items),
+                                   'size': len(items),
+                                   'offset': 0}}
+        return marshal(responses_v2.ListResponse(items=items,
+                                                 metadata=metadata),
+                       responses_v2.ListResponse.resource_fields)
+
+
 def _get_plugin_archive_path(plugin_id, archive_name):
     return os.path.join(config.instance().file_server_uploaded_plugins_folder,
                         plugin_id,
@@ -79,6 +79,9 @@ class Deployment(object):
         'outputs': fields.Raw
     }
 
+    # see manager_rest.marshalling
+    field_converters = {'workflows': '_responsify_workflows_field'}
+
     def __init__(self, **kwargs):
         self.id = kwargs['id']
         self.permalink = kwargs['permalink']
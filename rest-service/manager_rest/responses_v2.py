@@ -99,3 +99,35 @@ class ListResponse(object):
     def __init__(self, **kwargs):
         self.metadata = kwargs['metadata']
         self.items = kwargs['items']
+
+
+@swagger.model
+class NodeInstanceVersion(object):
+
+    resource_fields = {
+        'id': fields.String,
+        'version': fields.Raw
+    }
+
+    def __init__(self, **kwargs):
+        self.id = kwargs['id']
+        self.version = kwargs['version']
+
+
+@swagger.model
+class NodeInstanceUpdateResult(object):
+
+    resource_fields = {
+        'id': fields.String,
+        'status': fields.Integer,
+        'version': fields.Raw,
+        'error_code': fields.String,
+        'message': fields.String
+    }
+
+    def __init__(self, **kwargs):
+        self.id = kwargs['id']
+        self.status = kwargs['status']
+        self.version = kwargs['version']
+        self.error_code = kwargs['error_code']
+        self.message = kwargs['message']
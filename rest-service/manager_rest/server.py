@@ -18,6 +18,7 @@ import functools
 import traceback
 import os
 import yaml
+import logging
 from logging.handlers import RotatingFileHandler
 
 from flask import (
@@ -30,10 +31,13 @@ from flask_restful import Api
 
 from flask_securest.rest_security import SecuREST
 
+from manager_rest import compression
 from manager_rest import endpoint_mapper
 from manager_rest import config
 from manager_rest import storage_manager
+from manager_rest import manager_elasticsearch
 from manager_rest import manager_exceptions
+from manager_rest import metrics
 from manager_rest import utils
 
 
@@ -64,13 +68,24 @@ def setup_app(warnings=None):
     for w in warnings:
         app.logger.warning(w)
 
+    # requests which security rejects are measured as well, so the
+    # measurement starts before security's before-request function
+    app.before_request(metrics.request_started)
+    # after-request functions are skipped for requests which fail with an
+    # unhandled exception, while teardown functions always run
+    app.teardown_request(record_request_metrics)
+
     # secure the app according to manager configuration
     if cfy_config.security_enabled:
         app.logger.info('initializing rest-service security')
         init_secured_app(app)
 
     app.before_request(log_request)
+    app.after_request(note_response)
     app.after_request(log_response)
+    # after-request functions run in reverse order of registration, so the
+    # compressed response is the one logged and measured
+    app.after_request(compression.compress_response)
 
     # saving flask's original error handlers
     flask_handle_exception = app.handle_exception
@@ -106,6 +121,9 @@ def setup_app(warnings=None):
 
 
 def log_request():
+    # formatting the request is costly, and is skipped unless it's logged
+    if not app.logger.isEnabledFor(logging.DEBUG):
+        return
     # form and args parameters are "multidicts", i.e. values are not
     # flattened and will appear in a list (even if single value)
     form_data = request.form.to_dict(False)
@@ -135,6 +153,8 @@ def log_request():
 
 
 def log_response(response):
+    if not app.logger.isEnabledFor(logging.DEBUG):
+        return response
     # content-type and content-length are already included in headers
     # not logging response.data as volumes are massive
 
@@ -149,6 +169,20 @@ def log_response(response):
     return response
 
 
+def note_response(response):
+    metrics.response_ready(response.status_code,
+                           response.calculate_content_length())
+    return response
+
+
+def record_request_metrics(exception):
+    # requests of the same resource are recorded together, whatever its id
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.request_finished(endpoint,
+                             request.method,
+                             request.content_length or 0)
+
+
 def headers_pretty_print(headers):
     pp_headers = ''.join(['\t\t{0}: {1}\n'.format(k, v) for k, v in headers])
     return '\n' + pp_headers
@@ -158,6 +192,7 @@ def reset_state(configuration=None):
     global app
     # print "resetting state in server"
     config.reset(configuration)
+    manager_elasticsearch.reset_clients()
     # this doesn't really do anything
     # blueprints_manager.reset()
     storage_manager.reset()
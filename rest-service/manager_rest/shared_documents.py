@@ -0,0 +1,188 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Content-addressed sharing of the sub-documents which deployments and nodes
+copy from their blueprint's plan.
+
+All the deployments of a blueprint, and all their nodes, hold identical
+copies of the plan's workflows, policies, groups, operations and plugins.
+Each distinct value is stored once per blueprint, as a shared document whose
+id is the hash of the blueprint id and of the value, and the documents hold
+a reference to it instead. Shared documents are immutable, so writing one
+which already exists is a no-op. They are deleted along with their
+blueprint, which has no deployments by then.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from manager_rest import storage_codec
+from manager_rest import utils
+from manager_rest.storage_manager import DEPLOYMENT_TYPE, NODE_TYPE
+
+REFERENCE_KEY = 'shared_document_id'
+
+# values whose json is shorter are cheaper to store than to reference
+MIN_SHARED_SIZE = 128
+
+SHARED_FIELDS = {
+    DEPLOYMENT_TYPE: ('workflows', 'policy_types', 'policy_triggers',
+                      'groups'),
+    NODE_TYPE: ('operations', 'plugins')
+}
+
+
+def is_reference(value):
+    return isinstance(value, dict) and value.keys() == [REFERENCE_KEY]
+
+
+def document_id(blueprint_id, value):
+    # keys are sorted so that equal values always have the same id
+    return hashlib.sha1(json.dumps([blueprint_id, value],
+                                   sort_keys=True)).hexdigest()
+
+
+def share_document(doc_type, doc):
+    """
+    :return: a copy of the document with its designated fields replaced by
+     references, and a dict of the referenced values by shared document id.
+     The values are shared by the documents of the document's blueprint.
+    """
+    fields = SHARED_FIELDS.get(doc_type)
+    if not fields:
+        return doc, {}
+    doc = dict(doc)
+    shared = {}
+    for field in fields:
+        value = doc.get(field)
+        if value is None or is_reference(value) or \
+                storage_codec.is_encoded(value) or \
+                len(json.dumps(value)) < MIN_SHARED_SIZE:
+            continue
+        shared_id = document_id(doc.get('blueprint_id'), value)
+        shared[shared_id] = value
+        doc[field] = {REFERENCE_KEY: shared_id}
+    return doc, shared
+
+
+def resolve_references(docs, fetch, cache=None):
+    """
+    Replace the references held by documents with the values they reference,
+    in place. Values which aren't cached are fetched by a single call of
+    `fetch` with their shared document ids, which returns a dict of the
+    values by id.
+    """
+    shared_ids = set(value[REFERENCE_KEY] for doc in docs
+                     for value in doc.itervalues() if is_reference(value))
+    if not shared_ids:
+        return docs
+    values = cache.get_many(shared_ids) if cache else {}
+    missing = shared_ids.difference(values)
+    if missing:
+        fetched = fetch(missing)
+        if cache:
+            cache.put_many(fetched)
+        values.update(fetched)
+    for doc in docs:
+        for field, value in doc.items():
+            if is_reference(value):
+                # every document gets its own copy, which it may modify
+                doc[field] = utils.copy_json(values[value[REFERENCE_KEY]])
+    return docs
+
+
+class SharedDocumentCache(object):
+    """
+    Process-local LRU cache of shared document values, by id. Shared
+    documents are immutable, so cached values only become stale when their
+    blueprint is deleted (and its id possibly reused). Blueprint deletions
+    are announced to the other processes by the plan cache's generation
+    file, whose growth drops all the cached values, as it does cached plans.
+    """
+
+    def __init__(self, max_entries, generation_path=None):
+        self._max_entries = max_entries
+        self._generation_path = generation_path
+        self._lock = threading.Lock()
+        # shared document id -> value, least recently used first
+        self._values = OrderedDict()
+        self._generation = self._file_generation()
+        self._hits = 0
+        self._misses = 0
+
+    def _file_generation(self):
+        if not self._generation_path:
+            return 0
+        try:
+            return os.stat(self._generation_path).st_size
+        except OSError:
+            return 0
+
+    def _check_generation(self):
+        generation = self._file_generation()
+        if generation != self._generation:
+            self._values.clear()
+            self._generation = generation
+
+    def contains(self, shared_id):
+        """Whether a shared document is known to exist, without counting
+        as a hit or a miss"""
+        with self._lock:
+            self._check_generation()
+            return shared_id in self._values
+
+    def get_many(self, shared_ids):
+        """
+        :return: a dict of the cached values by id. The values are shared,
+         and must not be modified.
+        """
+        found = {}
+        with self._lock:
+            self._check_generation()
+            for shared_id in shared_ids:
+                value = self._values.pop(shared_id, None)
+                if value is None:
+                    self._misses += 1
+                    continue
+                self._values[shared_id] = value
+                found[shared_id] = value
+                self._hits += 1
+        return found
+
+    def put_many(self, values):
+        with self._lock:
+            self._check_generation()
+            for shared_id, value in values.iteritems():
+                self._values.pop(shared_id, None)
+                self._values[shared_id] = value
+            while len(self._values) > self._max_entries:
+                self._values.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'entries': len(self._values),
+                'max_entries': self._max_entries
+            }
@@ -0,0 +1,821 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from manager_rest import config
+from manager_rest import manager_exceptions
+from manager_rest import utils
+from manager_rest.storage_manager import (ListResult,
+                                          StreamResult,
+                                          reject_updates,
+                                          NODE_TYPE,
+                                          NODE_INSTANCE_TYPE,
+                                          PLUGIN_TYPE,
+                                          BLUEPRINT_TYPE,
+                                          SNAPSHOT_TYPE,
+                                          DEPLOYMENT_TYPE,
+                                          DEPLOYMENT_MODIFICATION_TYPE,
+                                          EXECUTION_TYPE,
+                                          PROVIDER_CONTEXT_TYPE)
+from manager_rest.models import (BlueprintState,
+                                 Snapshot,
+                                 Deployment,
+                                 DeploymentModification,
+                                 Execution,
+                                 DeploymentNode,
+                                 DeploymentNodeInstance,
+                                 ProviderContext,
+                                 Plugin)
+
+PROVIDER_CONTEXT_ID = 'CONTEXT'
+
+# column types. JSON columns hold plans, properties, runtime properties and
+# the like, serialized to text.
+TEXT = 'TEXT'
+INTEGER = 'INTEGER'
+BOOLEAN = 'BOOLEAN'
+JSON = 'JSON'
+
+# every table is named after its document type, and has a 'storage_id'
+# primary key column in addition to the model's fields
+SCHEMA = {
+    BLUEPRINT_TYPE: (BlueprintState, [
+        ('id', TEXT),
+        ('description', TEXT),
+        ('main_file_name', TEXT),
+        ('created_at', TEXT),
+        ('updated_at', TEXT),
+        ('plan', JSON)]),
+    SNAPSHOT_TYPE: (Snapshot, [
+        ('id', TEXT),
+        ('status', TEXT),
+        ('error', TEXT),
+        ('created_at', TEXT)]),
+    DEPLOYMENT_TYPE: (Deployment, [
+        ('id', TEXT),
+        ('blueprint_id', TEXT),
+        ('permalink', TEXT),
+        ('created_at', TEXT),
+        ('updated_at', TEXT),
+        ('workflows', JSON),
+        ('inputs', JSON),
+        ('policy_types', JSON),
+        ('policy_triggers', JSON),
+        ('groups', JSON),
+        ('outputs', JSON)]),
+    DEPLOYMENT_MODIFICATION_TYPE: (DeploymentModification, [
+        ('id', TEXT),
+        ('deployment_id', TEXT),
+        ('status', TEXT),
+        ('created_at', TEXT),
+        ('ended_at', TEXT),
+        ('modified_nodes', JSON),
+        ('node_instances', JSON),
+        ('context', JSON)]),
+    EXECUTION_TYPE: (Execution, [
+        ('id', TEXT),
+        ('deployment_id', TEXT),
+        ('blueprint_id', TEXT),
+        ('workflow_id', TEXT),
+        ('status', TEXT),
+        ('error', TEXT),
+        ('created_at', TEXT),
+        ('is_system_workflow', BOOLEAN),
+        ('parameters', JSON)]),
+    NODE_TYPE: (DeploymentNode, [
+        ('id', TEXT),
+        ('deployment_id', TEXT),
+        ('blueprint_id', TEXT),
+        ('type', TEXT),
+        ('host_id', TEXT),
+        ('number_of_instances', INTEGER),
+        ('planned_number_of_instances', INTEGER),
+        ('deploy_number_of_instances', INTEGER),
+        ('type_hierarchy', JSON),
+        ('properties', JSON),
+        ('operations', JSON),
+        ('plugins', JSON),
+        ('relationships', JSON),
+        ('plugins_to_install', JSON)]),
+    NODE_INSTANCE_TYPE: (DeploymentNodeInstance, [
+        ('id', TEXT),
+        ('deployment_id', TEXT),
+        ('node_id', TEXT),
+        ('host_id', TEXT),
+        ('state', TEXT),
+        ('version', INTEGER),
+        ('runtime_properties', JSON),
+        ('relationships', JSON)]),
+    PLUGIN_TYPE: (Plugin, [
+        ('id', TEXT),
+        ('package_name', TEXT),
+        ('archive_name', TEXT),
+        ('package_source', TEXT),
+        ('package_version', TEXT),
+        ('supported_platform', TEXT),
+        ('distribution', TEXT),
+        ('distribution_version', TEXT),
+        ('distribution_release', TEXT),
+        ('uploaded_at', TEXT),
+        ('wheels', JSON),
+        ('excluded_wheels', JSON),
+        ('supported_py_versions', JSON)]),
+    PROVIDER_CONTEXT_TYPE: (ProviderContext, [
+        ('name', TEXT),
+        ('context', JSON)])
+}
+
+INDEXES = [
+    (BLUEPRINT_TYPE, 'created_at'),
+    (DEPLOYMENT_TYPE, 'blueprint_id'),
+    (DEPLOYMENT_MODIFICATION_TYPE, 'deployment_id'),
+    (EXECUTION_TYPE, 'deployment_id'),
+    (EXECUTION_TYPE, 'blueprint_id'),
+    (EXECUTION_TYPE, 'workflow_id'),
+    (EXECUTION_TYPE, 'status'),
+    (NODE_TYPE, 'deployment_id'),
+    (NODE_INSTANCE_TYPE, 'deployment_id'),
+    (NODE_INSTANCE_TYPE, 'node_id'),
+    (NODE_INSTANCE_TYPE, 'state')
+]
+
+# number of rows fetched at a time when streaming a list
+STREAM_CHUNK_SIZE = 500
+
+
+class SQLiteStorageManager(object):
+    """
+    SQLite based storage manager.
+
+    Every document type is stored in its own table, with typed columns for
+    the filterable fields and JSON columns for the nested structures.
+    Operations which write several rows do so in a single transaction. The
+    database is used in WAL mode, so readers aren't blocked by writers.
+    """
+
+    def __init__(self, db_path, timeout=30):
+        self._db_path = db_path
+        self._timeout = timeout
+        self._local = threading.local()
+        with self._transaction() as connection:
+            for doc_type, (_, columns) in SCHEMA.iteritems():
+                column_definitions = ', '.join(
+                    '{0} {1}'.format(name, column_type)
+                    for name, column_type in columns)
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS {0} (storage_id TEXT '
+                    'PRIMARY KEY, {1})'.format(doc_type,
+                                               column_definitions))
+            for doc_type, column in INDEXES:
+                connection.execute(
+                    'CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})'
+                    .format(doc_type, column))
+
+    @property
+    def _connection(self):
+        # sqlite connections can't be shared between threads, nor used by
+        # a forked process
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self._db_path,
+                                         timeout=self._timeout,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.transaction_depth = 0
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        """Run the block in a transaction, which takes the database write
+        lock right away. Nested blocks are part of the outermost
+        transaction.
+        """
+        connection = self._connection
+        if self._local.transaction_depth:
+            self._local.transaction_depth += 1
+            try:
+                yield connection
+            finally:
+                self._local.transaction_depth -= 1
+            return
+
+        connection.execute('BEGIN IMMEDIATE')
+        self._local.transaction_depth = 1
+        try:
+            yield connection
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        finally:
+            self._local.transaction_depth = 0
+
+    @staticmethod
+    def _columns(doc_type):
+        return SCHEMA[doc_type][1]
+
+    @classmethod
+    def _column(cls, doc_type, field):
+        for name, column_type in cls._columns(doc_type):
+            if name == field:
+                return name, column_type
+        raise manager_exceptions.BadParametersError(
+            'Unknown {0} field: {1}'.format(doc_type, field))
+
+    @classmethod
+    def _encode(cls, doc_type, item):
+        values = []
+        for name, column_type in cls._columns(doc_type):
+            value = getattr(item, name, None)
+            if column_type == JSON and value is not None:
+                value = json.dumps(value)
+            values.append(value)
+        return values
+
+    @classmethod
+    def _decode(cls, doc_type, names, row):
+        model_class, columns = SCHEMA[doc_type]
+        column_types = dict(columns)
+        fields = dict.fromkeys(model_class.fields)
+        for name, value in zip(names, row):
+            if value is not None:
+                if column_types[name] == JSON:
+                    value = json.loads(value)
+                elif column_types[name] == BOOLEAN:
+                    value = bool(value)
+            fields[name] = value
+        return model_class(**fields)
+
+    @classmethod
+    def _selected_columns(cls, doc_type, include=None):
+        names = [name for name, _ in cls._columns(doc_type)]
+        if include:
+            names = [name for name in names if name in include]
+        return names
+
+    @classmethod
+    def _where(cls, doc_type, filters=None):
+        conditions = []
+        params = []
+        for field, values in (filters or {}).iteritems():
+            name, column_type = cls._column(doc_type, field)
+            if not isinstance(values, list):
+                values = [values]
+            conditions.append('{0} IN ({1})'.format(
+                name, ', '.join('?' * len(values))))
+            params.extend(values)
+        where = ' WHERE {0}'.format(' AND '.join(conditions)) \
+            if conditions else ''
+        return where, params
+
+    def _select(self, doc_type, include=None, filters=None, sort=None,
+                pagination=None):
+        names = self._selected_columns(doc_type, include)
+        where, params = self._where(doc_type, filters)
+        query = 'SELECT {0} FROM {1}{2}'.format(', '.join(names),
+                                                doc_type,
+                                                where)
+        if sort:
+            query += ' ORDER BY {0}'.format(', '.join(
+                '{0} {1}'.format(self._column(doc_type, field)[0],
+                                 'DESC' if order == 'desc' else 'ASC')
+                for field, order in sort.iteritems()))
+        pagination = pagination or {}
+        if 'size' in pagination or 'offset' in pagination:
+            query += ' LIMIT ? OFFSET ?'
+            params = params + [pagination.get('size', -1),
+                               pagination.get('offset', 0)]
+        return names, self._connection.execute(query, params)
+
+    def _get_items_list(self, doc_type, include=None, filters=None,
+                        pagination=None, sort=None):
+        names, cursor = self._select(doc_type, include=include,
+                                     filters=filters, sort=sort,
+                                     pagination=pagination)
+        items = [self._decode(doc_type, names, row) for row in cursor]
+        pagination = pagination or {}
+        metadata = {'pagination': {
+            'total': self.count(doc_type, filters),
+            'size': pagination.get('size', len(items)),
+            'offset': pagination.get('offset', 0)}}
+        return ListResult(items, metadata)
+
+    def _iter_items(self, doc_type, include=None, filters=None, sort=None):
+        total = self.count(doc_type, filters)
+        names, cursor = self._select(doc_type, include=include,
+                                     filters=filters, sort=sort)
+
+        def _items():
+            try:
+                while True:
+                    rows = cursor.fetchmany(STREAM_CHUNK_SIZE)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield self._decode(doc_type, names, row)
+            finally:
+                cursor.close()
+        return StreamResult(_items(), total)
+
+    def _get_item(self, doc_type, storage_id, include=None):
+        names = self._selected_columns(doc_type, include)
+        row = self._connection.execute(
+            'SELECT {0} FROM {1} WHERE storage_id = ?'.format(
+                ', '.join(names), doc_type),
+            (storage_id,)).fetchone()
+        if row is None:
+            raise manager_exceptions.NotFoundError(
+                '{0} {1} not found'.format(doc_type, storage_id))
+        return self._decode(doc_type, names, row)
+
+    def _get_items_by_ids(self, doc_type, storage_ids, include=None):
+        if not storage_ids:
+            return []
+        names = self._selected_columns(doc_type, include)
+        rows = self._connection.execute(
+            'SELECT storage_id, {0} FROM {1} WHERE storage_id IN ({2})'
+            .format(', '.join(names), doc_type,
+                    ', '.join('?' * len(storage_ids))),
+            list(storage_ids)).fetchall()
+        items = {row[0]: self._decode(doc_type, names, row[1:])
+                 for row in rows}
+        missing = [storage_id for storage_id in storage_ids
+                   if storage_id not in items]
+        if missing:
+            raise manager_exceptions.NotFoundError(
+                '{0} {1} not found'.format(doc_type, ', '.join(missing)))
+        return [items[storage_id] for storage_id in storage_ids]
+
+    def _insert_statement(self, doc_type):
+        names = [name for name, _ in self._columns(doc_type)]
+        return 'INSERT INTO {0} (storage_id, {1}) VALUES (?, {2})'.format(
+            doc_type, ', '.join(names), ', '.join('?' * len(names)))
+
+    def _put_item(self, doc_type, storage_id, item):
+        try:
+            with self._transaction() as connection:
+                connection.execute(self._insert_statement(doc_type),
+                                   [storage_id] +
+                                   self._encode(doc_type, item))
+        except sqlite3.IntegrityError:
+            raise manager_exceptions.ConflictError(
+                '{0} {1} already exists'.format(doc_type, storage_id))
+
+    def _put_items(self, doc_type, items):
+        """
+        Insert items in a single transaction. Items which already exist are
+        left untouched; the ids of all such items are reported by a single
+        ConflictError, raised after the other items were inserted.
+
+        :param items: an iterable of (storage id, item) tuples.
+        :return: the number of inserted items.
+        """
+        statement = self._insert_statement(doc_type)
+        created = 0
+        conflicts = []
+        with self._transaction() as connection:
+            for storage_id, item in items:
+                try:
+                    connection.execute(statement,
+                                       [storage_id] +
+                                       self._encode(doc_type, item))
+                    created += 1
+                except sqlite3.IntegrityError:
+                    conflicts.append(storage_id)
+        if conflicts:
+            raise manager_exceptions.ConflictError(
+                'Some {0} documents already exist: {1}'.format(
+                    doc_type, ', '.join(conflicts)))
+        return created
+
+    def _update_columns(self, doc_type, storage_id, values, not_found):
+        values = dict((name, value) for name, value in values.iteritems()
+                      if value is not None)
+        if not values:
+            # only verify the item exists
+            self._get_item(doc_type, storage_id, include=['id'])
+            return
+        columns = dict(self._columns(doc_type))
+        assignments = []
+        params = []
+        for name, value in values.iteritems():
+            self._column(doc_type, name)
+            assignments.append('{0} = ?'.format(name))
+            params.append(json.dumps(value) if columns[name] == JSON
+                          else value)
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                'UPDATE {0} SET {1} WHERE storage_id = ?'.format(
+                    doc_type, ', '.join(assignments)),
+                params + [storage_id])
+        if cursor.rowcount == 0:
+            raise manager_exceptions.NotFoundError(not_found)
+
+    def _delete_item(self, doc_type, storage_id):
+        with self._transaction() as connection:
+            item = self._get_item(doc_type, storage_id)
+            connection.execute(
+                'DELETE FROM {0} WHERE storage_id = ?'.format(doc_type),
+                (storage_id,))
+        return item
+
+    def count(self, doc_type, filters=None):
+        where, params = self._where(doc_type, filters)
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM {0}{1}'.format(doc_type, where),
+            params).fetchone()[0]
+
+    def exists(self, doc_type, filters=None):
+        where, params = self._where(doc_type, filters)
+        return self._connection.execute(
+            'SELECT EXISTS (SELECT 1 FROM {0}{1})'.format(doc_type, where),
+            params).fetchone()[0] == 1
+
+    def summarize(self, doc_type, target_fields, filters=None):
+        names = [self._column(doc_type, field)[0] for field in target_fields]
+        where, params = self._where(doc_type, filters)
+        # like elasticsearch's terms aggregations, items missing a target
+        # field aren't counted
+        not_null = ' AND '.join('{0} IS NOT NULL'.format(name)
+                                for name in names)
+        where = '{0} AND {1}'.format(where, not_null) if where \
+            else ' WHERE {0}'.format(not_null)
+        rows = self._connection.execute(
+            'SELECT {0}, COUNT(*) FROM {1}{2} GROUP BY {0} '
+            'ORDER BY COUNT(*) DESC'.format(', '.join(names), doc_type,
+                                            where),
+            params)
+        return [dict(zip(target_fields, row[:-1]), count=row[-1])
+                for row in rows]
+
+    def blueprints_list(self, include=None, filters=None, pagination=None,
+                        sort=None):
+        return self._get_items_list(BLUEPRINT_TYPE, include=include,
+                                    filters=filters, pagination=pagination,
+                                    sort=sort)
+
+    def snapshots_list(self, include=None, filters=None, pagination=None,
+                       sort=None):
+        return self._get_items_list(SNAPSHOT_TYPE, include=include,
+                                    filters=filters, pagination=pagination,
+                                    sort=sort)
+
+    def deployments_list(self, include=None, filters=None, pagination=None,
+                         sort=None):
+        return self._get_items_list(DEPLOYMENT_TYPE, include=include,
+                                    filters=filters, pagination=pagination,
+                                    sort=sort)
+
+    def executions_list(self, include=None, filters=None, pagination=None,
+                        sort=None):
+        return self._get_items_list(EXECUTION_TYPE, include=include,
+                                    filters=filters, pagination=pagination,
+                                    sort=sort)
+
+    def get_blueprint_deployments(self, blueprint_id, include=None):
+        return self._get_items_list(DEPLOYMENT_TYPE, include=include,
+                                    filters={'blueprint_id': blueprint_id})
+
+    def get_node_instance(self, node_instance_id, include=None):
+        return self._get_item(NODE_INSTANCE_TYPE, node_instance_id,
+                              include=include)
+
+    def get_node_instances_by_ids(self, node_instance_ids, include=None):
+        return self._get_items_by_ids(NODE_INSTANCE_TYPE, node_instance_ids,
+                                      include=include)
+
+    def get_nodes_by_ids(self, deployment_id, node_ids, include=None):
+        return self._get_items_by_ids(
+            NODE_TYPE,
+            [self._storage_node_id(deployment_id, node_id)
+             for node_id in node_ids],
+            include=include)
+
+    def get_node(self, deployment_id, node_id, include=None):
+        return self._get_item(NODE_TYPE,
+                              self._storage_node_id(deployment_id, node_id),
+                              include=include)
+
+    def get_node_instances(self, include=None, filters=None, pagination=None,
+                           sort=None):
+        return self._get_items_list(NODE_INSTANCE_TYPE, include=include,
+                                    filters=filters, pagination=pagination,
+                                    sort=sort)
+
+    def get_plugins(self, include=None, filters=None, pagination=None,
+                    sort=None):
+        return self._get_items_list(PLUGIN_TYPE, include=include,
+                                    filters=filters, pagination=pagination,
+                                    sort=sort)
+
+    def get_nodes(self, include=None, filters=None, pagination=None,
+                  sort=None):
+        return self._get_items_list(NODE_TYPE, include=include,
+                                    filters=filters, pagination=pagination,
+                                    sort=sort)
+
+    def iter_executions(self, include=None, filters=None, sort=None):
+        return self._iter_items(EXECUTION_TYPE, include=include,
+                                filters=filters, sort=sort)
+
+    def iter_nodes(self, include=None, filters=None, sort=None):
+        return self._iter_items(NODE_TYPE, include=include,
+                                filters=filters, sort=sort)
+
+    def iter_node_instances(self, include=None, filters=None, sort=None):
+        return self._iter_items(NODE_INSTANCE_TYPE, include=include,
+                                filters=filters, sort=sort)
+
+    def get_blueprint(self, blueprint_id, include=None):
+        return self._get_item(BLUEPRINT_TYPE, blueprint_id, include=include)
+
+    def get_snapshot(self, snapshot_id, include=None):
+        return self._get_item(SNAPSHOT_TYPE, snapshot_id, include=include)
+
+    def get_deployment(self, deployment_id, include=None):
+        return self._get_item(DEPLOYMENT_TYPE, deployment_id, include=include)
+
+    def get_execution(self, execution_id, include=None):
+        return self._get_item(EXECUTION_TYPE, execution_id, include=include)
+
+    def get_plugin(self, plugin_id, include=None):
+        return self._get_item(PLUGIN_TYPE, plugin_id, include=include)
+
+    def put_blueprint(self, blueprint_id, blueprint):
+        self._put_item(BLUEPRINT_TYPE, str(blueprint_id), blueprint)
+
+    def put_snapshot(self, snapshot_id, snapshot):
+        self._put_item(SNAPSHOT_TYPE, str(snapshot_id), snapshot)
+
+    def put_deployment(self, deployment_id, deployment):
+        self._put_item(DEPLOYMENT_TYPE, str(deployment_id), deployment)
+
+    def put_execution(self, execution_id, execution):
+        self._put_item(EXECUTION_TYPE, str(execution_id), execution)
+
+    def put_plugin(self, plugin):
+        self._put_item(PLUGIN_TYPE, str(plugin.id), plugin)
+
+    def put_node(self, node):
+        self._put_item(NODE_TYPE,
+                       self._storage_node_id(node.deployment_id, node.id),
+                       node)
+
+    def put_node_instance(self, node_instance):
+        self._put_item(NODE_INSTANCE_TYPE, str(node_instance.id),
+                       self._initial_version(node_instance))
+        return 1
+
+    def put_nodes_bulk(self, nodes):
+        return self._put_items(
+            NODE_TYPE,
+            ((self._storage_node_id(node.deployment_id, node.id), node)
+             for node in nodes))
+
+    def put_node_instances_bulk(self, node_instances):
+        return self._put_items(
+            NODE_INSTANCE_TYPE,
+            ((str(node_instance.id), self._initial_version(node_instance))
+             for node_instance in node_instances))
+
+    def replace_node_instances(self, deployment_id, node_instances):
+        """
+        Replace all the node instances of a deployment, in a single
+        transaction.
+
+        :return: the number of created node instances.
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                'DELETE FROM {0} WHERE deployment_id = ?'.format(
+                    NODE_INSTANCE_TYPE),
+                (deployment_id,))
+            return self.put_node_instances_bulk(node_instances)
+
+    @staticmethod
+    def _initial_version(node_instance):
+        # like elasticsearch, versions are assigned by the storage
+        fields = node_instance.to_dict()
+        fields['version'] = 1
+        return DeploymentNodeInstance(**fields)
+
+    def delete_blueprint(self, blueprint_id):
+        return self._delete_item(BLUEPRINT_TYPE, blueprint_id)
+
+    def delete_plugin(self, plugin_id):
+        return self._delete_item(PLUGIN_TYPE, plugin_id)
+
+    def delete_snapshot(self, snapshot_id):
+        return self._delete_item(SNAPSHOT_TYPE, snapshot_id)
+
+    def update_snapshot_status(self, snapshot_id, status, error):
+        self._update_columns(SNAPSHOT_TYPE, str(snapshot_id),
+                             {'status': status, 'error': error},
+                             'Snapshot {0} not found'.format(snapshot_id))
+
+    def update_execution_status(self, execution_id, status, error):
+        self._update_columns(EXECUTION_TYPE, str(execution_id),
+                             {'status': status, 'error': error},
+                             'Execution {0} not found'.format(execution_id))
+
+    def delete_deployment(self, deployment_id):
+        with self._transaction() as connection:
+            deployment = self._get_item(DEPLOYMENT_TYPE, deployment_id)
+            for doc_type in (EXECUTION_TYPE, NODE_INSTANCE_TYPE, NODE_TYPE,
+                             DEPLOYMENT_MODIFICATION_TYPE):
+                connection.execute(
+                    'DELETE FROM {0} WHERE deployment_id = ?'.format(
+                        doc_type),
+                    (deployment_id,))
+            connection.execute(
+                'DELETE FROM {0} WHERE storage_id = ?'.format(
+                    DEPLOYMENT_TYPE),
+                (deployment_id,))
+        return deployment
+
+    def delete_execution(self, execution_id):
+        return self._delete_item(EXECUTION_TYPE, execution_id)
+
+    def delete_node(self, node_id):
+        return self._delete_item(NODE_TYPE, node_id)
+
+    def delete_node_instance(self, node_instance_id):
+        return self._delete_item(NODE_INSTANCE_TYPE, node_instance_id)
+
+    def update_node(self, deployment_id, node_id,
+                    number_of_instances=None,
+                    planned_number_of_instances=None):
+        self._update_columns(
+            NODE_TYPE,
+            self._storage_node_id(deployment_id, node_id),
+            {'number_of_instances': number_of_instances,
+             'planned_number_of_instances': planned_number_of_instances},
+            'Node {0} not found'.format(node_id))
+
+    def _get_node_instance_for_update(self, node_instance_id, version):
+        try:
+            current = self._get_item(NODE_INSTANCE_TYPE, node_instance_id)
+        except manager_exceptions.NotFoundError:
+            raise manager_exceptions.NotFoundError(
+                'Node instance {0} not found'.format(node_instance_id))
+        if version != 0 and current.version != version:
+            raise manager_exceptions.ConflictError(
+                'Node instance update conflict [current_version={0}, updated_'
+                'version={1}]'.format(current.version, version))
+        return current
+
+    def _replace_node_instance(self, node_instance):
+        self._connection.execute(
+            'UPDATE {0} SET state = ?, version = ?, runtime_properties = ?, '
+            'relationships = ? WHERE storage_id = ?'.format(
+                NODE_INSTANCE_TYPE),
+            (node_instance.state,
+             node_instance.version,
+             json.dumps(node_instance.runtime_properties),
+             json.dumps(node_instance.relationships),
+             node_instance.id))
+
+    def update_node_instance(self, node):
+        """
+        Update the state, runtime properties and/or relationships of a node
+        instance. Unless `node.version` is 0, the update is only applied if
+        the stored node instance version matches it.
+
+        :return: the updated node instance, including its new version.
+        """
+        with self._transaction():
+            updated = self._get_node_instance_for_update(node.id,
+                                                         node.version)
+            if node.state is not None:
+                updated.state = node.state
+            if node.runtime_properties is not None:
+                updated.runtime_properties = node.runtime_properties
+            if node.relationships is not None:
+                updated.relationships = node.relationships
+            updated.version += 1
+            self._replace_node_instance(updated)
+        return updated
+
+    def patch_node_instance(self, node_instance_id, version,
+                            runtime_properties_patch, state=None):
+        """
+        Apply a JSON merge patch (RFC 7396) to the runtime properties of a
+        node instance, and optionally set its state. Unless `version` is 0,
+        the patch is only applied if the stored node instance version
+        matches it.
+
+        :return: the new version of the node instance.
+        """
+        with self._transaction():
+            updated = self._get_node_instance_for_update(node_instance_id,
+                                                         version)
+            updated.runtime_properties = utils.merge_patch(
+                updated.runtime_properties, runtime_properties_patch)
+            if state is not None:
+                updated.state = state
+            updated.version += 1
+            self._replace_node_instance(updated)
+        return updated.version
+
+    def update_node_instances(self, node_updates, atomic=False):
+        """
+        Update the state and/or runtime properties of multiple node
+        instances in a single transaction. Unless its version is 0, each
+        update is only applied if the stored node instance version matches
+        it. When `atomic` is set, no update is applied unless all of them
+        can be.
+
+        :param node_updates: node instance updates with unique ids.
+        :return: for each update, in order, either the updated node
+         instance or the ManagerException its update failed with.
+        """
+        node_updates = list(node_updates)
+        with self._transaction():
+            results = []
+            for node in node_updates:
+                try:
+                    results.append(self._get_node_instance_for_update(
+                        node.id, node.version))
+                except manager_exceptions.ManagerException as e:
+                    results.append(e)
+            if atomic and any(isinstance(result,
+                                         manager_exceptions.ManagerException)
+                              for result in results):
+                return reject_updates(results)
+            for node, updated in zip(node_updates, results):
+                if isinstance(updated, manager_exceptions.ManagerException):
+                    continue
+                if node.state is not None:
+                    updated.state = node.state
+                if node.runtime_properties is not None:
+                    updated.runtime_properties = node.runtime_properties
+                updated.version += 1
+                self._replace_node_instance(updated)
+        return results
+
+    def put_provider_context(self, provider_context):
+        self._put_item(PROVIDER_CONTEXT_TYPE, PROVIDER_CONTEXT_ID,
+                       provider_context)
+
+    def update_provider_context(self, provider_context):
+        self._update_columns(PROVIDER_CONTEXT_TYPE, PROVIDER_CONTEXT_ID,
+                             provider_context.to_dict(),
+                             'Provider Context not found')
+
+    def get_provider_context(self, include=None):
+        try:
+            return self._get_item(PROVIDER_CONTEXT_TYPE, PROVIDER_CONTEXT_ID,
+                                  include=include)
+        except manager_exceptions.NotFoundError:
+            raise manager_exceptions.NotFoundError('Provider context not set')
+
+    def put_deployment_modification(self, modification_id, modification):
+        self._put_item(DEPLOYMENT_MODIFICATION_TYPE, str(modification_id),
+                       modification)
+
+    def get_deployment_modification(self, modification_id, include=None):
+        return self._get_item(DEPLOYMENT_MODIFICATION_TYPE, modification_id,
+                              include=include)
+
+    def update_deployment_modification(self, modification):
+        self._update_columns(
+            DEPLOYMENT_MODIFICATION_TYPE,
+            modification.id,
+            {'status': modification.status,
+             'ended_at': modification.ended_at,
+             'node_instances': modification.node_instances},
+            'Modification {0} not found'.format(modification.id))
+
+    def deployment_modifications_list(self, include=None, filters=None,
+                                      pagination=None, sort=None):
+        return self._get_items_list(DEPLOYMENT_MODIFICATION_TYPE,
+                                    include=include, filters=filters,
+                                    pagination=pagination, sort=sort)
+
+    @staticmethod
+    def _storage_node_id(deployment_id, node_id):
+        return '{0}_{1}'.format(deployment_id, node_id)
+
+
+def create():
+    return SQLiteStorageManager(config.instance().db_sqlite_path)
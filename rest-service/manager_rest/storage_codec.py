@@ -0,0 +1,91 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Compressed storage of large opaque document fields.
+
+The designated fields are never searched, so they are stored as a codec
+header followed by the base64 encoded, zlib compressed json of their value.
+Values which are too small to benefit are stored as they are, and so are
+documents written before compression was introduced: decoding only touches
+values which start with the codec header.
+"""
+
+import json
+import zlib
+import base64
+
+from manager_rest.storage_manager import (BLUEPRINT_TYPE,
+                                          DEPLOYMENT_TYPE,
+                                          NODE_TYPE,
+                                          SHARED_DOCUMENT_TYPE)
+
+CODEC_HEADER = '\x00zlib:'
+
+# values whose json is shorter are stored uncompressed
+MIN_COMPRESSED_SIZE = 512
+
+COMPRESSED_FIELDS = {
+    BLUEPRINT_TYPE: ('plan',),
+    DEPLOYMENT_TYPE: ('workflows',),
+    NODE_TYPE: ('properties', 'operations'),
+    SHARED_DOCUMENT_TYPE: ('value',)
+}
+
+
+def is_encoded(value):
+    return isinstance(value, basestring) and value.startswith(CODEC_HEADER)
+
+
+def encode(value):
+    if value is None or is_encoded(value):
+        return value
+    serialized = json.dumps(value)
+    if len(serialized) < MIN_COMPRESSED_SIZE:
+        return value
+    return CODEC_HEADER + base64.b64encode(zlib.compress(serialized))
+
+
+def decode(value):
+    if not is_encoded(value):
+        return value
+    return json.loads(zlib.decompress(
+        base64.b64decode(value[len(CODEC_HEADER):])))
+
+
+def encode_document(doc_type, doc):
+    """
+    :return: a copy of the document, with its designated fields encoded.
+    """
+    fields = COMPRESSED_FIELDS.get(doc_type)
+    if not fields:
+        return doc
+    doc = dict(doc)
+    for field in fields:
+        if field in doc:
+            doc[field] = encode(doc[field])
+    return doc
+
+
+def decode_document(doc):
+    """
+    Decode the encoded fields of a document, in place. Only the fields the
+    document holds are decoded, so projecting out a field skips its
+    decompression.
+    """
+    for field, value in doc.iteritems():
+        if is_encoded(value):
+            doc[field] = decode(value)
+    return doc
@@ -16,9 +16,25 @@
 import importlib
 from flask import current_app
 
+from manager_rest import manager_exceptions
+
 # storage_manager_module_name = 'file_storage_manager'
+# storage_manager_module_name = 'manager_rest.sqlite_storage_manager'
 storage_manager_module_name = 'manager_rest.es_storage_manager'
 
+# Document types, as used by the storage managers' generic primitives
+# (count, exists)
+NODE_TYPE = 'node'
+NODE_INSTANCE_TYPE = 'node_instance'
+PLUGIN_TYPE = 'plugin'
+BLUEPRINT_TYPE = 'blueprint'
+SNAPSHOT_TYPE = 'snapshot'
+DEPLOYMENT_TYPE = 'deployment'
+DEPLOYMENT_MODIFICATION_TYPE = 'deployment_modification'
+EXECUTION_TYPE = 'execution'
+PROVIDER_CONTEXT_TYPE = 'provider_context'
+SHARED_DOCUMENT_TYPE = 'shared_document'
+
 _instance = None
 
 
@@ -63,3 +79,32 @@ class ListResult(object):
     def __init__(self, items, metadata):
         self.items = items
         self.metadata = metadata
+
+
+class StreamResult(ListResult):
+    """
+    a StreamResult contains an iterator over the requested items, which
+    lazily fetches them from the storage while being consumed. Streamed
+    lists are never paginated.
+    """
+    def __init__(self, items, total):
+        metadata = {'pagination': {'total': total,
+                                   'size': total,
+                                   'offset': 0}}
+        super(StreamResult, self).__init__(items, metadata)
+
+
+def reject_updates(results):
+    """
+    Reject a batch of updates since some of them failed, for storage
+    managers which apply a batch all-or-nothing.
+
+    :param results: the results of the batch updates, each either an
+     updated item or the ManagerException its update failed with.
+    :return: the results with every update which didn't fail replaced by
+     an UpdateNotAppliedError.
+    """
+    return [result if isinstance(result, manager_exceptions.ManagerException)
+            else manager_exceptions.UpdateNotAppliedError(
+                'Not applied since other updates failed')
+            for result in results]
@@ -243,6 +243,10 @@ class BaseServerTestCase(unittest.TestCase):
         test_config.file_server_uploaded_blueprints_folder = \
             FILE_SERVER_UPLOADED_BLUEPRINTS_FOLDER
         test_config.file_server_resources_uri = FILE_SERVER_RESOURCES_URI
+        test_config.plan_cache_generation_path = os.path.join(
+            self.tmpdir, 'plan_cache_generation')
+        test_config.execution_notifications_path = os.path.join(
+            self.tmpdir, 'execution_notifications')
         test_config.rest_service_log_level = 'DEBUG'
         test_config.rest_service_log_path = self.rest_service_log
         test_config.rest_service_log_file_size_MB = 100,
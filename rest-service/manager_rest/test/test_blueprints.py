@@ -16,9 +16,11 @@
 import os
 import tempfile
 
+from mock import patch
 from nose.plugins.attrib import attr
 
 from manager_rest import archiving
+from manager_rest.blueprints_manager import get_blueprints_manager
 from manager_rest.file_server import FileServer
 from manager_rest.test import base_test
 from cloudify_rest_client.exceptions import CloudifyClientError
@@ -47,7 +49,8 @@ class BlueprintsTestCase(base_test.BaseServerTestCase):
         post_blueprints_response = self.put_file(
             *self.put_blueprint_args(blueprint_id='hello_world')).json
         self.assertEquals('hello_world', post_blueprints_response['id'])
-        get_blueprints_response = self.client.blueprints.list()
+        get_blueprints_response = self.client.blueprints.list(
+            _include=list(post_blueprints_response))
         self.assertEquals(1, len(get_blueprints_response))
         self.assertEquals(post_blueprints_response, get_blueprints_response[0])
 
@@ -286,3 +289,18 @@ class BlueprintsTestCase(base_test.BaseServerTestCase):
                         response.headers['Content-Disposition'])
         self.assertTrue(archive_filename in
                         response.headers['X-Accel-Redirect'])
+
+    def test_listed_plans_are_loaded_lazily(self):
+        # the server module can only be imported once the test environment
+        # is set up
+        from manager_rest import server
+        self.put_file(*self.put_blueprint_args(blueprint_id='hello_world'))
+        with server.app.app_context():
+            bm = get_blueprints_manager()
+            with patch.object(bm.sm, 'get_blueprint',
+                              wraps=bm.sm.get_blueprint) as get_blueprint:
+                blueprint = bm.blueprints_list(include=['id']).items[0]
+                self.assertFalse(get_blueprint.called)
+                self.assertIn('nodes', blueprint.plan)
+                self.assertIn('nodes', blueprint.plan)
+                self.assertEqual(1, get_blueprint.call_count)
@@ -0,0 +1,97 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import json
+import urllib
+import zlib
+
+from nose.plugins.attrib import attr
+
+from manager_rest import config
+from manager_rest.test import base_test
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class BaseCompressionTest(base_test.BaseServerTestCase):
+
+    def _get(self, resource_path, accept_encoding, query_params=None):
+        return self.app.get(urllib.quote(self._version_url(resource_path)),
+                            headers={'Accept-Encoding': accept_encoding},
+                            query_string=base_test.build_query_string(
+                                query_params))
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class CompressionTestCase(BaseCompressionTest):
+
+    def test_compressed_response(self):
+        self.put_deployment('deployment')
+        config.instance().response_compression_min_size = 0
+        expected = self.get('/deployments/deployment').json
+
+        response = self._get('/deployments/deployment', 'gzip')
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(expected, json.loads(
+            zlib.decompress(response.data, GZIP_WBITS)))
+
+        response = self._get('/deployments/deployment',
+                             'gzip;q=0.5, deflate')
+        self.assertEqual('deflate', response.headers['Content-Encoding'])
+        self.assertEqual(expected, json.loads(zlib.decompress(response.data)))
+
+    def test_compressed_response_etag(self):
+        self.put_deployment('deployment')
+        config.instance().response_compression_min_size = 0
+        etag = self._get('/deployments/deployment', 'identity').headers[
+            'ETag']
+
+        response = self._get('/deployments/deployment', 'gzip')
+        compressed_etag = response.headers['ETag']
+        self.assertEqual('{0}-gzip"'.format(etag[:-1]), compressed_etag)
+
+        not_modified = self.app.get(
+            self._version_url('/deployments/deployment'),
+            headers={'Accept-Encoding': 'gzip',
+                     'If-None-Match': compressed_etag})
+        self.assertEqual(304, not_modified.status_code)
+        self.assertEqual(compressed_etag, not_modified.headers['ETag'])
+
+    def test_uncompressed_response(self):
+        # small responses aren't worth compressing
+        response = self._get('/version', 'gzip')
+        self.assertNotIn('Content-Encoding', response.headers)
+        json.loads(response.data)
+
+        config.instance().response_compression_min_size = 0
+        response = self._get('/version', 'identity')
+        self.assertNotIn('Content-Encoding', response.headers)
+        config.instance().response_compression_level = 0
+        response = self._get('/version', 'gzip')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+
+@attr(client_min_version=2, client_max_version=base_test.LATEST_API_VERSION)
+class StreamCompressionTestCase(BaseCompressionTest):
+
+    def test_compressed_stream(self):
+        self.put_deployment('deployment')
+        expected = self.get('/node-instances', query_params={'_sort': 'id'})
+        response = self._get('/node-instances', 'gzip',
+                             query_params={'_stream': 'true', '_sort': 'id'})
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertEqual(expected.json['items'], json.loads(
+            zlib.decompress(response.data, GZIP_WBITS))['items'])
@@ -0,0 +1,337 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import unittest
+
+import elasticsearch.exceptions
+from mock import MagicMock, PropertyMock, patch
+from nose.plugins.attrib import attr
+
+from manager_rest import config
+from manager_rest import es_storage_manager
+from manager_rest import manager_exceptions
+from manager_rest import models
+from manager_rest import shared_documents
+from manager_rest import storage_codec
+from manager_rest.es_storage_manager import ESStorageManager
+from manager_rest.test import base_test
+
+
+class BaseESStorageManagerTestCase(unittest.TestCase):
+    """
+    Tests of the elasticsearch storage manager against a mocked connection,
+    which don't need the REST service to run.
+    """
+
+    def setUp(self):
+        super(BaseESStorageManagerTestCase, self).setUp()
+        self.addCleanup(config.reset, config.instance())
+        config.reset(config.Config())
+        self.connection = MagicMock()
+        patcher = patch.object(ESStorageManager, '_connection',
+                               new_callable=PropertyMock,
+                               return_value=self.connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        es_storage_manager._mutations.clear()
+        es_storage_manager._refreshed_mutations.clear()
+        self.sm = ESStorageManager('localhost', 9200)
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ESWriteVisibilityTestCase(BaseESStorageManagerTestCase):
+
+    def setUp(self):
+        super(ESWriteVisibilityTestCase, self).setUp()
+        self.connection.search.return_value = {'hits': {'hits': [],
+                                                        'total': 0}}
+
+    def _update_execution_status(self):
+        self.sm.update_execution_status('execution-id', 'started', '')
+        return self.connection.update.call_args[1]
+
+    def test_strict_mode_refreshes_on_mutation(self):
+        self.assertTrue(self._update_execution_status().get('refresh'))
+        self.sm.executions_list()
+        self.assertFalse(self.connection.indices.refresh.called)
+
+    def test_read_your_writes_refreshes_before_search(self):
+        config.instance().db_write_visibility = 'read_your_writes'
+        self.assertNotIn('refresh', self._update_execution_status())
+        self.sm.executions_list()
+        self.assertEqual(1, self.connection.indices.refresh.call_count)
+        # nothing was mutated since the last refresh
+        self.sm.executions_list()
+        self.assertEqual(1, self.connection.indices.refresh.call_count)
+
+    def test_search_during_refresh_refreshes_again(self):
+        config.instance().db_write_visibility = 'read_your_writes'
+        self._update_execution_status()
+
+        def _refresh(**kwargs):
+            self.connection.indices.refresh.side_effect = None
+            # the refresh in progress may not cover the write yet
+            self.sm.executions_list()
+        self.connection.indices.refresh.side_effect = _refresh
+        self.sm.executions_list()
+        self.assertEqual(2, self.connection.indices.refresh.call_count)
+        self.sm.executions_list()
+        self.assertEqual(2, self.connection.indices.refresh.call_count)
+
+    def test_periodic_mode_per_type(self):
+        config.instance().db_write_visibility_per_type = {
+            'execution': 'periodic'}
+        self.assertNotIn('refresh', self._update_execution_status())
+        self.sm.executions_list()
+        self.assertFalse(self.connection.indices.refresh.called)
+        # deletes by query must see every document
+        self.sm.delete_deployment('deployment-id')
+        self.assertEqual(1, self.connection.indices.refresh.call_count)
+        self.assertTrue(self.connection.delete.call_args[1].get('refresh'))
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ESNodeInstanceUpdateTestCase(BaseESStorageManagerTestCase):
+
+    def setUp(self):
+        super(ESNodeInstanceUpdateTestCase, self).setUp()
+        self.source = {'id': 'instance-id',
+                       'node_id': 'node-id',
+                       'host_id': None,
+                       'deployment_id': 'deployment-id',
+                       'relationships': [],
+                       'state': 'started',
+                       'runtime_properties': {'key': 'value'}}
+
+    @staticmethod
+    def _node_instance_update(version, state=None, runtime_properties=None):
+        return models.DeploymentNodeInstance(
+            id='instance-id', node_id=None, host_id=None, deployment_id=None,
+            relationships=None, state=state,
+            runtime_properties=runtime_properties, version=version)
+
+    def test_state_update_is_a_single_conditional_request(self):
+        self.connection.update.return_value = {
+            '_version': 3, 'get': {'_source': self.source}}
+        updated = self.sm.update_node_instance(
+            self._node_instance_update(2, state='started'))
+        self.assertEqual(3, updated.version)
+        self.assertEqual('started', updated.state)
+        kwargs = self.connection.update.call_args[1]
+        self.assertEqual(2, kwargs['version'])
+        self.assertEqual({'doc': {'state': 'started'}}, kwargs['body'])
+        self.assertFalse(self.connection.get.called)
+        self.assertFalse(self.connection.index.called)
+
+    def test_runtime_properties_update_replaces_document(self):
+        self.connection.get.return_value = {'_version': 2,
+                                            '_source': self.source}
+        self.connection.index.return_value = {'_version': 3}
+        updated = self.sm.update_node_instance(
+            self._node_instance_update(2, runtime_properties={'new': 'v'}))
+        self.assertEqual(3, updated.version)
+        self.assertEqual({'new': 'v'}, updated.runtime_properties)
+        self.assertEqual(2, self.connection.index.call_args[1]['version'])
+
+    def test_version_conflict(self):
+        self.connection.update.side_effect = \
+            elasticsearch.exceptions.ConflictError(409, 'conflict')
+        self.assertRaises(manager_exceptions.ConflictError,
+                          self.sm.update_node_instance,
+                          self._node_instance_update(2, state='started'))
+
+        self.connection.get.return_value = {'_version': 3,
+                                            '_source': self.source}
+        self.assertRaises(manager_exceptions.ConflictError,
+                          self.sm.update_node_instance,
+                          self._node_instance_update(
+                              2, runtime_properties={}))
+        self.assertFalse(self.connection.index.called)
+
+    def test_merge_patch_is_a_partial_update(self):
+        self.connection.update.return_value = {'_version': 3}
+        version = self.sm.patch_node_instance(
+            'instance-id', 2, {'key': 'new_value', 'map': {'a': 'b'}})
+        self.assertEqual(3, version)
+        kwargs = self.connection.update.call_args[1]
+        self.assertEqual(2, kwargs['version'])
+        self.assertEqual({'doc': {'runtime_properties': {
+            'key': 'new_value', 'map': {'a': 'b'}}}}, kwargs['body'])
+        self.assertFalse(self.connection.get.called)
+
+    def test_merge_patch_removing_keys(self):
+        self.connection.get.return_value = {'_version': 2,
+                                            '_source': self.source}
+        self.connection.index.return_value = {'_version': 3}
+        version = self.sm.patch_node_instance(
+            'instance-id', 2, {'key': None, 'new_key': 'value'})
+        self.assertEqual(3, version)
+        kwargs = self.connection.index.call_args[1]
+        self.assertEqual(2, kwargs['version'])
+        self.assertEqual({'new_key': 'value'},
+                         kwargs['body']['runtime_properties'])
+
+    def test_get_node_instances_by_ids(self):
+        self.connection.mget.return_value = {'docs': [
+            {'_id': 'instance-id', 'found': True, '_version': 4,
+             '_source': self.source},
+            {'_id': 'missing-id', 'found': False}]}
+        self.assertRaises(manager_exceptions.NotFoundError,
+                          self.sm.get_node_instances_by_ids,
+                          ['instance-id', 'missing-id'])
+
+        self.connection.mget.return_value = {'docs': [
+            {'_id': 'instance-id', 'found': True, '_version': 4,
+             '_source': self.source}]}
+        instances = self.sm.get_node_instances_by_ids(['instance-id'])
+        self.assertEqual(2, self.connection.mget.call_count)
+        self.assertEqual(['instance-id'], [i.id for i in instances])
+        self.assertEqual(4, instances[0].version)
+
+    def test_update_node_instances_is_a_bulk_request(self):
+        self.connection.mget.return_value = {'docs': [
+            {'_id': 'instance-id', 'found': True, '_version': 2,
+             '_source': dict(self.source)},
+            {'_id': 'other-id', 'found': True, '_version': 5,
+             '_source': dict(self.source, id='other-id')},
+            {'_id': 'missing-id', 'found': False}]}
+        self.connection.bulk.return_value = {'items': [
+            {'index': {'_id': 'instance-id', 'status': 200, '_version': 3}},
+            {'index': {'_id': 'other-id', 'status': 409}}]}
+        updates = [self._node_instance_update(2, state='stopped'),
+                   self._node_instance_update(0, runtime_properties={}),
+                   self._node_instance_update(1)]
+        updates[1].id = 'other-id'
+        updates[2].id = 'missing-id'
+        results = self.sm.update_node_instances(updates)
+        self.assertEqual(3, results[0].version)
+        self.assertEqual('stopped', results[0].state)
+        self.assertIsInstance(results[1], manager_exceptions.ConflictError)
+        self.assertIsInstance(results[2], manager_exceptions.NotFoundError)
+        self.assertEqual(1, self.connection.bulk.call_count)
+        actions = self.connection.bulk.call_args[0][0]
+        self.assertEqual(2, actions[0]['index']['_version'])
+        # unconditional updates have no version
+        self.assertNotIn('_version', actions[2]['index'])
+        self.assertEqual({}, actions[3]['runtime_properties'])
+        self.assertFalse(self.connection.update.called)
+        self.assertFalse(self.connection.index.called)
+
+    def test_update_node_instances_write_failure(self):
+        self.connection.mget.return_value = {'docs': [
+            {'_id': 'instance-id', 'found': True, '_version': 2,
+             '_source': dict(self.source)},
+            {'_id': 'other-id', 'found': True, '_version': 5,
+             '_source': dict(self.source, id='other-id')}]}
+        self.connection.bulk.return_value = {'items': [
+            {'index': {'_id': 'instance-id', 'status': 200, '_version': 3}},
+            {'index': {'_id': 'other-id', 'status': 400,
+                       'error': 'MapperParsingException'}}]}
+        updates = [self._node_instance_update(2, state='stopped'),
+                   self._node_instance_update(5, state='stopped')]
+        updates[1].id = 'other-id'
+        results = self.sm.update_node_instances(updates)
+        self.assertEqual(3, results[0].version)
+        self.assertIsInstance(results[1], manager_exceptions.StorageError)
+        self.assertEqual(400, results[1].http_code)
+        self.assertIn('MapperParsingException', str(results[1]))
+
+    def test_atomic_update_node_instances_version_conflict(self):
+        self.connection.mget.return_value = {'docs': [
+            {'_id': 'instance-id', 'found': True, '_version': 3,
+             '_source': self.source}]}
+        results = self.sm.update_node_instances(
+            [self._node_instance_update(2, state='stopped')], atomic=True)
+        self.assertIsInstance(results[0], manager_exceptions.ConflictError)
+        self.assertFalse(self.connection.bulk.called)
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ESCountTestCase(BaseESStorageManagerTestCase):
+
+    def test_count(self):
+        self.connection.count.return_value = {'count': 7}
+        self.assertEqual(7, self.sm.count('node_instance',
+                                          {'deployment_id': 'dep-id'}))
+        kwargs = self.connection.count.call_args[1]
+        self.assertEqual('node_instance', kwargs['doc_type'])
+        self.assertNotIn('size', kwargs['body'])
+        self.assertEqual(
+            [{'term': {'deployment_id': 'dep-id'}}],
+            kwargs['body']['query']['filtered']['filter']['bool']['must'])
+        self.assertFalse(self.connection.search.called)
+
+    def test_exists_terminates_after_first_match(self):
+        self.connection.search.return_value = {'hits': {'hits': [],
+                                                        'total': 1}}
+        self.assertTrue(self.sm.exists('deployment',
+                                       {'blueprint_id': 'bp-id'}))
+        kwargs = self.connection.search.call_args[1]
+        self.assertEqual(0, kwargs['body']['size'])
+        self.assertEqual({'terminate_after': 1}, kwargs['params'])
+
+        self.connection.search.return_value = {'hits': {'hits': [],
+                                                        'total': 0}}
+        self.assertFalse(self.sm.exists('deployment'))
+
+    def test_summarize_nests_terms_aggregations(self):
+        self.connection.search.return_value = {'aggregations': {
+            'deployment_id': {'buckets': [
+                {'key': 'dep1', 'doc_count': 3, 'state': {'buckets': [
+                    {'key': 'started', 'doc_count': 2},
+                    {'key': 'deleted', 'doc_count': 1}]}},
+                {'key': 'dep2', 'doc_count': 1, 'state': {'buckets': [
+                    {'key': 'started', 'doc_count': 1}]}}]}}}
+        items = self.sm.summarize('node_instance',
+                                  ['deployment_id', 'state'],
+                                  filters={'node_id': 'vm'})
+        self.assertEqual([
+            {'deployment_id': 'dep1', 'state': 'started', 'count': 2},
+            {'deployment_id': 'dep1', 'state': 'deleted', 'count': 1},
+            {'deployment_id': 'dep2', 'state': 'started', 'count': 1}],
+            items)
+        body = self.connection.search.call_args[1]['body']
+        self.assertEqual(0, body['size'])
+        self.assertEqual(
+            {'deployment_id': {
+                'terms': {'field': 'deployment_id', 'size': 0},
+                'aggs': {'state': {'terms': {'field': 'state',
+                                             'size': 0}}}}},
+            body['aggs'])
+        self.assertIn('query', body)
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ESDecodeDocumentsTestCase(BaseESStorageManagerTestCase):
+
+    def test_decode_documents(self):
+        workflows = {'install': {'operation': 'install',
+                                 'parameters': {'x': 'y' * 200}}}
+        plan = {'nodes': [{'id': 'node_{0}'.format(i)} for i in range(50)]}
+        deployment, shared = shared_documents.share_document(
+            'deployment', {'id': 'dep', 'workflows': workflows})
+        shared_id, = shared
+        self.connection.mget.return_value = {'docs': [
+            {'_id': shared_id, 'found': True,
+             '_source': {'value': storage_codec.encode(workflows)}}]}
+        docs = [storage_codec.encode_document('deployment', deployment),
+                storage_codec.encode_document('blueprint',
+                                              {'id': 'bp', 'plan': plan})]
+
+        self.sm.decode_documents(docs)
+        self.assertEqual([{'id': 'dep', 'workflows': workflows},
+                          {'id': 'bp', 'plan': plan}], docs)
+        self.assertEqual([shared_id],
+                         self.connection.mget.call_args[1]['body']['ids'])
@@ -0,0 +1,140 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import json
+import urllib
+
+from mock import MagicMock
+from nose.plugins.attrib import attr
+
+from manager_rest import etags
+from manager_rest import models
+from manager_rest import responses
+from manager_rest import storage_manager
+from manager_rest.test import base_test
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ETagsTestCase(base_test.BaseServerTestCase):
+
+    def _put_node_instance(self, version=None):
+        storage_manager._get_instance().put_node_instance(
+            models.DeploymentNodeInstance(id='1234',
+                                          node_id='node',
+                                          deployment_id='dep',
+                                          runtime_properties={'key': 1},
+                                          state='started',
+                                          version=version,
+                                          relationships=None,
+                                          host_id=None))
+
+    def _get(self, resource_path, query_params=None, headers=None):
+        return self.app.get(urllib.quote(self._version_url(resource_path)),
+                            headers=headers,
+                            query_string=base_test.build_query_string(
+                                query_params))
+
+    def _patch(self, resource_path, data, headers=None):
+        return self.app.patch(
+            urllib.quote(self._version_url(resource_path)),
+            content_type='application/json',
+            headers=headers,
+            data=json.dumps(data))
+
+    def test_if_none_match(self):
+        self._put_node_instance()
+        response = self._get('/node-instances/1234')
+        self.assertEqual(200, response.status_code)
+        etag = response.headers['ETag']
+
+        not_modified = self._get('/node-instances/1234',
+                                 headers={'If-None-Match': etag})
+        self.assertEqual(304, not_modified.status_code)
+        self.assertEqual(etag, not_modified.headers['ETag'])
+        self.assertEqual('', not_modified.data)
+
+        self.patch('/node-instances/1234', {'state': 'stopped',
+                                            'version': 0})
+        modified = self._get('/node-instances/1234',
+                             headers={'If-None-Match': etag})
+        self.assertEqual(200, modified.status_code)
+        self.assertNotEqual(etag, modified.headers['ETag'])
+        self.assertEqual('stopped', json.loads(modified.data)['state'])
+
+    def test_etag_depends_on_included_fields(self):
+        self._put_node_instance()
+        etag = self._get('/node-instances/1234').headers['ETag']
+        response = self._get('/node-instances/1234',
+                             query_params={'_include': 'id'},
+                             headers={'If-None-Match': etag})
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response.headers['ETag'])
+
+    def test_versioned_etag(self):
+        node_instance = models.DeploymentNodeInstance(
+            id='1234', node_id='node', deployment_id='dep',
+            runtime_properties={}, state='started', version=3,
+            relationships=None, host_id=None)
+        etag = etags.make_etag(responses.NodeInstance,
+                               responses.NodeInstance.resource_fields,
+                               node_instance)
+        self.assertTrue(etag.startswith('3-'))
+
+    def test_versioned_etag_is_not_a_content_hash(self):
+        node_instance = models.DeploymentNodeInstance(
+            id='1234', node_id='node', deployment_id='dep',
+            runtime_properties=MagicMock(), state='started', version=3,
+            relationships=None, host_id=None)
+        etag = etags.make_etag(responses.NodeInstance,
+                               responses.NodeInstance.resource_fields,
+                               node_instance)
+        self.assertEqual(etag, etags.make_etag(
+            responses.NodeInstance, responses.NodeInstance.resource_fields,
+            {'version': 3}))
+        self.assertFalse(node_instance.runtime_properties.method_calls)
+
+    def test_blueprint_etag_does_not_read_the_plan(self):
+        def blueprint(created_at):
+            return models.BlueprintState(
+                id='bp', plan=None, description=None, created_at=created_at,
+                updated_at=created_at, main_file_name='blueprint.yaml',
+                plan_loader=MagicMock())
+        field_names = responses.BlueprintState.resource_fields
+        bp = blueprint('now')
+        etag = etags.make_etag(responses.BlueprintState, field_names, bp)
+        self.assertFalse(bp.plan_loader.called)
+        self.assertNotEqual(etag, etags.make_etag(
+            responses.BlueprintState, field_names, blueprint('later')))
+        self.assertNotEqual(etag, etags.make_etag(
+            responses.BlueprintState, ['id'], blueprint('now')))
+
+    def test_patch_if_match(self):
+        self._put_node_instance()
+        response = self._patch('/node-instances/1234',
+                               {'state': 'stopped'},
+                               headers={'If-Match': '*'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('stopped', json.loads(response.data)['state'])
+
+        response = self._patch('/node-instances/1234',
+                               {'state': 'stopped', 'version': 2},
+                               headers={'If-Match': '"3-abc"'})
+        self.assertEqual(400, response.status_code)
+        response = self._patch('/node-instances/1234',
+                               {'state': 'stopped'},
+                               headers={'If-Match': '"abc"'})
+        self.assertEqual(400, response.status_code)
+        response = self._patch('/node-instances/1234', {'state': 'stopped'})
+        self.assertEqual(400, response.status_code)
@@ -0,0 +1,135 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import json
+import operator
+
+from mock import patch
+from nose.plugins.attrib import attr
+
+from manager_rest.resources_v2 import EventsStream
+from manager_rest.test import base_test
+
+# events as sorted by timestamp and uid, two of which share a timestamp
+EVENTS = [
+    {'sort': [1000, 'cloudify_event#a'], '_source': {'message': 'first'}},
+    {'sort': [2000, 'cloudify_event#b'], '_source': {'message': 'second'}},
+    {'sort': [2000, 'cloudify_log#c'], '_source': {'message': 'third'}}
+]
+
+
+RANGE_OPERATORS = {'gte': operator.ge, 'lte': operator.le}
+
+
+def _matching_events(query, events):
+    conditions = query['query']['filtered']['filter']['bool']['must']
+    hits = events
+    for condition in conditions:
+        for field, limits in condition.get('range', {}).iteritems():
+            position = EventsStream.SORT.keys().index(field)
+            hits = [hit for hit in hits
+                    if all(RANGE_OPERATORS[op](hit['sort'][position], limit)
+                           for op, limit in limits.iteritems())]
+    return hits
+
+
+def _mock_es_search(query, events=EVENTS):
+    return {'hits': {'hits': _matching_events(query, events)[:query['size']]}}
+
+
+def _mock_es_count(query, events=EVENTS):
+    return {'count': len(_matching_events(query, events))}
+
+
+def _parse_stream(data):
+    messages = []
+    for message in data.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in message.splitlines()
+                      if not line.startswith(':'))
+        if fields:
+            messages.append(fields)
+    return messages
+
+
+@attr(client_min_version=2, client_max_version=base_test.LATEST_API_VERSION)
+class EventsStreamTestCase(base_test.BaseServerTestCase):
+
+    def setUp(self):
+        super(EventsStreamTestCase, self).setUp()
+        for name, value in [('_search', staticmethod(_mock_es_search)),
+                            ('_count', staticmethod(_mock_es_count)),
+                            ('BATCH_SIZE', 2),
+                            ('POLL_INTERVAL', 0.01),
+                            ('END_GRACE_PERIOD', 0)]:
+            patcher = patch.object(EventsStream, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.put_deployment('deployment')
+        # the deployment environment creation has already ended
+        self.execution_id = self.client.executions.list(
+            deployment_id='deployment')[0].id
+
+    def _stream(self, headers=None):
+        response = self.app.get(
+            self._version_url('/events/stream'), headers=headers,
+            query_string={'execution_id': self.execution_id})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('text/event-stream', response.mimetype)
+        return _parse_stream(response.data)
+
+    def test_stream_until_execution_ends(self):
+        messages = self._stream()
+        self.assertEqual(['first', 'second', 'third'],
+                         [json.loads(m['data'])['message']
+                          for m in messages[:-1]])
+        self.assertEqual(['1000:cloudify_event#a', '2000:cloudify_event#b',
+                          '2000:cloudify_log#c'],
+                         [m['id'] for m in messages[:-1]])
+        self.assertEqual('end', messages[-1]['event'])
+        self.assertEqual('terminated',
+                         json.loads(messages[-1]['data'])['status'])
+
+    def test_resume_from_last_event_id(self):
+        messages = self._stream({'Last-Event-ID': '2000:cloudify_event#b'})
+        self.assertEqual(['2000:cloudify_log#c'],
+                         [m['id'] for m in messages if 'id' in m])
+
+    def test_resume_past_a_batch_of_events_with_the_same_timestamp(self):
+        events = [{'sort': [1000, 'cloudify_event#{0}'.format(i)],
+                   '_source': {'message': i}} for i in range(5)]
+        events.append({'sort': [2000, 'cloudify_event#5'],
+                       '_source': {'message': 5}})
+        with patch.object(
+                EventsStream, '_search',
+                staticmethod(lambda query: _mock_es_search(query, events))), \
+            patch.object(
+                EventsStream, '_count',
+                staticmethod(lambda query: _mock_es_count(query, events))):
+            # more events than a batch were sent at the cursor's timestamp
+            messages = self._stream({'Last-Event-ID': '1000:cloudify_event#3'})
+        self.assertEqual(['1000:cloudify_event#4', '2000:cloudify_event#5'],
+                         [m['id'] for m in messages if 'id' in m])
+
+    def test_bad_requests(self):
+        response = self.app.get(self._version_url('/events/stream'))
+        self.assertEqual(400, response.status_code)
+        response = self.app.get(self._version_url('/events/stream'),
+                                query_string={'execution_id': 'nonexistent'})
+        self.assertEqual(404, response.status_code)
+        response = self.app.get(
+            self._version_url('/events/stream'),
+            headers={'Last-Event-ID': 'not-a-timestamp'},
+            query_string={'execution_id': self.execution_id})
+        self.assertEqual(400, response.status_code)
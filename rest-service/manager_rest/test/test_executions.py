@@ -14,6 +14,8 @@
 #  * limitations under the License.
 
 
+import threading
+import time
 from datetime import datetime
 
 import mock
@@ -323,6 +325,51 @@ class ExecutionsTestCase(BaseServerTestCase):
                                                   'final-status')
         self.assertEquals('', execution.error)
 
+    def test_wait_for_execution_change(self):
+        (blueprint_id, deployment_id, blueprint_response,
+         deployment_response) = self.put_deployment(self.DEPLOYMENT_ID)
+        execution = self.client.executions.start(deployment_id, 'install')
+        url = '/executions/{0}'.format(execution.id)
+
+        # the status already differs
+        response = self.get(url, query_params={'wait_for_change': 'started',
+                                               'timeout': 10})
+        self.assertEquals('terminated', response.json['status'])
+        # the timeout expires
+        response = self.get(url, query_params={
+            'wait_for_change': 'terminated', 'timeout': 0.1})
+        self.assertEquals('terminated', response.json['status'])
+
+        # an update wakes the waiting request
+        timer = threading.Timer(0.2, self.patch, args=[url, {
+            'status': 'new_status'}])
+        timer.start()
+        self.addCleanup(timer.cancel)
+        start = time.time()
+        response = self.get(url, query_params={
+            'wait_for_change': 'terminated', 'timeout': 10,
+            '_include': 'id'})
+        self.assertLess(time.time() - start, 5)
+        self.assertEquals({'id': execution.id}, response.json)
+        self.assertEquals('new_status',
+                          self.client.executions.get(execution.id).status)
+
+    def test_wait_for_execution_change_bad_timeout(self):
+        for timeout in ('-1', 'forever', 'nan'):
+            response = self.get('/executions/1234', query_params={
+                'wait_for_change': 'started', 'timeout': timeout})
+            self.assertEquals(400, response.status_code)
+
+    def test_failed_notification_does_not_fail_the_update(self):
+        (blueprint_id, deployment_id, blueprint_response,
+         deployment_response) = self.put_deployment(self.DEPLOYMENT_ID)
+        execution = self.client.executions.start(deployment_id, 'install')
+        with mock.patch('manager_rest.notifications.ChangeNotifier.notify',
+                        side_effect=IOError(28, 'No space left on device')):
+            execution = self._modify_execution_status(execution.id,
+                                                      'new_status')
+        self.assertEquals('new_status', execution.status)
+
     def test_update_nonexistent_execution(self):
         resp = self.patch('/executions/1234', {'status': 'new-status'})
         self.assertEquals(404, resp.status_code)
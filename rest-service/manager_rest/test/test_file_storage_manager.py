@@ -0,0 +1,248 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from mock import patch
+from nose.plugins.attrib import attr
+
+from manager_rest import file_storage_manager
+from manager_rest import manager_exceptions
+from manager_rest import models
+from manager_rest.file_storage_manager import FileStorageManager
+from manager_rest.test import base_test
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class FileStorageManagerLogTestCase(base_test.BaseServerTestCase):
+
+    def setUp(self):
+        super(FileStorageManagerLogTestCase, self).setUp()
+        storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage_dir)
+        self.storage_path = os.path.join(storage_dir, 'storage.json')
+        self.sm = FileStorageManager(self.storage_path)
+
+    @staticmethod
+    def _node_instance(instance_id, state='uninitialized'):
+        return models.DeploymentNodeInstance(id=instance_id,
+                                             node_id='node',
+                                             host_id=None,
+                                             relationships=[],
+                                             deployment_id='dep-id',
+                                             state=state,
+                                             runtime_properties={},
+                                             version=None)
+
+    def _log_lines(self):
+        with open(self.storage_path + '.log') as f:
+            return f.readlines()
+
+    def _recover(self):
+        return FileStorageManager(self.storage_path, recover=True)
+
+    def test_write_appends_a_single_record(self):
+        self.sm.put_node_instance(self._node_instance('node_1'))
+        self.assertEqual(1, len(self._log_lines()))
+        self.sm.put_node_instances_bulk([self._node_instance('node_2'),
+                                         self._node_instance('node_3')])
+        self.assertEqual(2, len(self._log_lines()))
+        self.assertFalse(os.path.exists(self.storage_path))
+
+    def test_recover_from_log(self):
+        self.sm.put_node_instances_bulk([self._node_instance('node_1'),
+                                         self._node_instance('node_2')])
+        self.sm.update_node_instance(self._node_instance('node_1',
+                                                         state='started'))
+        self.sm.delete_node_instance('node_2')
+
+        recovered = self._recover()
+        instances = recovered.get_node_instances().items
+        self.assertEqual(['node_1'], [instance.id for instance in instances])
+        self.assertEqual('started', instances[0].state)
+        # recovery compacts the log into the storage file
+        self.assertTrue(os.path.exists(self.storage_path))
+        self.assertEqual([], self._log_lines())
+
+    def test_compaction(self):
+        with patch.object(file_storage_manager,
+                          'LOG_COMPACTION_THRESHOLD', 2):
+            for instance_id in ['node_1', 'node_2', 'node_3']:
+                self.sm.put_node_instance(self._node_instance(instance_id))
+        self.assertEqual(1, len(self._log_lines()))
+        self.assertEqual(['node_1', 'node_2', 'node_3'],
+                         sorted(instance.id for instance in
+                                self._recover().get_node_instances().items))
+
+    def test_partially_written_record_is_ignored(self):
+        self.sm.put_node_instance(self._node_instance('node_1'))
+        with open(self.storage_path + '.log', 'a') as f:
+            f.write('[{"op": "delete", "key": "node_inst')
+        recovered = self._recover()
+        self.assertEqual('node_1', recovered.get_node_instance('node_1').id)
+
+    def test_returned_items_are_copies(self):
+        self.sm.put_node_instance(self._node_instance('node_1'))
+        instance = self.sm.get_node_instance('node_1')
+        instance.runtime_properties['key'] = 'value'
+        self.sm.get_node_instances().items[0].state = 'started'
+        stored = self.sm.get_node_instance('node_1')
+        self.assertEqual({}, stored.runtime_properties)
+        self.assertEqual('uninitialized', stored.state)
+
+    def test_concurrent_updates_are_not_lost(self):
+        self.sm.put_node_instance(self._node_instance('node_1'))
+        commit = self.sm._commit
+
+        def _slow_commit(operations):
+            # lets the other thread read the node instance meanwhile,
+            # unless the update holds the storage lock
+            time.sleep(0.1)
+            commit(operations)
+        threads = [threading.Thread(target=self.sm.patch_node_instance,
+                                    args=('node_1', 0, {key: 'value'}))
+                   for key in ('a', 'b')]
+        with patch.object(self.sm, '_commit', _slow_commit):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual({'a': 'value', 'b': 'value'},
+                         self.sm.get_node_instance('node_1')
+                         .runtime_properties)
+
+    def test_reads_during_concurrent_deletes(self):
+        instance_ids = ['node_{0}'.format(i) for i in range(200)]
+        self.sm.put_node_instances_bulk(
+            [self._node_instance(instance_id)
+             for instance_id in instance_ids])
+        errors = []
+
+        def _delete():
+            for instance_id in instance_ids:
+                self.sm.delete_node_instance(instance_id)
+
+        def _read():
+            while instance_ids:
+                try:
+                    self.sm.get_node_instances(
+                        filters={'deployment_id': 'dep-id',
+                                 'node_id': 'node'})
+                    self.sm.get_node_instances_by_ids(instance_ids[-5:])
+                except manager_exceptions.NotFoundError:
+                    pass
+                except Exception as e:
+                    errors.append(e)
+                    return
+        reader = threading.Thread(target=_read)
+        reader.start()
+        try:
+            _delete()
+        finally:
+            del instance_ids[:]
+            reader.join()
+        self.assertEqual([], errors)
+
+    def test_new_storage_removes_existing_data(self):
+        self.sm.put_node_instance(self._node_instance('node_1'))
+        self.assertEqual(
+            0, len(FileStorageManager(
+                self.storage_path).get_node_instances().items))
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class FileStorageManagerQueryTestCase(base_test.BaseServerTestCase):
+
+    def setUp(self):
+        super(FileStorageManagerQueryTestCase, self).setUp()
+        storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage_dir)
+        self.sm = FileStorageManager(os.path.join(storage_dir,
+                                                  'storage.json'))
+        self.sm.put_node_instances_bulk([
+            models.DeploymentNodeInstance(
+                id='{0}_{1}'.format(node_id, i),
+                node_id=node_id,
+                host_id=None,
+                relationships=[],
+                deployment_id='dep{0}'.format(i % 3),
+                state=['started', 'uninitialized'][i % 2],
+                runtime_properties={},
+                version=None)
+            for node_id in ['vm', 'db'] for i in range(10)])
+
+    def _ids(self, **kwargs):
+        return [instance.id for instance in
+                self.sm.get_node_instances(**kwargs).items]
+
+    def test_indexed_and_unindexed_filters(self):
+        self.assertEqual(
+            ['vm_0', 'vm_3', 'vm_6', 'vm_9'],
+            sorted(self._ids(filters={'deployment_id': ['dep0'],
+                                      'node_id': ['vm']})))
+        self.assertEqual(
+            ['vm_0', 'vm_6'],
+            sorted(self._ids(filters={'deployment_id': ['dep0'],
+                                      'node_id': ['vm'],
+                                      'state': ['started']})))
+        self.assertEqual(
+            ['db_1', 'db_4', 'vm_0', 'vm_1'],
+            sorted(self._ids(filters={'id': ['vm_0', 'vm_1', 'db_1',
+                                             'db_4', 'no_such_id'],
+                                      'deployment_id': ['dep0', 'dep1']})))
+        self.assertEqual([], self._ids(filters={'deployment_id': ['dep9']}))
+
+    def test_index_follows_updates_and_deletes(self):
+        self.sm.delete_node_instance('vm_0')
+        instance = self.sm.get_node_instance('vm_3')
+        self.sm.put_node_instance(models.DeploymentNodeInstance(
+            id='other', node_id='vm', host_id=None, relationships=[],
+            deployment_id='dep9', state='started', runtime_properties={},
+            version=None))
+        self.assertEqual(['vm_3', 'vm_6', 'vm_9'],
+                         sorted(self._ids(filters={'deployment_id': ['dep0'],
+                                                   'node_id': ['vm']})))
+        self.assertEqual('dep0', instance.deployment_id)
+        self.assertEqual(['other'],
+                         self._ids(filters={'deployment_id': ['dep9']}))
+
+    def test_multiple_sort_keys(self):
+        sort = OrderedDict([('state', 'desc'), ('id', 'asc')])
+        expected = sorted(
+            self.sm.get_node_instances().items,
+            key=lambda instance: instance.id)
+        expected = sorted(expected, key=lambda instance: instance.state,
+                          reverse=True)
+        self.assertEqual([instance.id for instance in expected],
+                         self._ids(sort=sort))
+
+    def test_sorted_page(self):
+        sort = OrderedDict([('deployment_id', 'asc'), ('id', 'desc')])
+        all_ids = self._ids(sort=sort)
+        self.assertEqual(20, len(all_ids))
+        result = self.sm.get_node_instances(
+            sort=sort, pagination={'offset': 3, 'size': 4})
+        self.assertEqual(all_ids[3:7],
+                         [instance.id for instance in result.items])
+        self.assertEqual({'total': 20, 'size': 4, 'offset': 3},
+                         result.metadata['pagination'])
+        self.assertEqual(all_ids[18:],
+                         self._ids(sort=sort,
+                                   pagination={'offset': 18, 'size': 5}))
@@ -261,7 +261,7 @@ class ResourceListFiltersTestCase(BaseListTest):
                                       'values {0}, got {1}'
                                       .format(filter_params, blueprint))
         self.assertEquals(self.first_blueprint_id, blueprint['id'])
-        self.assertIsNotNone(response[0]['plan'])
+        self.assertNotIn('plan', blueprint)
 
     def test_blueprints_list_with_filters_multiple_values(self):
 
@@ -278,6 +278,14 @@ class ResourceListFiltersTestCase(BaseListTest):
         for blueprint in response:
             self.assertIn(blueprint['id'],
                           (self.first_blueprint_id, self.sec_blueprint_id))
+            self.assertIsNotNone(blueprint['main_file_name'])
+            self.assertNotIn('plan', blueprint)
+
+    def test_blueprints_list_with_plans(self):
+        response = self.client.blueprints.list(_include=['id', 'plan'])
+        self.assertEqual(2, len(response))
+        for blueprint in response:
+            self.assertEqual({'id', 'plan'}, set(blueprint))
             self.assertIsNotNone(blueprint['plan'])
 
     def test_blueprints_list_non_existent_filters(self):
@@ -0,0 +1,59 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+from base_list_test import BaseListTest
+from nose.plugins.attrib import attr
+
+from manager_rest.test import base_test
+
+
+@attr(client_min_version=2,
+      client_max_version=base_test.LATEST_API_VERSION)
+class ResourceListStreamTestCase(BaseListTest):
+
+    def _test_stream(self, resource_path, list_func, total):
+        all_results = list_func(_sort=['id'])
+        response = self.get(resource_path, query_params={'_stream': 'true',
+                                                         '_sort': 'id'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(total, response.json['metadata']['pagination'][
+            'total'])
+        self.assertEqual(all_results.items, response.json['items'])
+
+    def test_nodes_list_stream(self):
+        self._put_n_deployments(id_prefix='test', number_of_deployments=3)
+        self._test_stream('/nodes', self.client.nodes.list, 6)
+
+    def test_node_instances_list_stream(self):
+        self._put_n_deployments(id_prefix='test', number_of_deployments=3)
+        self._test_stream('/node-instances',
+                          self.client.node_instances.list, 6)
+
+    def test_executions_list_stream(self):
+        self._put_n_deployments(id_prefix='test', number_of_deployments=2)
+        self._test_stream('/executions', self.client.executions.list, 2)
+
+    def test_stream_with_projection(self):
+        self._put_n_deployments(id_prefix='test', number_of_deployments=2)
+        response = self.get('/node-instances',
+                            query_params={'_stream': 'true',
+                                          '_include': 'id,node_id'})
+        self.assertEqual(4, len(response.json['items']))
+        for item in response.json['items']:
+            self.assertEqual({'id', 'node_id'}, set(item.keys()))
+
+    def test_stream_with_pagination_fails(self):
+        response = self.get('/node-instances',
+                            query_params={'_stream': 'true', '_size': 2})
+        self.assertEqual(400, response.status_code)
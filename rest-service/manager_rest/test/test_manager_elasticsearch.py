@@ -0,0 +1,56 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+from mock import patch
+from nose.plugins.attrib import attr
+
+from manager_rest import config
+from manager_rest import manager_elasticsearch
+from manager_rest.es_storage_manager import ESStorageManager
+from manager_rest.test import base_test
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ManagerElasticsearchClientTestCase(base_test.BaseServerTestCase):
+
+    def setUp(self):
+        super(ManagerElasticsearchClientTestCase, self).setUp()
+        manager_elasticsearch.reset_clients()
+
+    def tearDown(self):
+        manager_elasticsearch.reset_clients()
+        super(ManagerElasticsearchClientTestCase, self).tearDown()
+
+    def test_client_shared_by_storage_managers(self):
+        client = manager_elasticsearch.get_client('localhost', 9200)
+        sm1 = ESStorageManager('localhost', 9200)
+        sm2 = ESStorageManager('localhost', 9200)
+        self.assertIs(client, sm1._connection)
+        self.assertIs(client, sm2._connection)
+        self.assertIsNot(
+            client, manager_elasticsearch.get_client('localhost', 9201))
+
+    def test_client_recreated_after_fork(self):
+        client = manager_elasticsearch.get_client('localhost', 9200)
+        with patch('os.getpid', return_value=-1):
+            forked_client = manager_elasticsearch.get_client('localhost',
+                                                             9200)
+        self.assertIsNot(client, forked_client)
+
+    def test_pool_size_from_config(self):
+        config.instance().db_connection_pool_size = 3
+        client = manager_elasticsearch.get_client('localhost', 9200)
+        connection = client.transport.connection_pool.connections[0]
+        self.assertEqual(3, connection.pool.pool.maxsize)
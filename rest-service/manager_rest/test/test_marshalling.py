@@ -0,0 +1,95 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+from mock import MagicMock, patch
+from nose.plugins.attrib import attr
+
+from manager_rest import marshalling
+from manager_rest import models
+from manager_rest import responses
+from manager_rest import responses_v2
+from manager_rest.test import base_test
+
+
+def _node(number_of_instances=2):
+    return models.DeploymentNode(
+        id='node', deployment_id='dep', blueprint_id='bp', type='type',
+        type_hierarchy=['type'], number_of_instances=number_of_instances,
+        planned_number_of_instances=number_of_instances,
+        deploy_number_of_instances=number_of_instances, host_id=None,
+        properties={'port': 8080}, operations={}, plugins=[],
+        plugins_to_install=None, relationships=[])
+
+
+def _deployment(workflows):
+    return models.Deployment(
+        id='dep', blueprint_id='bp', created_at='now', updated_at='now',
+        workflows=workflows, inputs={}, policy_types={}, policy_triggers={},
+        groups={}, outputs={})
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class MarshallingTestCase(base_test.BaseServerTestCase):
+
+    def _assert_same_output(self, response_class, data, field_names=None):
+        field_names = field_names or response_class.resource_fields.keys()
+        self.assertEqual(
+            marshalling.generic_serializer(response_class, field_names)(data),
+            marshalling.get_serializer(response_class, field_names)(data))
+
+    def test_compiled_output_matches_marshalling(self):
+        # strings are formatted, raw values aren't
+        self._assert_same_output(responses_v2.Node, _node())
+        self._assert_same_output(responses_v2.Node, [_node(), _node(None)],
+                                 ['id', 'number_of_instances'])
+        self._assert_same_output(responses.BlueprintValidationStatus,
+                                 {'blueprint_id': 'bp', 'status': 'valid'})
+        # workflows are converted to a list of nested objects
+        workflows = {'install': {'parameters': {'key': {'default': 1}}}}
+        self._assert_same_output(responses.Deployment,
+                                 _deployment(workflows))
+        self._assert_same_output(responses.Deployment, _deployment(None))
+
+    def test_serializers_are_compiled_once(self):
+        serializer = marshalling.get_serializer(responses_v2.Node,
+                                                ['id', 'type'])
+        self.assertIs(serializer, marshalling.get_serializer(
+            responses_v2.Node, ('type', 'id')))
+        self.assertIsNot(serializer, marshalling.get_serializer(
+            responses_v2.Node, ['id']))
+
+    def test_serializers_cache_is_bounded(self):
+        field_names = responses_v2.Node.resource_fields.keys()
+        serializer = marshalling.get_serializer(responses_v2.Node,
+                                                field_names[:1])
+        with patch.object(marshalling, 'MAX_CACHED_SERIALIZERS', 3):
+            for count in range(2, 6):
+                marshalling.get_serializer(responses_v2.Node,
+                                           field_names[:count])
+            self.assertEqual(3, len(marshalling._serializers))
+        # the least recently used serializers were dropped
+        self.assertIsNot(serializer, marshalling.get_serializer(
+            responses_v2.Node, field_names[:1]))
+
+    def test_only_marshalled_fields_are_read(self):
+        blueprint = models.BlueprintState(
+            id='bp', plan=None, description=None, created_at='now',
+            updated_at='now', main_file_name='blueprint.yaml',
+            plan_loader=MagicMock())
+        serialize = marshalling.get_serializer(
+            responses_v2.BlueprintState,
+            models.BlueprintState.summary_fields)
+        self.assertNotIn('plan', serialize(blueprint))
+        self.assertFalse(blueprint.plan_loader.called)
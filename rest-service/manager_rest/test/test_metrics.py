@@ -0,0 +1,83 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import logging
+
+from mock import patch
+from nose.plugins.attrib import attr
+
+from manager_rest import metrics
+from manager_rest.test import base_test
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class MetricsTestCase(base_test.BaseServerTestCase):
+
+    def test_histogram_buckets_are_cumulative(self):
+        request_metrics = metrics.RequestMetrics(buckets=(0.1, 1))
+        labels = ('/api/v2/nodes', 'GET', '200')
+        request_metrics.observe(labels, 0.05, 0, 100, 2)
+        request_metrics.observe(labels, 0.5, 10, None, 0)
+        lines = request_metrics.render().splitlines()
+        labels_text = 'endpoint="/api/v2/nodes",method="GET",status="200"'
+        for line in [
+                'cloudify_rest_request_duration_seconds_bucket{{{0},'
+                'le="0.1"}} 1.0'.format(labels_text),
+                'cloudify_rest_request_duration_seconds_bucket{{{0},'
+                'le="1.0"}} 2.0'.format(labels_text),
+                'cloudify_rest_request_duration_seconds_bucket{{{0},'
+                'le="+Inf"}} 2.0'.format(labels_text),
+                'cloudify_rest_request_size_bytes_sum{{{0}}} 10.0'.format(
+                    labels_text),
+                # the size of a streamed response isn't known
+                'cloudify_rest_response_size_bytes_count{{{0}}} 1.0'.format(
+                    labels_text),
+                'cloudify_rest_storage_round_trips_sum{{{0}}} 2.0'.format(
+                    labels_text)]:
+            self.assertIn(line, lines)
+
+    def test_metrics_endpoint(self):
+        self.get('/blueprints/nonexistent')
+        response = self.app.get(self._version_url('/metrics'))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(metrics.CONTENT_TYPE, response.content_type)
+        # requests are recorded by url rule, not by path
+        self.assertIn(
+            'cloudify_rest_request_duration_seconds_count{{endpoint="{0}",'
+            'method="GET",status="404"}}'.format(
+                self._version_url('/blueprints/<string:blueprint_id>')),
+            response.data)
+        self.assertIn('cloudify_rest_plan_cache{stat="hits"}', response.data)
+
+    def test_unhandled_exceptions_are_recorded(self):
+        with patch('manager_rest.blueprints_manager.BlueprintsManager'
+                   '.get_blueprint', side_effect=RuntimeError('failure')):
+            response = self.app.get(self._version_url('/blueprints/bp'))
+        self.assertEqual(500, response.status_code)
+        response = self.app.get(self._version_url('/metrics'))
+        self.assertIn(
+            'cloudify_rest_request_duration_seconds_count{{endpoint="{0}",'
+            'method="GET",status="500"}} 1.0'.format(
+                self._version_url('/blueprints/<string:blueprint_id>')),
+            response.data)
+
+    def test_debug_logging_is_skipped(self):
+        from manager_rest import server
+        logger = server.app.logger
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.INFO)
+        with patch.object(server, 'headers_pretty_print') as pretty_print:
+            self.get('/blueprints')
+        self.assertFalse(pretty_print.called)
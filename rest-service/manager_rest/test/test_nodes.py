@@ -13,8 +13,11 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import json
+
 from nose.plugins.attrib import attr
 
+from manager_rest import config
 from manager_rest import storage_manager
 from manager_rest.test import base_test
 
@@ -269,6 +272,120 @@ class NodesTest(base_test.BaseServerTestCase):
         assert_dep_and_node(2, '222', '3', dep2_n3_instances)
         assert_dep_and_node(2, '222', '4', dep2_n4_instances)
 
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_merge_patch_node_runtime_props(self):
+        self.put_node_instance(
+            instance_id='1234',
+            deployment_id='111',
+            runtime_properties={
+                'key': 'value',
+                'removed_key': 'value',
+                'map': {'inner_key': 'value', 'removed_inner_key': 'value'}
+            }
+        )
+        response = self.merge_patch('/node-instances/1234', {
+            'runtime_properties': {'key': 'new_value',
+                                   'new_key': 'value',
+                                   'removed_key': None,
+                                   'map': {'removed_inner_key': None}},
+            'state': 'started',
+            'version': 2})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'id', 'version'}, set(response.json.keys()))
+        self.assertEqual('1234', response.json['id'])
+
+        response = self.get('/node-instances/1234')
+        self.assertEqual({'key': 'new_value',
+                          'new_key': 'value',
+                          'map': {'inner_key': 'value'}},
+                         response.json['runtime_properties'])
+        self.assertEqual('started', response.json['state'])
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_bad_merge_patch_node(self):
+        self.put_node_instance(instance_id='1234', deployment_id='111')
+        response = self.merge_patch('/node-instances/1234', {
+            'runtime_properties': {'key': 'value'}})
+        self.assertEqual(400, response.status_code)
+        response = self.merge_patch('/node-instances/1234', {
+            'runtime_properties': 'not a map', 'version': 2})
+        self.assertEqual(400, response.status_code)
+        response = self.merge_patch('/node-instances/4321', {
+            'runtime_properties': {}, 'version': 2})
+        self.assertEqual(404, response.status_code)
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_batch_update_node_instances(self):
+        self.put_node_instance(instance_id='1', deployment_id='111',
+                               runtime_properties={'key': 'value'})
+        self.put_node_instance(instance_id='2', deployment_id='111')
+        response = self.batch_patch([
+            {'id': '1', 'version': 2, 'state': 'started'},
+            {'id': '2', 'version': 2, 'runtime_properties': {'a': 'b'}},
+            {'id': '3', 'version': 2, 'state': 'started'}])
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([('1', 200), ('2', 200), ('3', 404)],
+                         [(r['id'], r['status']) for r in response.json])
+        self.assertEqual('not_found_error', response.json[2]['error_code'])
+
+        instance = self.get('/node-instances/1').json
+        self.assertEqual('started', instance['state'])
+        self.assertEqual({'key': 'value'}, instance['runtime_properties'])
+        instance = self.get('/node-instances/2').json
+        self.assertEqual({'a': 'b'}, instance['runtime_properties'])
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_atomic_batch_update_node_instances(self):
+        self.put_node_instance(instance_id='1', deployment_id='111')
+        response = self.batch_patch([
+            {'id': '1', 'version': 2, 'state': 'started'},
+            {'id': '3', 'version': 2, 'state': 'started'}], atomic=True)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([424, 404], [r['status'] for r in response.json])
+        self.assertEqual('update_not_applied_error',
+                         response.json[0]['error_code'])
+        self.assertIsNone(self.get('/node-instances/1').json['state'])
+
+    @attr(client_min_version=2,
+          client_max_version=base_test.LATEST_API_VERSION)
+    def test_bad_batch_update_node_instances(self):
+        self.put_node_instance(instance_id='1', deployment_id='111')
+        for updates in [{'id': '1', 'version': 2},
+                        ['not a map'],
+                        [{'id': '1'}],
+                        [{'id': '1', 'version': 2, 'state': 1}],
+                        [{'id': '1', 'version': 2},
+                         {'id': '1', 'version': 3}]]:
+            self.assertEqual(400, self.batch_patch(updates).status_code)
+        self.assertEqual(400, self.batch_patch(
+            [{'id': '1', 'version': 2}], atomic='maybe').status_code)
+
+        config.instance().node_instance_batch_update_max_size = 1
+        response = self.batch_patch([{'id': '1', 'version': 2},
+                                     {'id': '2', 'version': 2}])
+        self.assertEqual(400, response.status_code)
+
+    def batch_patch(self, updates, atomic=None):
+        query_string = {} if atomic is None else {'atomic': atomic}
+        result = self.app.patch(self._version_url('/node-instances'),
+                                content_type='application/json',
+                                query_string=query_string,
+                                data=json.dumps(updates))
+        result.json = json.loads(result.data)
+        return result
+
+    def merge_patch(self, resource_path, data):
+        url = self._version_url(resource_path)
+        result = self.app.patch(url,
+                                content_type='application/merge-patch+json',
+                                data=json.dumps(data))
+        result.json = json.loads(result.data)
+        return result
+
     def test_patch_before_put(self):
         response = self.patch('/node-instances/1234',
                               {'runtime_properties': {'key': 'value'},
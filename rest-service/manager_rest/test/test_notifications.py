@@ -0,0 +1,68 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from nose.plugins.attrib import attr
+
+from manager_rest.notifications import ChangeNotifier
+from manager_rest.test import base_test
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class ChangeNotifierTestCase(base_test.BaseServerTestCase):
+
+    def setUp(self):
+        super(ChangeNotifierTestCase, self).setUp()
+        notifications_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, notifications_dir)
+        self.path = os.path.join(notifications_dir, 'notifications')
+
+    def test_wait_for_notification(self):
+        notifier = ChangeNotifier(self.path)
+        cursor = notifier.cursor()
+        notifier.notify('other')
+        self.assertFalse(notifier.wait('key', cursor, 0)[0])
+
+        timer = threading.Timer(0.1, notifier.notify, args=['key'])
+        timer.start()
+        self.addCleanup(timer.cancel)
+        start = time.time()
+        notified, cursor = notifier.wait('key', cursor, 10)
+        self.assertTrue(notified)
+        self.assertLess(time.time() - start, 5)
+        # notifications are only seen once
+        self.assertFalse(notifier.wait('key', cursor, 0)[0])
+
+    def test_notifications_of_other_processes(self):
+        # notifiers sharing a file stand for notifiers of other processes
+        notifier = ChangeNotifier(self.path, poll_interval=0.05)
+        other_process_notifier = ChangeNotifier(self.path)
+        cursor = notifier.cursor()
+        other_process_notifier.notify('key')
+        self.assertTrue(notifier.wait('key', cursor, 1)[0])
+
+    def test_replaced_file_wakes_waiters(self):
+        notifier = ChangeNotifier(self.path, max_file_size=10)
+        notifier.notify('first')
+        cursor = notifier.cursor()
+        notifier.notify('second')
+        # the file was replaced, so the waiter can't tell what was notified
+        self.assertTrue(notifier.wait('key', cursor, 0)[0])
+        self.assertEqual('second\n', open(self.path).read())
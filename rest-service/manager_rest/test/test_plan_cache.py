@@ -0,0 +1,100 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+
+from mock import patch
+from nose.plugins.attrib import attr
+
+from manager_rest.plan_cache import PlanCache
+from manager_rest.test import base_test
+
+
+def _plan(size):
+    plan = {'nodes': 'x'}
+    plan['nodes'] = 'x' * (size - len(json.dumps(plan)) + 1)
+    return plan
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class PlanCacheTestCase(base_test.BaseServerTestCase):
+
+    def setUp(self):
+        super(PlanCacheTestCase, self).setUp()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.generation_path = os.path.join(cache_dir, 'generation')
+
+    def _put(self, cache, blueprint_id, plan):
+        cache.put(blueprint_id, plan, cache.generation())
+
+    def test_hits_return_copies(self):
+        cache = PlanCache(1000)
+        self.assertIsNone(cache.get('bp'))
+        self._put(cache, 'bp', {'nodes': [{'id': 'node'}]})
+        plan = cache.get('bp')
+        plan['nodes'].append({'id': 'other'})
+        self.assertEqual({'nodes': [{'id': 'node'}]}, cache.get('bp'))
+        stats = cache.stats()
+        self.assertEqual((2, 1), (stats['hits'], stats['misses']))
+
+    def test_size_bounded_lru_eviction(self):
+        cache = PlanCache(300)
+        self._put(cache, 'bp1', _plan(100))
+        self._put(cache, 'bp2', _plan(100))
+        cache.get('bp1')
+        self._put(cache, 'bp3', _plan(150))
+        # bp2 was the least recently used
+        self.assertIsNone(cache.get('bp2'))
+        self.assertIsNotNone(cache.get('bp1'))
+        self.assertIsNotNone(cache.get('bp3'))
+        stats = cache.stats()
+        self.assertEqual(1, stats['evictions'])
+        self.assertEqual(250, stats['size_bytes'])
+        # plans larger than the whole cache are not cached
+        self._put(cache, 'bp4', _plan(301))
+        self.assertIsNone(cache.get('bp4'))
+        self.assertEqual(2, cache.stats()['entries'])
+
+    def test_invalidation_across_processes(self):
+        cache = PlanCache(1000, self.generation_path)
+        other_process_cache = PlanCache(1000, self.generation_path)
+        self._put(cache, 'bp1', {'a': 1})
+        self._put(cache, 'bp2', {'a': 2})
+        self._put(other_process_cache, 'bp1', {'a': 1})
+
+        other_process_cache.invalidate('bp1')
+        self.assertIsNone(other_process_cache.get('bp1'))
+        self.assertIsNone(cache.get('bp1'))
+        self.assertIsNone(cache.get('bp2'))
+
+    def test_plans_read_before_invalidation_are_not_cached(self):
+        cache = PlanCache(1000, self.generation_path)
+        generation = cache.generation()
+        cache.invalidate('bp')
+        cache.put('bp', {'a': 1}, generation)
+        self.assertIsNone(cache.get('bp'))
+
+    def test_failed_invalidation_does_not_fail_the_deletion(self):
+        blueprint_id = self.put_file(*self.put_blueprint_args()).json['id']
+        with patch.object(PlanCache, 'invalidate',
+                          side_effect=IOError(28, 'No space left on device')):
+            response = self.delete('/blueprints/{0}'.format(blueprint_id))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(404, self.get(
+            '/blueprints/{0}'.format(blueprint_id)).status_code)
@@ -0,0 +1,182 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+
+from mock import MagicMock, PropertyMock, patch
+from nose.plugins.attrib import attr
+
+from manager_rest import models
+from manager_rest import shared_documents
+from manager_rest.es_storage_manager import ESStorageManager
+from manager_rest.file_storage_manager import FileStorageManager
+from manager_rest.plan_cache import PlanCache
+from manager_rest.storage_manager import DEPLOYMENT_TYPE, SHARED_DOCUMENT_TYPE
+from manager_rest.test import base_test
+
+WORKFLOWS = {
+    'install': {'operation': 'default_workflows.install',
+                'plugin': 'default_workflows',
+                'parameters': {}},
+    'uninstall': {'operation': 'default_workflows.uninstall',
+                  'plugin': 'default_workflows',
+                  'parameters': {}}
+}
+
+
+def _deployment(deployment_id, workflows=WORKFLOWS, blueprint_id='bp'):
+    return models.Deployment(id=deployment_id,
+                             blueprint_id=blueprint_id,
+                             created_at='now',
+                             updated_at='now',
+                             workflows=workflows,
+                             inputs={},
+                             policy_types={},
+                             policy_triggers={},
+                             groups={},
+                             outputs={})
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class SharedDocumentsTestCase(base_test.BaseServerTestCase):
+
+    def test_equal_values_are_shared(self):
+        doc, shared = shared_documents.share_document(
+            DEPLOYMENT_TYPE, _deployment('d1').to_dict())
+        reordered = json.loads(json.dumps(WORKFLOWS),
+                               object_pairs_hook=lambda pairs: dict(
+                                   reversed(pairs)))
+        other_doc, other_shared = shared_documents.share_document(
+            DEPLOYMENT_TYPE, _deployment('d2', reordered).to_dict())
+        self.assertEqual(doc['workflows'], other_doc['workflows'])
+        self.assertEqual(shared, other_shared)
+        self.assertTrue(shared_documents.is_reference(doc['workflows']))
+        # values too small to be worth a reference are kept
+        self.assertEqual({}, doc['groups'])
+        # values are only shared by the documents of a blueprint
+        _, other_blueprint_shared = shared_documents.share_document(
+            DEPLOYMENT_TYPE, _deployment('d3', blueprint_id='bp2').to_dict())
+        self.assertNotEqual(shared.keys(), other_blueprint_shared.keys())
+
+    def test_file_storage_stores_shared_values_once(self):
+        storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage_dir)
+        storage_path = os.path.join(storage_dir, 'storage.json')
+        sm = FileStorageManager(storage_path)
+        sm.put_deployment('d1', _deployment('d1'))
+        sm.put_deployment('d2', _deployment('d2'))
+        sm._compact()
+        with open(storage_path) as f:
+            stored = json.load(f)
+        self.assertEqual(1, len(stored['shared_documents']))
+        self.assertTrue(shared_documents.is_reference(
+            stored['deployments']['d2']['workflows']))
+
+        sm = FileStorageManager(storage_path, recover=True)
+        self.assertEqual(WORKFLOWS, sm.get_deployment('d1').workflows)
+        deployments = sm.deployments_list().items
+        self.assertEqual([WORKFLOWS, WORKFLOWS],
+                         [d.workflows for d in deployments])
+        # every deployment gets its own copy
+        deployments[0].workflows.clear()
+        self.assertEqual(WORKFLOWS, sm.get_deployment('d2').workflows)
+
+    def test_file_storage_deletes_shared_values_with_the_blueprint(self):
+        storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage_dir)
+        sm = FileStorageManager(os.path.join(storage_dir, 'storage.json'))
+        for blueprint_id in ('bp', 'bp2'):
+            sm.put_blueprint(blueprint_id, models.BlueprintState(
+                id=blueprint_id, plan={}, description=None,
+                created_at='now', updated_at='now',
+                main_file_name='blueprint.yaml'))
+            sm.put_deployment(blueprint_id, _deployment(
+                blueprint_id, blueprint_id=blueprint_id))
+        sm.delete_deployment('bp')
+
+        sm.delete_blueprint('bp')
+        self.assertEqual(['bp2'], [shared_document.blueprint_id
+                                   for shared_document in
+                                   sm._data['shared_documents'].values()])
+        self.assertEqual(WORKFLOWS, sm.get_deployment('bp2').workflows)
+
+    def _es_storage_manager(self):
+        connection = MagicMock()
+        patcher = patch.object(ESStorageManager, '_connection',
+                               new_callable=PropertyMock,
+                               return_value=connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return ESStorageManager('localhost', 9200), connection
+
+    def test_elasticsearch_cached_values_are_not_written(self):
+        sm, connection = self._es_storage_manager()
+        written = []
+
+        def streaming_bulk(client, actions, **kwargs):
+            for action in actions:
+                written.append(action['_id'])
+                yield True, {'create': {'_id': action['_id'],
+                                        '_type': action['_type'],
+                                        'status': 201}}
+
+        with patch('elasticsearch.helpers.streaming_bulk',
+                   side_effect=streaming_bulk):
+            sm.put_deployment('d1', _deployment('d1'))
+            sm.put_deployment('d2', _deployment('d2'))
+        self.assertEqual(1, len(written))
+        self.assertEqual(2, connection.create.call_count)
+
+    def test_elasticsearch_deletes_shared_values_with_the_blueprint(self):
+        sm, connection = self._es_storage_manager()
+        connection.delete.return_value = {'_id': 'bp'}
+        sm.shared_documents_cache.put_many({'shared-id': WORKFLOWS})
+
+        sm.delete_blueprint('bp')
+        kwargs = connection.delete_by_query.call_args[1]
+        self.assertEqual(SHARED_DOCUMENT_TYPE, kwargs['doc_type'])
+        self.assertIn('blueprint_id', json.dumps(kwargs['body']))
+        self.assertFalse(sm.shared_documents_cache.contains('shared-id'))
+
+    def test_cache_is_dropped_when_blueprints_are_deleted(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        generation_path = os.path.join(cache_dir, 'generation')
+        cache = shared_documents.SharedDocumentCache(10, generation_path)
+        cache.put_many({'shared-id': WORKFLOWS})
+        self.assertTrue(cache.contains('shared-id'))
+
+        # another process deletes a blueprint
+        PlanCache(1000, generation_path).invalidate('bp')
+        self.assertFalse(cache.contains('shared-id'))
+
+    def test_elasticsearch_shared_values_are_cached(self):
+        sm, connection = self._es_storage_manager()
+        doc, shared = shared_documents.share_document(
+            DEPLOYMENT_TYPE, _deployment('d1').to_dict())
+        (shared_id, _), = shared.items()
+        connection.get.return_value = {'_source': dict(doc)}
+        connection.mget.return_value = {'docs': [
+            {'_id': shared_id, 'found': True,
+             '_source': {'id': shared_id, 'value': WORKFLOWS}}]}
+
+        self.assertEqual(WORKFLOWS, sm.get_deployment('d1').workflows)
+        connection.get.return_value = {'_source': dict(doc, id='d2')}
+        self.assertEqual(WORKFLOWS, sm.get_deployment('d2').workflows)
+        self.assertEqual(1, connection.mget.call_count)
+        self.assertEqual(1, sm.shared_documents_cache.stats()['hits'])
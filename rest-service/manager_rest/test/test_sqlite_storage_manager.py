@@ -0,0 +1,204 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from nose.plugins.attrib import attr
+
+from manager_rest import manager_exceptions
+from manager_rest import models
+from manager_rest import storage_manager
+from manager_rest.sqlite_storage_manager import SQLiteStorageManager
+from manager_rest.test import base_test
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class SQLiteStorageManagerTestCase(base_test.BaseServerTestCase):
+
+    def setUp(self):
+        super(SQLiteStorageManagerTestCase, self).setUp()
+        storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage_dir)
+        self.db_path = os.path.join(storage_dir, 'storage.db')
+        self.sm = SQLiteStorageManager(self.db_path)
+
+    @staticmethod
+    def _node_instance(instance_id, deployment_id='dep-id', node_id='node',
+                       state='uninitialized', version=None):
+        return models.DeploymentNodeInstance(id=instance_id,
+                                             node_id=node_id,
+                                             host_id=None,
+                                             relationships=[],
+                                             deployment_id=deployment_id,
+                                             state=state,
+                                             runtime_properties={},
+                                             version=version)
+
+    @staticmethod
+    def _execution(execution_id, deployment_id='dep-id', status='pending'):
+        return models.Execution(id=execution_id,
+                                status=status,
+                                deployment_id=deployment_id,
+                                workflow_id='install',
+                                blueprint_id='blueprint-id',
+                                created_at='2015-11-01',
+                                error='',
+                                parameters={'a': [1, 2]},
+                                is_system_workflow=False)
+
+    def test_json_columns(self):
+        self.sm.put_execution('exec-1', self._execution('exec-1'))
+        execution = self.sm.get_execution('exec-1')
+        self.assertEqual({'a': [1, 2]}, execution.parameters)
+        self.assertIs(False, execution.is_system_workflow)
+        execution = self.sm.get_execution('exec-1', include=['id'])
+        self.assertEqual('exec-1', execution.id)
+        self.assertIsNone(execution.parameters)
+
+    def test_put_conflict_and_not_found(self):
+        self.sm.put_execution('exec-1', self._execution('exec-1'))
+        self.assertRaises(manager_exceptions.ConflictError,
+                          self.sm.put_execution, 'exec-1',
+                          self._execution('exec-1'))
+        self.assertRaises(manager_exceptions.NotFoundError,
+                          self.sm.get_execution, 'exec-2')
+        self.assertRaises(manager_exceptions.NotFoundError,
+                          self.sm.update_execution_status, 'exec-2',
+                          'started', '')
+
+    def test_list_filters_sort_and_pagination(self):
+        self.sm.put_node_instances_bulk(
+            self._node_instance('node_{0}'.format(i),
+                                deployment_id='dep-{0}'.format(i % 2))
+            for i in range(10))
+        result = self.sm.get_node_instances(
+            filters={'deployment_id': ['dep-1']},
+            sort=OrderedDict([('id', 'desc')]),
+            pagination={'size': 2, 'offset': 1})
+        self.assertEqual(['node_7', 'node_5'],
+                         [instance.id for instance in result.items])
+        self.assertEqual({'total': 5, 'size': 2, 'offset': 1},
+                         result.metadata['pagination'])
+        self.assertEqual(5, self.sm.count(storage_manager.NODE_INSTANCE_TYPE,
+                                          {'deployment_id': 'dep-0'}))
+        self.assertFalse(self.sm.exists(storage_manager.NODE_INSTANCE_TYPE,
+                                        {'deployment_id': 'dep-2'}))
+        self.assertRaises(manager_exceptions.BadParametersError,
+                          self.sm.get_node_instances,
+                          sort={'no_such_field': 'asc'})
+
+    def test_node_instance_versions(self):
+        self.sm.put_node_instance(self._node_instance('node_1'))
+        self.assertEqual(1, self.sm.get_node_instance('node_1').version)
+        updated = self.sm.update_node_instance(
+            self._node_instance('node_1', state='started', version=1))
+        self.assertEqual(2, updated.version)
+        self.assertRaises(manager_exceptions.ConflictError,
+                          self.sm.update_node_instance,
+                          self._node_instance('node_1', state='deleted',
+                                              version=1))
+        version = self.sm.patch_node_instance('node_1', 0, {'a': 1})
+        self.assertEqual(3, version)
+        node_instance = self.sm.get_node_instance('node_1')
+        self.assertEqual('started', node_instance.state)
+        self.assertEqual({'a': 1}, node_instance.runtime_properties)
+
+    def test_update_node_instances(self):
+        self.sm.put_node_instances_bulk([self._node_instance('node_1'),
+                                         self._node_instance('node_2')])
+        results = self.sm.update_node_instances(
+            [self._node_instance('node_1', state='started', version=1),
+             self._node_instance('node_2', state='started', version=2),
+             self._node_instance('node_3', state='started', version=1)],
+            atomic=True)
+        self.assertEqual([manager_exceptions.UpdateNotAppliedError,
+                          manager_exceptions.ConflictError,
+                          manager_exceptions.NotFoundError],
+                         [type(result) for result in results])
+        self.assertEqual(1, self.sm.get_node_instance('node_1').version)
+
+        results = self.sm.update_node_instances(
+            [self._node_instance('node_1', state='started', version=1),
+             self._node_instance('node_2', state='started', version=2)])
+        self.assertEqual(2, results[0].version)
+        self.assertIsInstance(results[1], manager_exceptions.ConflictError)
+        self.assertEqual('started', self.sm.get_node_instance('node_1').state)
+        self.assertEqual('uninitialized',
+                         self.sm.get_node_instance('node_2').state)
+
+    def test_delete_deployment(self):
+        self.sm.put_deployment('dep-id', models.Deployment(
+            id='dep-id', blueprint_id='blueprint-id',
+            created_at='2015-11-01', updated_at='2015-11-01',
+            workflows={}, inputs={}, policy_types={}, policy_triggers={},
+            groups={}, outputs={}))
+        self.sm.put_execution('exec-1', self._execution('exec-1'))
+        self.sm.put_execution('exec-2', self._execution('exec-2',
+                                                        deployment_id='d2'))
+        self.sm.put_node_instance(self._node_instance('node_1'))
+
+        deployment = self.sm.delete_deployment('dep-id')
+        self.assertEqual('blueprint-id', deployment.blueprint_id)
+        self.assertEqual(['exec-2'], [execution.id for execution in
+                                      self.sm.executions_list().items])
+        self.assertEqual([], self.sm.get_node_instances().items)
+
+    def test_failed_transaction_is_rolled_back(self):
+        self.sm.put_node_instance(self._node_instance('node_1'))
+        try:
+            with self.sm._transaction() as connection:
+                connection.execute(
+                    'DELETE FROM {0}'.format(
+                        storage_manager.NODE_INSTANCE_TYPE))
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        self.assertEqual(1, self.sm.count(
+            storage_manager.NODE_INSTANCE_TYPE))
+
+    def test_replace_node_instances(self):
+        self.sm.put_node_instances_bulk([self._node_instance('node_1'),
+                                         self._node_instance('node_2'),
+                                         self._node_instance('other',
+                                                             'dep-2')])
+        created = self.sm.replace_node_instances(
+            'dep-id', [self._node_instance('node_1', state='started')])
+        self.assertEqual(1, created)
+        instances = self.sm.get_node_instances(
+            sort={'id': 'asc'}).items
+        self.assertEqual([('node_1', 'started'), ('other', 'uninitialized')],
+                         [(i.id, i.state) for i in instances])
+
+    def test_concurrent_reader(self):
+        self.sm.put_node_instance(self._node_instance('node_1'))
+        journal_mode = self.sm._connection.execute(
+            'PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual('wal', journal_mode)
+        results = []
+        with self.sm._transaction():
+            self.sm._connection.execute(
+                'DELETE FROM {0}'.format(storage_manager.NODE_INSTANCE_TYPE))
+            # a reader in another thread sees the last committed state
+            # while the write transaction is open
+            reader = threading.Thread(target=lambda: results.append(
+                self.sm.count(storage_manager.NODE_INSTANCE_TYPE)))
+            reader.start()
+            reader.join()
+        self.assertEqual([1], results)
+        self.assertEqual(0, self.sm.count(storage_manager.NODE_INSTANCE_TYPE))
@@ -0,0 +1,135 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+
+from mock import MagicMock, patch
+from nose.plugins.attrib import attr
+
+from manager_rest import compress_storage
+from manager_rest import models
+from manager_rest import storage_codec
+from manager_rest.file_storage_manager import FileStorageManager
+from manager_rest.storage_manager import BLUEPRINT_TYPE
+from manager_rest.test import base_test
+
+LARGE_PLAN = {'nodes': [{'id': 'node_{0}'.format(i),
+                         'properties': {'port': 8080}}
+                        for i in range(50)]}
+
+
+def _blueprint(blueprint_id, plan):
+    return models.BlueprintState(id=blueprint_id,
+                                 plan=plan,
+                                 description=None,
+                                 created_at='now',
+                                 updated_at='now',
+                                 main_file_name='blueprint.yaml')
+
+
+@attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
+class StorageCodecTestCase(base_test.BaseServerTestCase):
+
+    def setUp(self):
+        super(StorageCodecTestCase, self).setUp()
+        storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage_dir)
+        self.storage_path = os.path.join(storage_dir, 'storage.json')
+
+    def test_encode_decode(self):
+        encoded = storage_codec.encode(LARGE_PLAN)
+        self.assertTrue(storage_codec.is_encoded(encoded))
+        self.assertLess(len(encoded), len(json.dumps(LARGE_PLAN)))
+        self.assertEqual(LARGE_PLAN, storage_codec.decode(encoded))
+        # encoding is idempotent
+        self.assertEqual(encoded, storage_codec.encode(encoded))
+
+    def test_small_and_legacy_values_are_kept(self):
+        self.assertEqual({'a': 1}, storage_codec.encode({'a': 1}))
+        doc = {'id': 'bp', 'plan': LARGE_PLAN}
+        self.assertEqual(doc, storage_codec.decode_document(dict(doc)))
+
+    def test_encode_document(self):
+        doc = {'id': 'bp', 'description': 'x' * 1000, 'plan': LARGE_PLAN}
+        encoded = storage_codec.encode_document(BLUEPRINT_TYPE, doc)
+        self.assertTrue(storage_codec.is_encoded(encoded['plan']))
+        # only the designated fields are encoded, and on a copy
+        self.assertEqual(doc['description'], encoded['description'])
+        self.assertEqual(LARGE_PLAN, doc['plan'])
+        self.assertEqual(doc, storage_codec.decode_document(encoded))
+
+    def test_file_storage_stores_compressed_plans(self):
+        sm = FileStorageManager(self.storage_path)
+        sm.put_blueprint('bp', _blueprint('bp', LARGE_PLAN))
+        sm._compact()
+        with open(self.storage_path) as f:
+            stored = json.load(f)['blueprints']['bp']
+        self.assertTrue(storage_codec.is_encoded(stored['plan']))
+
+        sm = FileStorageManager(self.storage_path, recover=True)
+        self.assertEqual(LARGE_PLAN, sm.get_blueprint('bp').plan)
+        self.assertEqual(LARGE_PLAN, sm.blueprints_list().items[0].plan)
+        # plans which aren't included aren't decompressed
+        blueprint = sm.get_blueprint('bp', include=['id'])
+        self.assertIsNone(blueprint.plan)
+
+    def test_file_storage_migration(self):
+        with open(self.storage_path, 'w') as f:
+            json.dump({'blueprints': {
+                'bp': _blueprint('bp', LARGE_PLAN).to_dict()}}, f)
+
+        result = compress_storage.compress_file_storage(self.storage_path)
+        self.assertEqual(1, result['migrated'])
+        self.assertLess(result['size_after'], result['size_before'])
+        sm = FileStorageManager(self.storage_path, recover=True)
+        self.assertEqual(LARGE_PLAN, sm.get_blueprint('bp').plan)
+
+        result = compress_storage.compress_file_storage(self.storage_path)
+        self.assertEqual(0, result['migrated'])
+
+    def test_elasticsearch_migration_reports_failures(self):
+        client = MagicMock()
+        client.indices.stats.return_value = {'indices': {'storage': {
+            'primaries': {'store': {'size_in_bytes': 100}}}}}
+        hits = [{'_id': bp_id, '_version': 1,
+                 '_source': _blueprint(bp_id, LARGE_PLAN).to_dict()}
+                for bp_id in ('bp1', 'bp2', 'bp3')]
+        results = [
+            (True, {'index': {'_id': 'bp1', 'status': 200}}),
+            (False, {'index': {'_id': 'bp2', 'status': 409,
+                               'error': 'VersionConflictEngineException'}}),
+            (False, {'index': {'_id': 'bp3', 'status': 400,
+                               'error': 'MapperParsingException'}})]
+
+        def scroll(index, body, doc_type, connection):
+            return 0, hits if doc_type == BLUEPRINT_TYPE else []
+
+        def streaming_bulk(client, actions, **kwargs):
+            actions = list(actions)
+            return results if actions else []
+
+        with patch.object(compress_storage.ManagerElasticsearch, 'scroll',
+                          side_effect=scroll), \
+                patch('elasticsearch.helpers.streaming_bulk',
+                      side_effect=streaming_bulk):
+            result = compress_storage.compress_elasticsearch(client,
+                                                             'storage')
+        self.assertEqual(1, result['migrated'])
+        self.assertEqual(1, result['skipped'])
+        self.assertEqual(['blueprint bp3: MapperParsingException'],
+                         result['failed'])
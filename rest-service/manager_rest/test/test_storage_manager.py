@@ -17,10 +17,22 @@ from datetime import datetime
 
 from nose.plugins.attrib import attr
 
-from manager_rest import storage_manager, models
+from manager_rest import storage_manager, models, manager_exceptions
 from manager_rest.test import base_test
 
 
+def _node_instance(instance_id, deployment_id='dep-id', node_id='node',
+                   state='uninitialized'):
+    return models.DeploymentNodeInstance(id=instance_id,
+                                         node_id=node_id,
+                                         host_id=None,
+                                         relationships=[],
+                                         deployment_id=deployment_id,
+                                         state=state,
+                                         runtime_properties={},
+                                         version=None)
+
+
 @attr(client_min_version=1, client_max_version=base_test.LATEST_API_VERSION)
 class StorageManagerTests(base_test.BaseServerTestCase):
 
@@ -161,3 +173,55 @@ class StorageManagerTests(base_test.BaseServerTestCase):
         self.assertEquals(None, blueprint_restored.updated_at)
         self.assertEquals(None, blueprint_restored.plan)
         self.assertEquals(None, blueprint_restored.main_file_name)
+
+    def test_put_node_instances_bulk(self):
+        sm = storage_manager._get_instance()
+        self.assertEquals(2, sm.put_node_instances_bulk(
+            [_node_instance('node_1'), _node_instance('node_2')]))
+
+        with self.assertRaises(manager_exceptions.ConflictError) as cm:
+            sm.put_node_instances_bulk([_node_instance('node_2'),
+                                        _node_instance('node_3')])
+        self.assertIn('node_2', str(cm.exception))
+        self.assertNotIn('node_3', str(cm.exception))
+        # non conflicting node instances are created regardless
+        instances = sm.get_node_instances().items
+        self.assertEquals(['node_1', 'node_2', 'node_3'],
+                          sorted(instance.id for instance in instances))
+
+    def test_get_node_instances_by_ids(self):
+        sm = storage_manager._get_instance()
+        for instance_id in ['node_1', 'node_2', 'node_3']:
+            sm.put_node_instance(_node_instance(instance_id))
+        instances = sm.get_node_instances_by_ids(['node_3', 'node_1'])
+        self.assertEquals(['node_3', 'node_1'],
+                          [instance.id for instance in instances])
+        self.assertEquals([], sm.get_node_instances_by_ids([]))
+        with self.assertRaises(manager_exceptions.NotFoundError) as cm:
+            sm.get_node_instances_by_ids(['node_1', 'node_4'])
+        self.assertIn('node_4', str(cm.exception))
+
+    def test_count_and_exists(self):
+        sm = storage_manager._get_instance()
+        for instance_id, state in [('node_1', 'started'),
+                                   ('node_2', 'uninitialized'),
+                                   ('node_3', 'deleted')]:
+            sm.put_node_instance(_node_instance(instance_id, state=state))
+        node_instance_type = storage_manager.NODE_INSTANCE_TYPE
+        self.assertEquals(3, sm.count(node_instance_type))
+        self.assertEquals(3, sm.count(node_instance_type,
+                                      filters={'deployment_id': 'dep-id'}))
+        self.assertEquals(2, sm.count(
+            node_instance_type,
+            filters={'deployment_id': 'dep-id',
+                     'state': ['uninitialized', 'deleted']}))
+        self.assertEquals(1, sm.count(node_instance_type,
+                                      filters={'id': 'node_1'}))
+        # filter values are matched exactly
+        self.assertEquals(0, sm.count(node_instance_type,
+                                      filters={'deployment_id': 'dep'}))
+        self.assertTrue(sm.exists(node_instance_type,
+                                  filters={'state': 'started'}))
+        self.assertFalse(sm.exists(node_instance_type,
+                                   filters={'deployment_id': 'other-dep'}))
+        self.assertFalse(sm.exists(storage_manager.DEPLOYMENT_TYPE))
@@ -0,0 +1,77 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+from base_list_test import BaseListTest
+from nose.plugins.attrib import attr
+
+from manager_rest.test import base_test
+
+
+@attr(client_min_version=2,
+      client_max_version=base_test.LATEST_API_VERSION)
+class SummaryTestCase(BaseListTest):
+
+    def _summary(self, resource, target_fields, **filters):
+        query_params = dict(filters, _target_field=target_fields)
+        return self.get('/summary/{0}'.format(resource),
+                        query_params=query_params)
+
+    @staticmethod
+    def _sorted_items(response):
+        return sorted(response.json['items'],
+                      key=lambda item: sorted(item.items()))
+
+    def test_node_instances_per_deployment_and_node(self):
+        self._put_n_deployments(id_prefix='test', number_of_deployments=2)
+        response = self._summary('node_instances',
+                                 ['deployment_id', 'node_id'])
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(4, response.json['metadata']['pagination']['total'])
+        expected = [{'deployment_id': deployment_id,
+                     'node_id': node_id,
+                     'count': 1}
+                    for deployment_id in ['test0_deployment',
+                                          'test1_deployment']
+                    for node_id in ['http_web_server', 'vm']]
+        self.assertEqual(expected, self._sorted_items(response))
+
+    def test_summary_with_filters(self):
+        self._put_n_deployments(id_prefix='test', number_of_deployments=2)
+        response = self._summary('node_instances', ['state'],
+                                 deployment_id='test1_deployment')
+        self.assertEqual([{'state': 'uninitialized', 'count': 2}],
+                         response.json['items'])
+
+    def test_deployments_per_blueprint(self):
+        self._put_n_deployments(id_prefix='test', number_of_deployments=2)
+        response = self._summary('deployments', ['blueprint_id'])
+        self.assertEqual([{'blueprint_id': 'test0_blueprint', 'count': 1},
+                          {'blueprint_id': 'test1_blueprint', 'count': 1}],
+                         self._sorted_items(response))
+
+    def test_summary_of_unknown_resource(self):
+        response = self._summary('events', ['type'])
+        self.assertEqual(404, response.status_code)
+
+    def test_summary_with_unknown_fields(self):
+        response = self._summary('executions', ['no_such_field'])
+        self.assertEqual(400, response.status_code)
+        response = self._summary('executions', ['status'],
+                                 no_such_filter='value')
+        self.assertEqual(400, response.status_code)
+
+    def test_summary_without_target_fields(self):
+        response = self.get('/summary/executions')
+        self.assertEqual(400, response.status_code)
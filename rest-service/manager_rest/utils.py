@@ -130,3 +130,43 @@ def abort_error(error, logger, hide_server_message=False):
           message=str(error),
           error_code=error.error_code,
           server_traceback=s_traceback.getvalue())
+
+
+def merge_patch(target, patch):
+    """
+    Apply a JSON merge patch (RFC 7396) to a value, without modifying it.
+    Maps in the patch are merged recursively into the target, where null
+    values remove keys; any other patch value replaces the target.
+    """
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.iteritems():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def merge_patch_removes_keys(patch):
+    """
+    Check whether applying a JSON merge patch may remove keys, i.e. whether
+    it contains null values.
+    """
+    if not isinstance(patch, dict):
+        return False
+    return any(value is None or merge_patch_removes_keys(value)
+               for value in patch.itervalues())
+
+
+def copy_json(value):
+    """
+    Copy a json-like value. Only strings, numbers and json containers are
+    expected, which makes this much faster than copy.deepcopy
+    """
+    if isinstance(value, dict):
+        return {key: copy_json(val) for key, val in value.iteritems()}
+    if isinstance(value, list):
+        return [copy_json(val) for val in value]
+    return value
@@ -75,6 +75,16 @@ NODE_INSTANCE_SCHEMA = {
     }
 }
 
+SHARED_DOCUMENT_SCHEMA = {
+    'shared_document': {
+        'properties': {
+            'value': {
+                'enabled': False
+            }
+        }
+    }
+}
+
 
 SETTINGS = {
     "settings": {
@@ -120,6 +130,10 @@ def create_schema(storage_index_url):
                 storage_index_url), json.dumps(NODE_INSTANCE_SCHEMA))
             response.raise_for_status()
 
+            response = requests.put("{0}/shared_document/_mapping".format(
+                storage_index_url), json.dumps(SHARED_DOCUMENT_SCHEMA))
+            response.raise_for_status()
+
             print 'Done creating elasticsearch storage schema.'
             break
         except HTTPError:
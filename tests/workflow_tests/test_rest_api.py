@@ -139,8 +139,12 @@ class RestAPITest(TestCase):
         self.assertEqual(1, len(blueprints))
         blueprint_id = blueprints[0].id
         blueprint_by_id = self.client.blueprints.get(blueprint_id)
-        self.assertDictContainsSubset(blueprint_by_id, blueprints[0])
         self.assertDictContainsSubset(blueprints[0], blueprint_by_id)
+        # listings leave plans out unless they're included explicitly
+        self.assertNotIn('plan', blueprints[0])
+        blueprints = self.client.blueprints.list(
+            _include=list(blueprint_by_id))
+        self.assertDictContainsSubset(blueprint_by_id, blueprints[0])
 
     def test_deployments(self):
         self._create_basic_deployment()
@@ -15,6 +15,9 @@
 
 
 import json
+import zlib
+import base64
+import copy
 import tempfile
 import shutil
 import zipfile
@@ -58,6 +61,11 @@ _INFLUXDB_RESTORE_CMD = ('cat {0} | while read -r line; do curl -X POST '
                          'series?u=root&p=root" ;done')
 _STORAGE_INDEX_NAME = 'cloudify_storage'
 _EVENTS_INDEX_NAME = 'cloudify_events'
+# the manager stores large fields compressed, and fields copied from the
+# blueprint's plan as references to shared documents
+_SHARED_DOCUMENT_TYPE = 'shared_document'
+_SHARED_REFERENCE_KEY = 'shared_document_id'
+_CODEC_HEADER = '\x00zlib:'
 
 
 class _DictToAttributes(object):
@@ -331,9 +339,44 @@ def _dump_agents(tempdir):
         out.write(json.dumps(result))
 
 
-def _update_es_node(es_node):
+def _decode_stored_value(value):
+    if isinstance(value, basestring) and value.startswith(_CODEC_HEADER):
+        return json.loads(zlib.decompress(
+            base64.b64decode(value[len(_CODEC_HEADER):])))
+    return value
+
+
+def _load_shared_values(tempdir):
+    """
+    :return: a dict of the values of the snapshot's shared documents by id.
+    """
+    shared_values = {}
+    for line in open(os.path.join(tempdir, _ELASTICSEARCH), 'r'):
+        elem = json.loads(line)
+        if elem['_type'] == _SHARED_DOCUMENT_TYPE:
+            shared_values[elem['_id']] = _decode_stored_value(
+                elem['_source']['value'])
+    return shared_values
+
+
+def _stored_field(source, field, shared_values):
+    """
+    :return: a copy of the value of a stored document's field, decompressed
+     and with a reference to a shared document resolved, which can be
+     patched and stored back in place of the field.
+    """
+    value = _decode_stored_value(source[field])
+    if isinstance(value, dict) and value.keys() == [_SHARED_REFERENCE_KEY]:
+        value = shared_values[value[_SHARED_REFERENCE_KEY]]
+    return copy.deepcopy(value)
+
+
+def _update_es_node(es_node, shared_values):
+    # patched fields are stored back uncompressed and unshared, which the
+    # manager reads as they are
     if es_node['_type'] == 'deployment':
-        workflows = es_node['_source']['workflows']
+        source = es_node['_source']
+        workflows = _stored_field(source, 'workflows', shared_values)
         if 'install_new_agents' not in workflows:
             workflows['install_new_agents'] = {
                 'operation': 'cloudify.plugins.workflows.install_new_agents',
@@ -350,11 +393,12 @@ def _update_es_node(es_node):
                 },
                 'plugin': 'default_workflows'
             }
+            source['workflows'] = workflows
     if es_node['_type'] == 'node':
         source = es_node['_source']
         type_hierarchy = source.get('type_hierarchy', [])
         if COMPUTE_NODE_TYPE in type_hierarchy:
-            operations = source['operations']
+            operations = _stored_field(source, 'operations', shared_values)
             op_name = 'cloudify.interfaces.cloudify_agent.create_amqp'
             if op_name not in operations:
                 operations[op_name] = {
@@ -368,6 +412,7 @@ def _update_es_node(es_node):
                     'executor': 'central_deployment_agent',
                     'operation': 'cloudify_agent.operations.create_agent_amqp'
                 }
+                source['operations'] = operations
 
     if es_node['_type'] == 'blueprint':
         source = es_node['_source']
@@ -461,11 +506,13 @@ def _restore_elasticsearch(tempdir, es, metadata):
     has_cloudify_events_index = es.indices.exists(index=_EVENTS_INDEX_NAME)
     snap_has_cloudify_events_index = metadata[_M_HAS_CLOUDIFY_EVENTS]
 
+    shared_values = _load_shared_values(tempdir)
+
     # cloudify_events -> cloudify_events, logstash-* -> logstash-*
     def get_data_itr():
         for line in open(os.path.join(tempdir, _ELASTICSEARCH), 'r'):
             elem = json.loads(line)
-            _update_es_node(elem)
+            _update_es_node(elem, shared_values)
             yield elem
 
     _check_conflicts(es, get_data_itr())
@@ -0,0 +1,105 @@
+########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from cloudify.constants import COMPUTE_NODE_TYPE
+
+from manager_rest import shared_documents
+from manager_rest import storage_codec
+from manager_rest.storage_manager import (DEPLOYMENT_TYPE,
+                                          NODE_TYPE,
+                                          SHARED_DOCUMENT_TYPE)
+
+from cloudify_system_workflows import snapshot
+
+WORKFLOWS = {
+    'install': {'operation': 'cloudify.plugins.workflows.install',
+                'plugin': 'default_workflows',
+                'parameters': {'x': 'y' * 1000}},
+}
+
+OPERATIONS = {
+    'cloudify.interfaces.lifecycle.create': {
+        'operation': 'vm.create',
+        'plugin': 'vm',
+        'inputs': {'x': 'y' * 1000}},
+}
+
+
+class SnapshotRestoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+
+    def _dump(self, doc_type, doc_id, source):
+        """Dump a document in the form the manager's storage writes it,
+        along with the shared documents it references"""
+        source, shared = shared_documents.share_document(doc_type, source)
+        elems = [{'_index': snapshot._STORAGE_INDEX_NAME,
+                  '_type': SHARED_DOCUMENT_TYPE,
+                  '_id': shared_id,
+                  '_source': {'id': shared_id,
+                              'value': storage_codec.encode(value)}}
+                 for shared_id, value in shared.iteritems()]
+        elems.append({'_index': snapshot._STORAGE_INDEX_NAME,
+                      '_type': doc_type,
+                      '_id': doc_id,
+                      '_source': storage_codec.encode_document(doc_type,
+                                                               source)})
+        with open(os.path.join(self.tempdir, snapshot._ELASTICSEARCH),
+                  'a') as f:
+            for elem in elems:
+                f.write(json.dumps(elem) + '\n')
+        return elems[-1]
+
+    def _restore(self, elem):
+        snapshot._update_es_node(elem,
+                                 snapshot._load_shared_values(self.tempdir))
+        return elem['_source']
+
+    def test_deployment_with_shared_workflows(self):
+        elem = self._dump(DEPLOYMENT_TYPE, 'd1',
+                          {'id': 'd1', 'workflows': WORKFLOWS})
+        self.assertTrue(shared_documents.is_reference(
+            elem['_source']['workflows']))
+
+        workflows = self._restore(elem)['workflows']
+        self.assertIn('install_new_agents', workflows)
+        self.assertEqual(WORKFLOWS['install'], workflows['install'])
+
+    def test_compute_node_with_shared_operations(self):
+        elem = self._dump(NODE_TYPE, 'd1_vm',
+                          {'id': 'vm',
+                           'type_hierarchy': [COMPUTE_NODE_TYPE],
+                           'operations': OPERATIONS})
+
+        operations = self._restore(elem)['operations']
+        self.assertIn('cloudify.interfaces.cloudify_agent.create_amqp',
+                      operations)
+        self.assertEqual(OPERATIONS['cloudify.interfaces.lifecycle.create'],
+                         operations['cloudify.interfaces.lifecycle.create'])
+
+    def test_unpatched_fields_are_kept(self):
+        workflows = dict(WORKFLOWS, install_new_agents={})
+        elem = self._dump(DEPLOYMENT_TYPE, 'd1',
+                          {'id': 'd1', 'workflows': workflows})
+        stored = elem['_source']['workflows']
+        self.assertEqual(stored, self._restore(elem)['workflows'])